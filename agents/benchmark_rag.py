@@ -0,0 +1,91 @@
+import os
+import sys
+
+# Add current directory to path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(current_dir)
+
+import time
+import argparse
+import asyncio
+import statistics
+from typing import Dict, List
+
+from db import ShipmentDB, close_pool
+from rag_manager import search_embeddings
+
+# Recall-vs-latency benchmark for knowledge_base retrieval.
+# Uses stored embeddings as queries, takes exact (sequential scan) top-k as
+# ground truth and reports recall@k and latency for each ANN setting.
+#
+#   python benchmark_rag.py --queries 100 --k 10 --ef-search 10,20,40,80,160
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+async def timed_search(conn, embedding, k, **params):
+    started = time.perf_counter()
+    rows = await search_embeddings(conn, embedding, k, **params)
+    return {row["id"] for row in rows}, (time.perf_counter() - started) * 1000
+
+async def run_setting(conn, queries, truth, k, **params) -> Dict[str, float]:
+    recalls, latencies = [], []
+    for embedding, expected in zip(queries, truth):
+        found, ms = await timed_search(conn, embedding, k, **params)
+        recalls.append(len(found & expected) / max(1, len(expected)))
+        latencies.append(ms)
+    return {
+        "recall": statistics.mean(recalls),
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+    }
+
+async def benchmark(n_queries: int, k: int, ef_values: List[int], probe_values: List[int]):
+    db = ShipmentDB()
+    async with db.connection() as conn:
+        total = await conn.fetchval("SELECT count(*) FROM knowledge_base WHERE embedding IS NOT NULL")
+        queries = [row["embedding"] for row in await conn.fetch(
+            "SELECT embedding FROM knowledge_base WHERE embedding IS NOT NULL ORDER BY random() LIMIT $1", n_queries
+        )]
+        if not queries:
+            print("knowledge_base is empty; seed it first")
+            return
+
+        truth, exact_ms = [], []
+        for embedding in queries:
+            found, ms = await timed_search(conn, embedding, k, exact=True)
+            truth.append(found)
+            exact_ms.append(ms)
+
+        print(f"{total} rows, {len(queries)} queries, k={k}")
+        print(f"{'setting':<18}{'recall@k':>10}{'p50 ms':>10}{'p95 ms':>10}")
+        print(f"{'exact':<18}{1.0:>10.3f}{percentile(exact_ms, 50):>10.2f}{percentile(exact_ms, 95):>10.2f}")
+
+        for ef in ef_values:
+            result = await run_setting(conn, queries, truth, k, ef_search=ef)
+            print(f"{f'ef_search={ef}':<18}{result['recall']:>10.3f}{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}")
+        for probes in probe_values:
+            result = await run_setting(conn, queries, truth, k, probes=probes)
+            print(f"{f'probes={probes}':<18}{result['recall']:>10.3f}{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}")
+
+def int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="knowledge_base ANN recall vs latency")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--ef-search", type=int_list, default=[10, 20, 40, 80, 160],
+                        help="HNSW ef_search values to try")
+    parser.add_argument("--probes", type=int_list, default=[],
+                        help="IVFFlat probes values to try (when RAG_ANN_INDEX=ivfflat)")
+    args = parser.parse_args()
+
+    async def main():
+        try:
+            await benchmark(args.queries, args.k, args.ef_search, args.probes)
+        finally:
+            await close_pool()
+
+    asyncio.run(main())
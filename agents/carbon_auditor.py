@@ -8,24 +8,31 @@ sys.path.append(current_dir)
 import json
 import asyncio
 import redis
+from datetime import date
+from typing import Any
 from dotenv import load_dotenv
 from smolagents import CodeAgent, InferenceClientModel
 
 from rag_manager import RAGManager
 from tools.carbon_tool import CarbonTool
-from db import ShipmentDB
+from db import ShipmentDB, close_pool
 from utils.logger import get_logger
+from utils.task_queue import TaskQueue
+from utils.agent_pool import AgentPool
+from utils.llm_cache import AgentResultCache
+from utils.redis_client import get_redis, close_redis
 
 load_dotenv()
 logger = get_logger("CarbonAuditor")
 
 class CarbonAuditor:
     def __init__(self):
-        # Redis
-        redis_host = os.getenv("REDIS_HOST", "localhost")
-        redis_port = os.getenv("REDIS_PORT", "6379")
-        self.redis_client = redis.Redis(host=redis_host, port=int(redis_port), decode_responses=True)
-        self.task_queue = "agent:task:carbon_audit" # Triggered by Route Planner or Orchestrator
+        # Redis (shared async pool; queue waits don't block the event loop)
+        self.redis_client = get_redis()
+        # Audits run one at a time: the timeout bounds each task so a batch
+        # read never outlives the queue's claim window
+        self.task_timeout = float(os.getenv("CARBON_AUDITOR_TASK_TIMEOUT", "120"))
+        self.tasks = TaskQueue(self.redis_client, "carbon_audit", task_timeout_s=self.task_timeout) # Triggered by Route Planner or Orchestrator
         
         # Components
         self.db = ShipmentDB()
@@ -35,27 +42,39 @@ class CarbonAuditor:
         # Model
         model_id = os.getenv("CARBON_AUDITOR_MODEL", "Qwen/Qwen2.5-Math-7B-Instruct")
         self.model = InferenceClientModel(model_id=model_id)
+        self.llm_cache = AgentResultCache("carbon_auditor", model=model_id)
         
         # Tools list for Agent
         self.tools = [self.carbon_tool]
         
-        self.agent = CodeAgent(
+        # Single agent on its own executor: a timed-out run is interrupted and
+        # the agent replaced, so a retry never shares it with the abandoned thread
+        self.agents = AgentPool(self._build_agent, size=1, name="carbon-auditor")
+        
+        self.running = True
+
+    def _build_agent(self) -> CodeAgent:
+        return CodeAgent(
             tools=self.tools,
             model=self.model,
             max_steps=5
         )
-        
-        self.running = True
 
     async def run(self):
-        logger.info(f"Carbon Auditor started. Listening on {self.task_queue}...")
+        logger.info(f"Carbon Auditor started. Listening on {self.tasks.key} ({self.tasks.mode})...")
+        # Compliance lookups are cached; drop them when the knowledge base changes
+        await self.rag.start_change_listener()
         while self.running:
             try:
-                task_data = self.redis_client.blpop(self.task_queue, timeout=5)
-                if task_data:
-                    queue, payload = task_data
-                    logger.info(f"Received audit task: {payload}")
-                    await self.audit_route_options(json.loads(payload))
+                for task in await self.tasks.read():
+                    logger.info(f"Received audit task: {task.data}")
+                    try:
+                        await self.audit_route_options(task.data)
+                    except asyncio.TimeoutError:
+                        # Left pending: reclaimed and retried (or dead-lettered) later
+                        logger.error(f"Audit timed out after {self.task_timeout}s, leaving task {task.id} for retry")
+                        continue
+                    await self.tasks.ack(task.id)
             except redis.exceptions.ConnectionError:
                 await asyncio.sleep(5)
             except Exception as e:
@@ -82,7 +101,14 @@ class CarbonAuditor:
         # 1. Retrieve Compliance Info
         # Query generic rules + specific destination rules (if we knew destination)
         # Assuming destination is in options or shipment ID lookup
-        compliance_docs = await self.rag.query_knowledge("EU ETS shipping emissions caps 2025")
+        # Hybrid retrieval keeps regulation ids exact; filters run in SQL, so a
+        # small top-k still returns only rules in force (and in scope)
+        jurisdictions = [j.strip() for j in os.getenv("AUDIT_JURISDICTIONS", "").split(",") if j.strip()]
+        compliance_docs = await self.rag.query_knowledge(
+            "EU ETS shipping emissions caps 2025 Directive 2023/959",
+            limit=int(os.getenv("AUDIT_COMPLIANCE_TOP_K", "3")),
+            filters={"as_of": date.today(), "jurisdiction": jurisdictions or None}
+        )
         compliance_context = "\n".join([f"- {doc['content']} (Source: {doc['source']})" for doc in compliance_docs])
         
         prompt = f"""
@@ -101,63 +127,80 @@ class CarbonAuditor:
         3. Recommend the most sustainable compliant route.
         
         Output JSON:
-        {
+        {{
             "audit_id": "AUDIT_1",
             "compliance_status": "COMPLIANT", // or NON_COMPLIANT
             "total_emissions_kg": 15000.5,
             "recommended_route": "Route Name",
             "details": "..."
-        }
+        }}
         """
         
+        # Same options audited against the same rules give the same report
+        inputs = {
+            "route_options": options,
+            "compliance_docs": [(doc['content'], doc['source']) for doc in compliance_docs],
+        }
+
         try:
-            # Run Agent
-            # CodeAgent run is sync
-            loop = asyncio.get_event_loop()
-            result = await loop.run_in_executor(None, self.agent.run, prompt)
-            
-            logger.info(f"Audit Result (Raw): {result}")
-            
-            # Simple parsing if string
-            if isinstance(result, str):
-                try:
-                    import re
-                    match = re.search(r'\{.*\}', result, re.DOTALL)
-                    if match:
-                        result = json.loads(match.group())
-                except:
-                    pass
+            result = await self.llm_cache.get(inputs, bypass=bool(task.get("no_cache")))
+            if result is None:
+                # Run Agent on the pool's executor (bounded by task_timeout)
+                result = await self.agents.run(prompt, timeout=self.task_timeout)
+
+                logger.info(f"Audit Result (Raw): {result}")
+
+                # Simple parsing if string
+                if isinstance(result, str):
+                    try:
+                        import re
+                        match = re.search(r'\{.*\}', result, re.DOTALL)
+                        if match:
+                            result = json.loads(match.group())
+                    except:
+                        pass
+
+                if isinstance(result, dict):
+                    await self.llm_cache.set(inputs, result)
 
             # Save to Audit Reports DB
             await self.save_audit_report(shipment_id, result)
             
+        except asyncio.TimeoutError:
+            raise
         except Exception as e:
             logger.error(f"Audit failed: {e}")
 
     async def save_audit_report(self, shipment_id: str, report: Any):
-        conn = await asyncpg.connect(self.db.dsn)
-        try:
-            compliance = "UNKNOWN"
-            emissions = 0.0
-            
-            if isinstance(report, dict):
-                compliance = report.get("compliance_status", "UNKNOWN")
-                # Handle boolean old format if present
-                if report.get("compliant") is True: compliance = "COMPLIANT"
-                elif report.get("compliant") is False: compliance = "NON_COMPLIANT"
-                
-                emissions = float(report.get("total_emissions_kg", 0.0))
-                audit_details_json = json.dumps(report)
-            else:
-                 audit_details_json = json.dumps({"raw_output": str(report)})
-                 
+        compliance = "UNKNOWN"
+        emissions = 0.0
+
+        if isinstance(report, dict):
+            compliance = report.get("compliance_status", "UNKNOWN")
+            # Handle boolean old format if present
+            if report.get("compliant") is True: compliance = "COMPLIANT"
+            elif report.get("compliant") is False: compliance = "NON_COMPLIANT"
+
+            emissions = float(report.get("total_emissions_kg", 0.0))
+            audit_details_json = json.dumps(report)
+        else:
+             audit_details_json = json.dumps({"raw_output": str(report)})
+
+        async with self.db.connection() as conn:
             await conn.execute("""
                 INSERT INTO audit_reports (shipment_id, total_emissions_kg, compliance_status, audit_details)
                 VALUES ($1, $2, $3, $4)
             """, shipment_id, emissions, compliance, audit_details_json)
-        finally:
-            await conn.close()
 
-if __name__ == "__main__":
+async def main():
     auditor = CarbonAuditor()
-    asyncio.run(auditor.run())
+    try:
+        await auditor.run()
+    finally:
+        auditor.agents.shutdown()
+        await auditor.rag.stop_change_listener()
+        await close_redis()
+        await close_pool()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,134 @@
+import os
+import time
+from typing import Any, Dict, List, Optional, Set
+
+from utils.geo import haversine_km, record_position
+from utils.logger import get_logger
+
+logger = get_logger("ChangeTracker")
+
+class ShipmentChangeTracker:
+    """
+    Remembers what each shipment looked like when it was last evaluated,
+    so a sweep only re-scans shipments whose inputs actually changed.
+
+    A shipment is due for re-evaluation when:
+    - it has never been scanned (or was dropped and came back)
+    - it moved more than `move_threshold_km`
+    - its ETA changed
+    - a disruption was logged within `disruption_radius_km` since the last sweep
+    - its weather risk level changed (when the sweep attaches `weather_risk`)
+    - `max_staleness_s` elapsed since its last scan
+    """
+    def __init__(self,
+                 move_threshold_km: Optional[float] = None,
+                 disruption_radius_km: Optional[float] = None,
+                 max_staleness_s: Optional[float] = None):
+        self.move_threshold_km = move_threshold_km if move_threshold_km is not None else \
+            float(os.getenv("RISK_SCOUT_MOVE_THRESHOLD_KM", "50"))
+        self.disruption_radius_km = disruption_radius_km if disruption_radius_km is not None else \
+            float(os.getenv("RISK_SCOUT_DISRUPTION_RADIUS_KM", "500"))
+        self.max_staleness_s = max_staleness_s if max_staleness_s is not None else \
+            float(os.getenv("RISK_SCOUT_MAX_STALENESS_S", str(6 * 3600)))
+
+        # shipment_id -> fingerprint at last successful scan
+        self._fingerprints: Dict[str, Dict[str, Any]] = {}
+        # created_at of the newest disruption already accounted for
+        self.disruption_cursor = None
+        # Flagged by a disruption but not yet successfully scanned; kept until
+        # record() so a failed scan doesn't lose the trigger once the cursor moves
+        self._near_disruption: Set[str] = set()
+
+    def _fingerprint(self, shipment: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "position": record_position(shipment),
+            "eta": shipment.get("eta"),
+            "weather_risk": shipment.get("weather_risk"),
+            "scanned_at": time.time()
+        }
+
+    def record(self, shipment: Dict[str, Any]):
+        """Remember the inputs a successful scan was based on"""
+        shipment_id = str(shipment["id"])
+        self._fingerprints[shipment_id] = self._fingerprint(shipment)
+        self._near_disruption.discard(shipment_id)
+
+    def near_disruption(self, shipment_id: Any) -> bool:
+        """Flagged by a disruption and not successfully scanned since"""
+        return str(shipment_id) in self._near_disruption
+
+    def change_reason(self, shipment: Dict[str, Any], near_disruption: Set[str] = frozenset(),
+                      now: Optional[float] = None) -> Optional[str]:
+        """Why `shipment` needs a re-scan, or None if nothing changed"""
+        shipment_id = str(shipment["id"])
+        previous = self._fingerprints.get(shipment_id)
+        if previous is None:
+            return "new"
+
+        now = now if now is not None else time.time()
+        if now - previous["scanned_at"] >= self.max_staleness_s:
+            return "stale"
+
+        if shipment_id in near_disruption:
+            return "disruption_nearby"
+
+        if shipment.get("eta") != previous["eta"]:
+            return "eta_changed"
+
+        position = record_position(shipment)
+        if position != previous["position"]:
+            if position is None or previous["position"] is None:
+                return "moved"
+            if haversine_km(*position, *previous["position"]) > self.move_threshold_km:
+                return "moved"
+
+        weather = shipment.get("weather_risk")
+        if weather is not None and previous["weather_risk"] is not None and weather != previous["weather_risk"]:
+            return "weather_changed"
+
+        return None
+
+    def _near_disruptions(self, shipments: List[Dict[str, Any]], disruptions: List[Dict[str, Any]]) -> Set[str]:
+        flagged = set()
+        if not disruptions:
+            return flagged
+
+        for shipment in shipments:
+            position = record_position(shipment)
+            if position is None:
+                continue
+            for event in disruptions:
+                if event.get("lat") is None or event.get("lon") is None:
+                    continue
+                if haversine_km(position[0], position[1], event["lat"], event["lon"]) <= self.disruption_radius_km:
+                    flagged.add(str(shipment["id"]))
+                    break
+        return flagged
+
+    def select_due(self, shipments: List[Dict[str, Any]], disruptions: List[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Filter `shipments` down to those needing a re-scan, and advance the disruption cursor"""
+        disruptions = disruptions or []
+        self._near_disruption |= self._near_disruptions(shipments, disruptions)
+
+        created = [event["created_at"] for event in disruptions if event.get("created_at") is not None]
+        if created:
+            self.disruption_cursor = max([self.disruption_cursor, *created]) if self.disruption_cursor else max(created)
+
+        # Forget shipments that left the active set (arrived, diverted...)
+        active_ids = {str(s["id"]) for s in shipments}
+        for shipment_id in list(self._fingerprints):
+            if shipment_id not in active_ids:
+                del self._fingerprints[shipment_id]
+        self._near_disruption &= active_ids
+
+        now = time.time()
+        due = []
+        reasons: Dict[str, int] = {}
+        for shipment in shipments:
+            reason = self.change_reason(shipment, self._near_disruption, now)
+            if reason:
+                due.append(shipment)
+                reasons[reason] = reasons.get(reason, 0) + 1
+
+        logger.info(f"{len(due)}/{len(shipments)} shipments due for re-scan {reasons}")
+        return due
@@ -1,43 +1,195 @@
 import os
+import json
+import uuid
+import asyncio
 import asyncpg
-from typing import List, Dict, Any
+from datetime import datetime
+from contextlib import asynccontextmanager
+from typing import List, Dict, Any, Optional, Tuple
 from dotenv import load_dotenv
+from models import ShipmentRecord
+from utils.logger import get_logger
 
 load_dotenv()
 
+logger = get_logger("ShipmentDB")
+
+# Process-wide connection pools, keyed by DSN.
+# Every agent in the process shares the same pool instead of opening
+# a new connection (TCP + auth handshake) per query.
+_pools: Dict[str, asyncpg.Pool] = {}
+_pool_lock: Optional[asyncio.Lock] = None
+
+
+def build_dsn() -> str:
+    user = os.getenv("DB_USER", "postgres")
+    password = os.getenv("DB_PASSWORD", "postgres")
+    host = os.getenv("DB_HOST", "localhost")
+    port = os.getenv("DB_PORT", "5432")
+    db_name = os.getenv("DB_NAME", "ecologistix")
+
+    return f"postgresql://{user}:{password}@{host}:{port}/{db_name}"
+
+
+async def _init_connection(conn: asyncpg.Connection):
+    """Per-connection init hook, runs once when the pool opens a connection"""
+    try:
+        # Register pgvector codec once per connection rather than per query
+        from pgvector.asyncpg import register_vector
+        await register_vector(conn)
+    except Exception as e:
+        # Extension may be missing on DBs that only hold shipment data
+        logger.warning(f"pgvector codec not registered: {e}")
+
+
+async def get_pool(dsn: Optional[str] = None) -> asyncpg.Pool:
+    """Return the shared pool for `dsn`, creating it on first use"""
+    global _pool_lock
+    dsn = dsn or build_dsn()
+
+    pool = _pools.get(dsn)
+    if pool is not None:
+        return pool
+
+    if _pool_lock is None:
+        _pool_lock = asyncio.Lock()
+
+    async with _pool_lock:
+        # Re-check: another task may have created it while we waited
+        pool = _pools.get(dsn)
+        if pool is None:
+            pool = await asyncpg.create_pool(
+                dsn,
+                min_size=int(os.getenv("DB_POOL_MIN_SIZE", "2")),
+                max_size=int(os.getenv("DB_POOL_MAX_SIZE", "10")),
+                max_inactive_connection_lifetime=float(os.getenv("DB_POOL_MAX_IDLE_SECONDS", "300")),
+                statement_cache_size=int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100")),
+                init=_init_connection,
+            )
+            _pools[dsn] = pool
+            logger.info(f"Opened DB pool (min={pool.get_min_size()}, max={pool.get_max_size()})")
+        return pool
+
+
+async def close_pool(timeout: Optional[float] = None):
+    """Gracefully drain and close all pools (call on shutdown)"""
+    if timeout is None:
+        timeout = float(os.getenv("DB_POOL_CLOSE_TIMEOUT", "10"))
+
+    while _pools:
+        dsn, pool = _pools.popitem()
+        try:
+            # Waits for acquired connections to be released
+            await asyncio.wait_for(pool.close(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"DB pool did not drain within {timeout}s, terminating")
+            pool.terminate()
+    logger.info("DB pools closed")
+
+
+# Selectable shipment columns -> SQL expression.
+# Keeps caller-chosen column lists out of the SQL text.
+SHIPMENT_COLUMNS = {
+    "id": "id",
+    "vessel_name": "vessel_name",
+    "vessel_type": "vessel_type",
+    "mmsi": "mmsi",
+    # Position as native float8 (no WKT round trip through text)
+    "lat": "ST_Y(current_location)",
+    "lon": "ST_X(current_location)",
+    "current_speed": "current_speed",
+    "current_heading": "current_heading",
+    "cargo_type": "cargo_type",
+    "cargo_weight_metric_tons": "cargo_weight_metric_tons",
+    "status": "status",
+    "origin_port": "origin_port",
+    "destination_port": "destination_port",
+    "eta": "eta",
+    "risk_score": "risk_score",
+    "risk_factors": "risk_factors",
+    "owner_company": "owner_company",
+    "last_updated": "last_updated",
+}
+DEFAULT_SHIPMENT_COLUMNS = ["id", "vessel_name", "lat", "lon", "origin_port", "destination_port", "eta"]
+
+
+def _select_list(columns: Optional[List[str]]) -> str:
+    columns = columns or DEFAULT_SHIPMENT_COLUMNS
+    unknown = [c for c in columns if c not in SHIPMENT_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown shipment columns: {unknown}")
+    # Always include id so results can be matched back to requests
+    if "id" not in columns:
+        columns = ["id", *columns]
+    return ", ".join(c if SHIPMENT_COLUMNS[c] == c else f"{SHIPMENT_COLUMNS[c]} AS {c}" for c in columns)
+
+
+def _valid_ids(shipment_ids) -> List[str]:
+    """Drop IDs that aren't UUIDs (they can't match, and would fail the uuid cast)"""
+    valid = []
+    for shipment_id in shipment_ids:
+        try:
+            uuid.UUID(str(shipment_id))
+        except ValueError:
+            continue
+        valid.append(shipment_id)
+    return valid
+
+
 class ShipmentDB:
-    def __init__(self):
-        user = os.getenv("DB_USER", "postgres")
-        password = os.getenv("DB_PASSWORD", "postgres")
-        host = os.getenv("DB_HOST", "localhost")
-        port = os.getenv("DB_PORT", "5432")
-        db_name = os.getenv("DB_NAME", "ecologistix")
-        
-        self.dsn = f"postgresql://{user}:{password}@{host}:{port}/{db_name}"
-    
-    async def get_active_shipments(self) -> List[Dict[str, Any]]:
+    def __init__(self, dsn: Optional[str] = None):
+        self.dsn = dsn or build_dsn()
+
+    @asynccontextmanager
+    async def connection(self):
+        """Borrow a connection from the shared pool"""
+        pool = await get_pool(self.dsn)
+        async with pool.acquire() as conn:
+            yield conn
+
+    async def get_active_shipments(self, columns: Optional[List[str]] = None) -> List[ShipmentRecord]:
         """Fetch all shipments with status ON_TRACK or AT_RISK"""
-        conn = await asyncpg.connect(self.dsn)
-        try:
-            # Fetch shipments that haven't been updated in the last hour? 
+        async with self.connection() as conn:
+            # Fetch shipments that haven't been updated in the last hour?
             # Or just all active ones for the continuous loop.
-            # Providing basic fields needed for risk analysis.
-            rows = await conn.fetch("""
-                SELECT id, vessel_name, ST_AsText(current_location) as current_location_wkt, 
-                       origin_port, destination_port, eta
+            # Defaults to the basic fields needed for risk analysis.
+            rows = await conn.fetch(f"""
+                SELECT {_select_list(columns)}
                 FROM active_shipments
                 WHERE status IN ('ON_TRACK', 'AT_RISK')
             """)
             return [dict(row) for row in rows]
-        finally:
-            await conn.close()
-    
+
+    async def get_shipment(self, shipment_id: str, columns: Optional[List[str]] = None) -> Optional[ShipmentRecord]:
+        """Fetch one shipment by primary key (any status), or None"""
+        if not _valid_ids([shipment_id]):
+            return None
+        async with self.connection() as conn:
+            row = await conn.fetchrow(f"""
+                SELECT {_select_list(columns)}
+                FROM active_shipments
+                WHERE id = $1
+            """, shipment_id)
+            return dict(row) if row else None
+
+    async def get_shipments(self, shipment_ids: List[str], columns: Optional[List[str]] = None) -> List[ShipmentRecord]:
+        """Fetch several shipments by primary key in one round trip (missing IDs are skipped)"""
+        shipment_ids = _valid_ids(shipment_ids)
+        if not shipment_ids:
+            return []
+        async with self.connection() as conn:
+            rows = await conn.fetch(f"""
+                SELECT {_select_list(columns)}
+                FROM active_shipments
+                WHERE id = ANY($1::uuid[])
+            """, list(shipment_ids))
+            return [dict(row) for row in rows]
+
     async def update_shipment_risk(self, shipment_id: str, risk_score: float, risk_factors: List[str]):
         """Update shipment risk assessment"""
-        conn = await asyncpg.connect(self.dsn)
-        try:
+        async with self.connection() as conn:
             new_status = 'AT_RISK' if risk_score > 0.7 else 'ON_TRACK'
-            
+
             await conn.execute("""
                 UPDATE active_shipments
                 SET risk_score = $1,
@@ -46,47 +198,127 @@ class ShipmentDB:
                     last_updated = NOW()
                 WHERE id = $4
             """, risk_score, risk_factors, new_status, shipment_id)
-        finally:
-            await conn.close()
-            
-    async def log_disruption(self, event_data: Dict[str, Any]):
-        """Log a new disruption event"""
-        conn = await asyncpg.connect(self.dsn)
-        try:
+
+    async def update_shipment_risks(self, updates: List[Tuple[str, float, List[str]]]):
+        """
+        Apply many (shipment_id, risk_score, risk_factors) assessments in one
+        set-based statement / round trip. Later entries win for duplicate IDs.
+        """
+        latest = {str(shipment_id): (score, factors) for shipment_id, score, factors in updates}
+        if not latest:
+            return
+
+        ids = list(latest)
+        scores = [float(latest[i][0]) for i in ids]
+        # text[] can't be unnested row-by-row, so factors travel as JSON arrays
+        factors = [json.dumps(list(latest[i][1] or [])) for i in ids]
+
+        async with self.connection() as conn:
             await conn.execute("""
+                UPDATE active_shipments AS s
+                SET risk_score = u.risk_score,
+                    risk_factors = ARRAY(SELECT jsonb_array_elements_text(u.risk_factors)),
+                    status = (CASE WHEN u.risk_score > 0.7 THEN 'AT_RISK' ELSE 'ON_TRACK' END)::shipment_status,
+                    last_updated = NOW()
+                FROM unnest($1::uuid[], $2::float8[], $3::jsonb[]) AS u(id, risk_score, risk_factors)
+                WHERE s.id = u.id
+            """, ids, scores, factors)
+
+    async def find_shipments_near(self, area_wkt: str, radius_km: float = 0.0, include_planned_route: bool = True,
+                                  columns: Optional[List[str]] = None) -> List[ShipmentRecord]:
+        """
+        Active shipments within `radius_km` of a WKT geometry (point or polygon;
+        radius 0 means inside/touching), or whose planned route passes that close.
+        Distances are on the geography type, so the radius is true metres on the
+        sphere; the ::geography expression GiST indexes make this an index scan.
+        """
+        async with self.connection() as conn:
+            return await self._find_shipments_near(conn, area_wkt, radius_km, include_planned_route, columns)
+
+    async def _find_shipments_near(self, conn, area_wkt, radius_km, include_planned_route, columns):
+        rows = await conn.fetch(f"""
+            SELECT {_select_list(columns)}
+            FROM active_shipments
+            WHERE status IN ('ON_TRACK', 'AT_RISK')
+              AND (
+                ST_DWithin(current_location::geography, ST_GeomFromText($1, 4326)::geography, $2)
+                OR ($3 AND ST_DWithin(planned_route::geography, ST_GeomFromText($1, 4326)::geography, $2))
+              )
+        """, area_wkt, float(radius_km) * 1000.0, include_planned_route)
+        return [dict(row) for row in rows]
+
+    async def log_disruption(self, event_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Log a new disruption event. Unless the caller supplies `affected_shipments`,
+        they are resolved spatially from the event location and `radius_km`.
+        Returns the new event's id and affected shipment IDs.
+        """
+        location_wkt = event_data.get('location_wkt', 'POINT(0 0)') # Default if missing
+        radius_km = event_data.get('radius_km', float(os.getenv("DISRUPTION_IMPACT_RADIUS_KM", "500")))
+
+        async with self.connection() as conn:
+            affected = event_data.get('affected_shipments')
+            if affected is None and 'location_wkt' in event_data:
+                nearby = await self._find_shipments_near(conn, location_wkt, radius_km, True, ["id"])
+                affected = [row['id'] for row in nearby]
+
+            event_id = await conn.fetchval("""
                 INSERT INTO disruption_events (
-                    id, event_type, severity, location, description, 
+                    id, event_type, severity, location, description,
                     affected_shipments, data_source, detected_at
                 ) VALUES (
-                    gen_random_uuid(), $1, $2, ST_GeomFromText($3, 4326), $4, 
+                    gen_random_uuid(), $1, $2, ST_GeomFromText($3, 4326), $4,
                     $5, $6, NOW()
                 )
-            """, 
+                RETURNING id
+            """,
             event_data['event_type'],
             event_data['severity'],
-            event_data.get('location_wkt', 'POINT(0 0)'), # Default if missing
+            location_wkt,
             event_data['description'],
-            event_data.get('affected_shipments', []),
+            affected or [],
             event_data['data_source']
             )
-        finally:
-            await conn.close()
+
+        logger.info(f"Logged disruption {event_id} affecting {len(affected or [])} shipments")
+        return {"id": event_id, "affected_shipments": affected or []}
+
+    async def get_open_disruptions(self) -> List[Dict[str, Any]]:
+        """Fetch all unresolved disruption events with their coordinates"""
+        async with self.connection() as conn:
+            rows = await conn.fetch("""
+                SELECT id, event_type, severity, ST_Y(location) as lat, ST_X(location) as lon, created_at
+                FROM disruption_events
+                WHERE resolved_at IS NULL
+            """)
+            return [dict(row) for row in rows]
+
+    async def get_disruptions_since(self, since: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """Fetch disruptions created after `since` (all unresolved ones if None)"""
+        if since is None:
+            return await self.get_open_disruptions()
+
+        async with self.connection() as conn:
+            rows = await conn.fetch("""
+                SELECT id, event_type, severity, ST_Y(location) as lat, ST_X(location) as lon, created_at
+                FROM disruption_events
+                WHERE created_at > $1
+            """, since)
+            return [dict(row) for row in rows]
 
     async def save_route_alternatives(self, shipment_id: str, alternatives_json: Any):
         """Save generated route alternatives to history"""
-        conn = await asyncpg.connect(self.dsn)
-        try:
+        async with self.connection() as conn:
             # For this Phase, we store the raw JSON in 'reason_for_change' or 'alternative_route' logic
             # The schema has 'alternative_route' as Geometry.
-            # To keep it simple for Week 6 MVP, we'll store the full analysis in 'reason_for_change' text field 
+            # To keep it simple for Week 6 MVP, we'll store the full analysis in 'reason_for_change' text field
             # or ideally expand schema. But 'reason_for_change' is TEXT.
             # Let's stringify the JSON into 'reason_for_change' for now as a log.
-            
+
             # Convert to string if dict
             if not isinstance(alternatives_json, str):
-                import json
                 alternatives_json = json.dumps(alternatives_json)
-                
+
             await conn.execute("""
                 INSERT INTO route_history (
                     id, shipment_id, reason_for_change, approved_by, created_at
@@ -94,6 +326,55 @@ class ShipmentDB:
                     gen_random_uuid(), $1, $2, 'ROUTE_PLANNER', NOW()
                 )
             """, shipment_id, alternatives_json)
-            
-        finally:
-            await conn.close()
+
+
+class RiskUpdateBuffer:
+    """
+    Buffers risk assessments and writes them with ShipmentDB.update_shipment_risks.
+    Flushes when `max_size` assessments are pending or every `max_delay_s`,
+    so a sweep costs O(N / batch) round trips instead of O(N).
+    """
+    def __init__(self, db: ShipmentDB, max_size: Optional[int] = None, max_delay_s: Optional[float] = None):
+        self.db = db
+        self.max_size = max_size or int(os.getenv("RISK_UPDATE_BATCH_SIZE", "200"))
+        self.max_delay_s = max_delay_s or float(os.getenv("RISK_UPDATE_FLUSH_INTERVAL_S", "2"))
+        self._pending: Dict[str, Tuple[str, float, List[str]]] = {}
+        self._flusher: Optional[asyncio.Task] = None
+
+    async def add(self, shipment_id: str, risk_score: float, risk_factors: List[str]):
+        self._pending[str(shipment_id)] = (shipment_id, risk_score, risk_factors)
+        if len(self._pending) >= self.max_size:
+            await self.flush()
+
+    async def flush(self):
+        if not self._pending:
+            return
+        # Swap before awaiting so adds during the write land in the next batch
+        batch, self._pending = self._pending, {}
+        try:
+            await self.db.update_shipment_risks(list(batch.values()))
+            logger.debug(f"Flushed {len(batch)} risk updates")
+        except Exception as e:
+            logger.error(f"Failed to flush {len(batch)} risk updates: {e}")
+            # Keep them for the next flush unless a newer assessment arrived
+            for key, update in batch.items():
+                self._pending.setdefault(key, update)
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.max_delay_s)
+            await self.flush()
+
+    def start(self):
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_periodically())
+
+    async def stop(self):
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        await self.flush()
@@ -0,0 +1,61 @@
+import os
+import sys
+
+# Add current directory to path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(current_dir)
+
+import json
+import asyncio
+from dotenv import load_dotenv
+
+from utils.embeddings import (
+    MicroBatcher, encode_local, get_embedding_model,
+    read_frame, write_frame, encode_embeddings, encode_error
+)
+from utils.logger import get_logger
+
+load_dotenv()
+logger = get_logger("EmbeddingService")
+
+# Local embedding host: one model instance serves every agent process on the
+# machine over a Unix socket. Point workers at it with
+# EMBEDDING_SERVICE_SOCKET=<path>; concurrent requests are micro-batched.
+
+class EmbeddingService:
+    def __init__(self, socket_path: str, batcher: MicroBatcher = None):
+        self.socket_path = socket_path
+        self.batcher = batcher or MicroBatcher(encode_local)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request = json.loads(await read_frame(reader))
+            try:
+                embeddings = await self.batcher.submit(request["texts"], int(request.get("batch_size", 64)))
+                response = encode_embeddings(embeddings)
+            except Exception as e:
+                logger.error(f"Encode failed: {e}")
+                response = encode_error(str(e))
+            await write_frame(writer, response)
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError) as e:
+            logger.warning(f"Dropped malformed request: {e}")
+        finally:
+            writer.close()
+
+    async def start(self) -> asyncio.AbstractServer:
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        server = await asyncio.start_unix_server(self.handle, path=self.socket_path)
+        logger.info(f"Embedding service listening on {self.socket_path}")
+        return server
+
+async def main():
+    socket_path = os.getenv("EMBEDDING_SERVICE_SOCKET", "/tmp/ecologistix-embeddings.sock")
+    # Load up front: this process exists to host the model
+    await asyncio.to_thread(get_embedding_model)
+    server = await EmbeddingService(socket_path).start()
+    async with server:
+        await server.serve_forever()
+
+if __name__ == "__main__":
+    asyncio.run(main())
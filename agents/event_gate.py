@@ -0,0 +1,83 @@
+import os
+import time
+import hashlib
+from typing import Iterable, List, Optional
+
+from utils.logger import get_logger
+
+logger = get_logger("EventGate")
+
+# KEYS[1] = gate key; ARGV = band, factors digest, now, cooldown seconds.
+# Stored value: "band|digest|sent_at". Returns the reason, or nil to suppress.
+_EMIT_SCRIPT = """
+local previous = redis.call('GET', KEYS[1])
+local band = tonumber(ARGV[1])
+local reason = 'new'
+if previous then
+    local last_band, last_digest = string.match(previous, '^(%d+)|(%w+)|')
+    if band > tonumber(last_band) then
+        reason = 'escalated'
+    elseif ARGV[2] ~= last_digest then
+        reason = 'factors_changed'
+    else
+        return nil
+    end
+end
+redis.call('SET', KEYS[1], ARGV[1] .. '|' .. ARGV[2] .. '|' .. ARGV[3], 'EX', ARGV[4])
+return reason
+"""
+
+class HighRiskEventGate:
+    """
+    De-duplicates HIGH_RISK_DETECTED events before they reach the orchestrator.
+
+    The last event sent per shipment (risk band + factor set) is kept in Redis
+    for `cooldown_s`, so every Risk Scout process shares it. While it is live,
+    a re-scan only emits again if the score climbs into a higher band or the
+    set of risk factors changes; after the cooldown a still-risky shipment
+    emits one reminder.
+    """
+    def __init__(self, cooldown_s: Optional[float] = None, bands: Optional[List[float]] = None):
+        self.cooldown_s = cooldown_s or float(os.getenv("RISK_EVENT_COOLDOWN_S", "3600"))
+        self.bands = sorted(bands or [
+            float(b) for b in os.getenv("RISK_EVENT_BANDS", "0.7,0.85,0.95").split(",")
+        ])
+
+    @staticmethod
+    def key(shipment_id: str) -> str:
+        return f"risk:event:last:{shipment_id}"
+
+    @staticmethod
+    def factors_digest(risk_factors: Iterable[str]) -> str:
+        normalized = sorted({str(f).strip().lower() for f in risk_factors or []})
+        return hashlib.sha1("\n".join(normalized).encode()).hexdigest()[:16]
+
+    def band(self, risk_score: float) -> int:
+        return sum(1 for threshold in self.bands if risk_score > threshold)
+
+    async def should_emit(self, r_client, shipment_id: str, risk_score: float,
+                          risk_factors: Iterable[str]) -> Optional[str]:
+        """Why an event should be sent now (and record it), or None to suppress it"""
+        # Compare-and-set in one script so concurrent scouts can't both emit
+        reason = await r_client.eval(
+            _EMIT_SCRIPT, 1, self.key(shipment_id),
+            self.band(risk_score), self.factors_digest(risk_factors), int(time.time()), int(self.cooldown_s)
+        )
+        if reason is None:
+            logger.debug(f"Suppressed duplicate high-risk event for {shipment_id}")
+            return None
+        return reason.decode() if isinstance(reason, bytes) else reason
+
+    async def reset(self, r_client, shipment_id: str):
+        """Shipment is back under the threshold: its next high-risk event is new"""
+        await r_client.delete(self.key(shipment_id))
+
+    async def reset_many(self, r_client, shipment_ids: Iterable[str]):
+        """reset() for a batch of shipments in one round trip"""
+        keys = [self.key(str(shipment_id)) for shipment_id in shipment_ids]
+        if not keys:
+            return
+        async with r_client.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.delete(key)
+            await pipe.execute()
@@ -1,7 +1,29 @@
 from datetime import datetime
-from typing import List, Optional, Any, Dict
+from typing import List, Optional, Any, Dict, TypedDict
 from pydantic import BaseModel, Field
 
+class ShipmentRecord(TypedDict, total=False):
+    """
+    Row shape returned by ShipmentDB shipment queries (only the selected
+    columns are present). Position is plain float lat/lon decoded by
+    PostGIS, so hot loops never parse geometry text.
+    Agents attach prefetched weather fields to the same dict.
+    """
+    id: Any # UUID
+    vessel_name: str
+    lat: Optional[float]
+    lon: Optional[float]
+    origin_port: str
+    destination_port: str
+    eta: datetime
+    cargo_weight_metric_tons: float
+    status: str
+    risk_score: float
+    risk_factors: List[str]
+    weather_risk: str
+    max_wind_m_s: float
+    destination_weather_risk: str
+
 class Shipment(BaseModel):
     id: Optional[str] = None # UUID
     vessel_name: str
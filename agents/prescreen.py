@@ -0,0 +1,143 @@
+import os
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from tools.weather_tool import WIND_RISK_THRESHOLDS
+from tools.shipping_tool import ShippingTool
+from utils.geo import haversine_km_array, haversine_km_matrix
+from utils.logger import get_logger
+
+logger = get_logger("PreScreener")
+
+# Score assigned to each weather risk level (same bands as the agent prompt:
+# < 0.4 LOW, > 0.4 MEDIUM, > 0.7 HIGH)
+WEATHER_LEVEL_SCORES = {"CRITICAL": 0.95, "HIGH": 0.75, "MEDIUM": 0.45, "LOW": 0.1}
+SEVERITY_SCORES = {"CRITICAL": 0.95, "HIGH": 0.8, "MEDIUM": 0.5, "LOW": 0.3}
+
+
+def _as_utc(value: datetime) -> datetime:
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+
+class RiskPreScreener:
+    """
+    Deterministic, vectorized risk pre-scorer for the whole fleet.
+
+    Combines three signals per shipment:
+    - weather: max forecast wind at the current position, banded with WeatherTool's thresholds
+    - disruptions: proximity to open disruption events, weighted by severity
+    - ETA slack: time left until ETA vs. estimated remaining sea transit
+
+    Shipments that score clearly LOW on known weather are settled here;
+    everything else (ambiguous, high, or missing weather) goes to the LLM agent.
+    """
+    def __init__(self,
+                 low_threshold: Optional[float] = None,
+                 disruption_radius_km: Optional[float] = None):
+        self.low_threshold = low_threshold if low_threshold is not None else \
+            float(os.getenv("PRESCREEN_LOW_THRESHOLD", "0.4"))
+        self.disruption_radius_km = disruption_radius_km if disruption_radius_km is not None else \
+            float(os.getenv("PRESCREEN_DISRUPTION_RADIUS_KM", "500"))
+
+    def _weather_scores(self, wind_m_s: np.ndarray) -> np.ndarray:
+        conditions = [wind_m_s > threshold for threshold, _ in WIND_RISK_THRESHOLDS]
+        choices = [WEATHER_LEVEL_SCORES[level] for _, level in WIND_RISK_THRESHOLDS]
+        scores = np.select(conditions, choices, default=WEATHER_LEVEL_SCORES["LOW"])
+        # Unknown weather scores NaN so it can never be settled as LOW
+        return np.where(np.isnan(wind_m_s), np.nan, scores)
+
+    def _disruption_scores(self, lat: np.ndarray, lon: np.ndarray, disruptions: List[Dict[str, Any]]) -> np.ndarray:
+        events = [e for e in disruptions if e.get("lat") is not None and e.get("lon") is not None]
+        if not events or len(lat) == 0:
+            return np.zeros(len(lat))
+
+        ev_lat = np.array([e["lat"] for e in events])
+        ev_lon = np.array([e["lon"] for e in events])
+        severity = np.array([SEVERITY_SCORES.get(str(e.get("severity")), 0.5) for e in events])
+
+        dist = haversine_km_matrix(lat, lon, ev_lat, ev_lon)
+        # Linear falloff to zero at the radius, scaled by severity
+        proximity = np.clip(1.0 - dist / self.disruption_radius_km, 0.0, 1.0)
+        scores = (proximity * severity[None, :]).max(axis=1)
+        return np.nan_to_num(scores)
+
+    def _eta_scores(self, lat: np.ndarray, lon: np.ndarray, dest_lat: np.ndarray, dest_lon: np.ndarray,
+                    hours_left: np.ndarray) -> np.ndarray:
+        remaining_km = haversine_km_array(lat, lon, dest_lat, dest_lon) * ShippingTool.SEA_ROUTE_FACTOR
+        required_h = remaining_km / ShippingTool.AVG_SPEED_KMH
+        with np.errstate(divide="ignore", invalid="ignore"):
+            slack = hours_left / np.maximum(required_h, 1.0)
+        # >= 1.2x the needed time is comfortable, <= 0.8x is a likely delay
+        scores = np.clip((1.2 - slack) / 0.4, 0.0, 1.0) * 0.8
+        # Unknown ETA/destination is not a risk signal by itself
+        return np.nan_to_num(scores)
+
+    @staticmethod
+    def _hours_until(eta: Any, now: datetime) -> float:
+        if eta is None:
+            return np.nan
+        if isinstance(eta, str):
+            try:
+                eta = datetime.fromisoformat(eta)
+            except ValueError:
+                return np.nan
+        # Compare in aware UTC; naive timestamps (DB and caller) are UTC
+        return (_as_utc(eta) - _as_utc(now)).total_seconds() / 3600.0
+
+    def score(self, shipments: List[Dict[str, Any]], disruptions: List[Dict[str, Any]] = None,
+              now: Optional[datetime] = None) -> Dict[str, np.ndarray]:
+        """Score every shipment; returns per-component and combined score arrays"""
+        disruptions = disruptions or []
+        now = now or datetime.now(timezone.utc)
+        n = len(shipments)
+
+        # Coordinates arrive as floats; None becomes NaN
+        lat = np.array([s.get("lat") for s in shipments], dtype=np.float64)
+        lon = np.array([s.get("lon") for s in shipments], dtype=np.float64)
+        wind = np.array([s.get("max_wind_m_s") for s in shipments], dtype=np.float64)
+        dest_lat = np.full(n, np.nan)
+        dest_lon = np.full(n, np.nan)
+        hours_left = np.full(n, np.nan)
+
+        for i, shipment in enumerate(shipments):
+            dest = ShippingTool.MAJOR_PORTS.get(shipment.get("destination_port"))
+            if dest:
+                dest_lat[i], dest_lon[i] = dest
+            hours_left[i] = self._hours_until(shipment.get("eta"), now)
+
+        weather = self._weather_scores(wind)
+        disruption = self._disruption_scores(lat, lon, disruptions)
+        eta = self._eta_scores(lat, lon, dest_lat, dest_lon, hours_left)
+        combined = np.fmax(np.fmax(weather, disruption), eta)
+
+        return {"weather": weather, "disruption": disruption, "eta": eta, "combined": combined}
+
+    def split(self, shipments: List[Dict[str, Any]], disruptions: List[Dict[str, Any]] = None
+              ) -> Tuple[List[Tuple[Dict[str, Any], float, List[str]]], List[Dict[str, Any]]]:
+        """
+        Partition shipments into (settled, escalate).
+        `settled` holds (shipment, risk_score, risk_factors) for clearly low-risk ones.
+        """
+        if not shipments:
+            return [], []
+
+        scores = self.score(shipments, disruptions)
+        weather, disruption, eta, combined = scores["weather"], scores["disruption"], scores["eta"], scores["combined"]
+        clear = ~np.isnan(weather) & (combined < self.low_threshold)
+
+        settled, escalate = [], []
+        for i, shipment in enumerate(shipments):
+            if not clear[i]:
+                escalate.append(shipment)
+                continue
+            factors = []
+            if disruption[i] > 0:
+                factors.append("Disruption Nearby")
+            if eta[i] > 0:
+                factors.append("Tight ETA")
+            settled.append((shipment, round(float(combined[i]), 2), factors))
+
+        logger.info(f"Pre-screen: {len(settled)} settled as LOW, {len(escalate)} escalated to agent")
+        return settled, escalate
@@ -5,61 +5,570 @@ import sys
 current_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(current_dir)
 
+import re
+import time
 import asyncio
-from typing import List, Dict, Any
-from sentence_transformers import SentenceTransformer
-import asyncpg
-from pgvector.asyncpg import register_vector
+import hashlib
+from datetime import date
+from typing import List, Dict, Any, Iterable, Optional, Set, Tuple
+from utils.cache import LRUCache
+from utils.embeddings import get_embedder
 from utils.logger import get_logger
 from db import ShipmentDB
 
 logger = get_logger("RAGManager")
 
+# all-MiniLM-L6-v2 truncates at 256 word pieces (~1000 chars of English),
+# so longer documents are split into overlapping chunks
+CHUNK_CHARS = int(os.getenv("RAG_CHUNK_CHARS", "800"))
+CHUNK_OVERLAP = int(os.getenv("RAG_CHUNK_OVERLAP", "100"))
+
+_SENTENCE_END = re.compile(r"(?<=[.!?;])\s+")
+
+
+def chunk_text(text: str, max_chars: int = CHUNK_CHARS, overlap: int = CHUNK_OVERLAP) -> List[str]:
+    """Split text into <= max_chars chunks on sentence boundaries, carrying `overlap` chars of context"""
+    if not 0 <= overlap < max_chars:
+        # Hard-wrapping advances by max_chars - overlap
+        raise ValueError(f"overlap ({overlap}) must be in [0, max_chars={max_chars})")
+    text = " ".join(text.split())
+    if len(text) <= max_chars:
+        return [text] if text else []
+
+    chunks, current = [], ""
+    for sentence in _SENTENCE_END.split(text):
+        # Hard-wrap sentences that alone exceed the limit
+        while len(sentence) > max_chars:
+            head, sentence = sentence[:max_chars], sentence[max_chars - overlap:]
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(head)
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            chunks.append(current)
+            # Carry the tail as context, starting at a word boundary, only as
+            # much of it as still fits next to the sentence
+            carry = min(overlap, max_chars - 1 - len(sentence))
+            tail = current[-carry:] if carry > 0 else ""
+            current = tail.split(" ", 1)[-1] if " " in tail else tail
+        current = f"{current} {sentence}".strip()
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+# ANN index over knowledge_base.embedding (cosine): "hnsw", "ivfflat" or "none"
+ANN_INDEX = os.getenv("RAG_ANN_INDEX", "hnsw")
+ANN_INDEX_NAMES = {
+    "hnsw": "idx_knowledge_base_embedding_hnsw",
+    "ivfflat": "idx_knowledge_base_embedding_ivfflat",
+}
+HNSW_EF_SEARCH = int(os.getenv("RAG_HNSW_EF_SEARCH", "40"))
+IVFFLAT_PROBES = int(os.getenv("RAG_IVFFLAT_PROBES", "10"))
+
+# "vector" (cosine only) or "hybrid" (full-text + vector, RRF)
+RETRIEVAL_MODE = os.getenv("RAG_RETRIEVAL_MODE", "hybrid")
+HYBRID_CANDIDATES = int(os.getenv("RAG_HYBRID_CANDIDATES", "40"))
+RRF_K = int(os.getenv("RAG_RRF_K", "60"))
+# ANN scan widening when metadata filters are applied
+FILTERED_EF_FACTOR = int(os.getenv("RAG_FILTERED_EF_FACTOR", "4"))
+
+
+def ivfflat_lists(rows: int) -> int:
+    """pgvector guidance: rows/1000 lists up to 1M rows, sqrt(rows) beyond"""
+    return max(1, rows // 1000 if rows <= 1_000_000 else int(rows ** 0.5))
+
+
+# Metadata filters pushed down into knowledge_base queries: name -> SQL template
+KNOWLEDGE_FILTERS = {
+    "source": "source = ANY({})",
+    "jurisdiction": "jurisdiction = ANY({})",
+    "regulation": "regulation = ANY({})",
+    # In force on the given date (rows without a date always qualify)
+    "as_of": "(effective_date IS NULL OR effective_date <= {})",
+}
+
+
+def filter_clause(filters: Optional[Dict[str, Any]], first_param: int) -> Tuple[str, List[Any]]:
+    """SQL conditions (AND-prefixed) and their args for `filters`, numbered from $first_param"""
+    sql, args = "", []
+    for name, value in sorted((filters or {}).items()):
+        if name not in KNOWLEDGE_FILTERS:
+            raise ValueError(f"Unknown knowledge filter: {name}")
+        if value is None:
+            continue
+        if name == "as_of":
+            value = value if isinstance(value, date) else date.fromisoformat(str(value))
+        elif isinstance(value, str):
+            value = [value]
+        else:
+            value = list(value)
+        sql += " AND " + KNOWLEDGE_FILTERS[name].format(f"${first_param + len(args)}")
+        args.append(value)
+    return sql, args
+
+
+async def _tune_ann(conn, ef_search: int, probes: int, exact: bool, filtered: bool = False):
+    if filtered:
+        # Filters are applied after the index scan, so a restrictive filter
+        # can empty the candidate set: widen the scan (hnsw.ef_search caps at 1000)
+        ef_search = min(1000, ef_search * FILTERED_EF_FACTOR)
+        probes *= FILTERED_EF_FACTOR
+    # set_config(..., true) is SET LOCAL: scoped to the caller's transaction,
+    # so pooled connections don't leak settings between queries
+    await conn.execute(
+        "SELECT set_config('hnsw.ef_search', $1, true), set_config('ivfflat.probes', $2, true)",
+        str(ef_search), str(probes)
+    )
+    if filtered:
+        # pgvector >= 0.8 can keep scanning until enough rows pass the filter;
+        # current_setting(..., true) is NULL on older versions, which skip this
+        await conn.execute("""
+            SELECT set_config(name, 'relaxed_order', true)
+            FROM unnest(ARRAY['hnsw.iterative_scan', 'ivfflat.iterative_scan']) AS name
+            WHERE current_setting(name, true) IS NOT NULL
+        """)
+    if exact:
+        await conn.execute("SET LOCAL enable_indexscan = off")
+
+
+async def search_embeddings(conn, embedding, limit: int,
+                            ef_search: Optional[int] = None,
+                            probes: Optional[int] = None,
+                            exact: bool = False,
+                            filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """
+    Nearest knowledge_base rows by cosine distance (<=>).
+    ef_search/probes trade recall for latency on the ANN index for this query
+    only; exact=True forces the sequential scan (ground truth for benchmarks).
+    """
+    # ef_search below the limit would cap the number of results
+    ef_search = max(ef_search or HNSW_EF_SEARCH, limit)
+    probes = probes or IVFFLAT_PROBES
+    where, args = filter_clause(filters, 3)
+
+    async with conn.transaction():
+        await _tune_ann(conn, ef_search, probes, exact, filtered=bool(where))
+        rows = await conn.fetch(f"""
+            SELECT id, content, source, (embedding <=> $1) AS distance
+            FROM knowledge_base
+            WHERE embedding IS NOT NULL{where}
+            ORDER BY embedding <=> $1
+            LIMIT $2
+        """, embedding, limit, *args)
+    return [dict(row) for row in rows]
+
+
+def reciprocal_rank_fusion(rankings: List[List[Dict[str, Any]]], k: int, limit: int) -> List[Dict[str, Any]]:
+    """Merge ranked row lists by id: score = sum of 1 / (k + rank) over the lists a row appears in"""
+    fused: Dict[Any, Dict[str, Any]] = {}
+    for ranking in rankings:
+        for rank, row in enumerate(ranking, start=1):
+            entry = fused.setdefault(row["id"], {**row, "score": 0.0})
+            entry["score"] += 1.0 / (k + rank)
+    return sorted(fused.values(), key=lambda row: row["score"], reverse=True)[:limit]
+
+
+_HYBRID_COLUMNS = "id, content, source, jurisdiction, regulation, effective_date, (embedding <=> $1) AS distance"
+
+
+async def hybrid_search(conn, embedding, query: str, limit: int,
+                        candidates: Optional[int] = None,
+                        rrf_k: Optional[int] = None,
+                        ef_search: Optional[int] = None,
+                        probes: Optional[int] = None,
+                        filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """
+    Reciprocal-rank fusion of full-text (content_tsv) and vector rankings.
+    Each side contributes its top `candidates` rows, both with the filters
+    applied in SQL. Query terms are OR-ed, so a chunk matching only the
+    regulation id still ranks on the lexical side (ts_rank_cd favours
+    chunks matching more terms).
+    """
+    candidates = max(candidates or HYBRID_CANDIDATES, limit)
+    rrf_k = rrf_k or RRF_K
+    vector_where, vector_args = filter_clause(filters, 3)
+    lexical_where, lexical_args = filter_clause(filters, 4)
+
+    async with conn.transaction():
+        await _tune_ann(conn, max(ef_search or HNSW_EF_SEARCH, candidates), probes or IVFFLAT_PROBES,
+                        False, filtered=bool(vector_where))
+        vector_rows = await conn.fetch(f"""
+            SELECT {_HYBRID_COLUMNS}
+            FROM knowledge_base
+            WHERE embedding IS NOT NULL{vector_where}
+            ORDER BY embedding <=> $1
+            LIMIT $2
+        """, embedding, candidates, *vector_args)
+        # plainto_tsquery ANDs the terms; rewrite to OR (phrases like 2023/959 stay intact)
+        lexical_rows = await conn.fetch(f"""
+            SELECT {_HYBRID_COLUMNS}
+            FROM knowledge_base,
+                 (SELECT replace(plainto_tsquery('english', $3)::text, ' & ', ' | ')::tsquery AS q) AS search
+            WHERE content_tsv @@ search.q{lexical_where}
+            ORDER BY ts_rank_cd(content_tsv, search.q) DESC
+            LIMIT $2
+        """, embedding, candidates, query, *lexical_args)
+
+    return reciprocal_rank_fusion(
+        [[dict(row) for row in vector_rows], [dict(row) for row in lexical_rows]], rrf_k, limit
+    )
+
+
+# Postgres channel notified whenever knowledge_base gains rows
+CHANGE_CHANNEL = "knowledge_base_changed"
+
+
+def content_hash(source: str, content: str) -> str:
+    return hashlib.sha256(f"{source}\n{content}".encode()).hexdigest()
+
+def document_metadata(doc: Dict[str, Any]) -> Tuple[Optional[str], Optional[str], Optional[date]]:
+    effective = doc.get("effective_date")
+    if effective is not None and not isinstance(effective, date):
+        effective = date.fromisoformat(str(effective))
+    return doc.get("jurisdiction"), doc.get("regulation"), effective
+
 class RAGManager:
     def __init__(self):
-        # Initialize Embedding Model
-        # all-MiniLM-L6-v2 is small and fast (384 dim)
-        self.model = SentenceTransformer('all-MiniLM-L6-v2')
+        # Shared per process and loaded on first encode (or served by the
+        # local embedding service when EMBEDDING_SERVICE_SOCKET is set)
+        self.embedder = get_embedder()
         self.db = ShipmentDB()
-        
-    async def ingest_document(self, content: str, source: str):
-        """Embed and save document to knowledge base"""
-        embedding = self.model.encode(content).tolist()
-        
-        conn = await asyncpg.connect(self.db.dsn)
+
+        # Repeated compliance lookups skip both the encoder and the vector search.
+        # Result keys include `generation`, which every ingest (here or, via
+        # NOTIFY, in any other process) bumps, so new content is never masked;
+        # the TTL bounds staleness if the change listener isn't running.
+        self._embeddings = LRUCache(maxsize=int(os.getenv("RAG_EMBEDDING_CACHE_SIZE", "1024")))
+        self._results = LRUCache(
+            maxsize=int(os.getenv("RAG_RESULT_CACHE_SIZE", "256")),
+            ttl=float(os.getenv("RAG_RESULT_CACHE_TTL_S", "300"))
+        )
+        self.generation = 0
+        self._listener = None
+        self._listening = False
+        self._reconnect: Optional[asyncio.Task] = None
+        self.listener_retry_s = 1.0
+
+    def invalidate(self):
+        """Drop cached retrieval results (new or changed knowledge)"""
+        self.generation += 1
+        self._results.clear()
+
+    async def start_change_listener(self):
+        """
+        Invalidate on ingests made by other processes (LISTEN on a dedicated
+        connection). A dropped connection is reconnected with backoff; until
+        then the result cache TTL bounds staleness.
+        """
+        if self._listening:
+            return
+        self._listening = True
+        if not await self._connect_listener():
+            self._schedule_reconnect()
+
+    async def _connect_listener(self) -> bool:
+        import asyncpg
         try:
-            await register_vector(conn)
-            await conn.execute("""
-                INSERT INTO knowledge_base (content, source, embedding)
-                VALUES ($1, $2, $3)
-            """, content, source, embedding)
-            logger.info(f"Ingested document from {source}")
+            conn = await asyncpg.connect(self.db.dsn)
+            await conn.add_listener(CHANGE_CHANNEL, lambda *_: self.invalidate())
+            conn.add_termination_listener(self._on_listener_lost)
         except Exception as e:
-            logger.error(f"Failed to ingest document: {e}")
+            logger.warning(f"Knowledge change listener unavailable, relying on cache TTL: {e}")
+            return False
+        self._listener = conn
+        # Notifications sent while we weren't listening are lost
+        self.invalidate()
+        return True
+
+    def _on_listener_lost(self, conn):
+        if conn is not self._listener:
+            return  # closed by stop_change_listener
+        self._listener = None
+        logger.warning("Knowledge change listener connection lost, reconnecting")
+        self._schedule_reconnect()
+
+    def _schedule_reconnect(self):
+        if self._listening and self._reconnect is None:
+            self._reconnect = asyncio.get_running_loop().create_task(self._reconnect_listener())
+
+    async def _reconnect_listener(self):
+        delay = self.listener_retry_s
+        try:
+            while self._listening and self._listener is None:
+                await asyncio.sleep(delay)
+                if await self._connect_listener():
+                    logger.info("Knowledge change listener reconnected")
+                delay = min(delay * 2, 60.0)
         finally:
-            await conn.close()
-            
-    async def query_knowledge(self, query: str, limit: int = 3) -> List[Dict[str, Any]]:
-        """Retrieve relevant documents"""
-        query_embedding = self.model.encode(query).tolist()
+            self._reconnect = None
+
+    async def stop_change_listener(self):
+        self._listening = False
+        if self._reconnect is not None:
+            self._reconnect.cancel()
+        listener, self._listener = self._listener, None
+        if listener is not None:
+            await listener.close()
+
+    async def embed_query(self, query: str):
+        key = " ".join(query.split())
+        embedding = self._embeddings.get(key)
+        if embedding is None:
+            embedding = (await self.embedder.encode([key]))[0]
+            embedding.flags.writeable = False
+            self._embeddings.set(key, embedding)
+        return embedding
+        
+    async def ingest_document(self, content: str, source: str, replace_source: bool = False):
+        """
+        Embed and save document to knowledge base. Other documents already
+        stored under `source` are kept unless replace_source is set.
+        """
+        await self.ingest_documents([{"content": content, "source": source}], replace_sources=replace_source)
+
+    async def ingest_documents(self, documents: Iterable[Dict[str, str]],
+                               batch_size: Optional[int] = None,
+                               replace_sources: bool = True) -> Dict[str, float]:
+        """
+        Stream-ingest {"content", "source"} documents (optionally with
+        "jurisdiction", "regulation" and "effective_date"): chunk, drop chunks already
+        stored (by content hash), embed the rest in batches and bulk-insert them.
+        Stored chunks whose metadata changed are updated in place, without re-embedding.
+        Encoding of one batch overlaps the DB write of the previous one.
+        With replace_sources, each ingested source's stored chunks that are no
+        longer part of it (superseded text) are deleted afterwards.
+        """
+        batch_size = batch_size or int(os.getenv("RAG_INGEST_BATCH_SIZE", "256"))
+        stats = {"documents": 0, "chunks": 0, "skipped": 0, "inserted": 0, "updated": 0, "failed": 0, "removed": 0}
+        # Every chunk hash per ingested source (hashes embed the source)
+        sources: Set[str] = set()
+        hashes: Set[str] = set()
+        started = time.monotonic()
+        pending_write: Optional[asyncio.Task] = None
+
+        async def flush(batch):
+            nonlocal pending_write
+            rows, retag = await self._embed_new(batch, stats)
+            if pending_write is not None:
+                await pending_write
+            pending_write = asyncio.create_task(self._write(rows, retag, stats)) if rows or retag else None
+
+        batch = []
+        try:
+            for doc in documents:
+                stats["documents"] += 1
+                metadata = document_metadata(doc)
+                sources.add(doc["source"])
+                for index, chunk in enumerate(chunk_text(doc["content"])):
+                    digest = content_hash(doc["source"], chunk)
+                    hashes.add(digest)
+                    batch.append((digest, doc["source"], index, chunk, metadata))
+                if len(batch) >= batch_size:
+                    await flush(batch)
+                    batch = []
+            if batch:
+                await flush(batch)
+        finally:
+            if pending_write is not None:
+                await pending_write
+
+        if replace_sources and sources:
+            if stats["failed"]:
+                # Old text is better than missing text
+                logger.warning(f"{stats['failed']} chunks failed to store, keeping superseded chunks")
+            else:
+                stats["removed"] = await self._remove_superseded(sources, hashes)
+
+        duration = time.monotonic() - started
+        stats["duration_s"] = round(duration, 2)
+        stats["docs_per_s"] = round(stats["documents"] / duration, 2) if duration > 0 else 0.0
+        logger.info(
+            f"Ingested {stats['documents']} documents ({stats['inserted']} new chunks, {stats['updated']} retagged, "
+            f"{stats['skipped']} unchanged, {stats['removed']} superseded removed) in {stats['duration_s']}s, {stats['docs_per_s']} docs/s"
+        )
+        return stats
+
+    async def _embed_new(self, batch, stats) -> Tuple[List[tuple], List[tuple]]:
+        """Rows to insert (embedded) and (hash, *metadata) of stored chunks to retag"""
+        # Intra-batch duplicates collapse on the hash
+        unique = list({row[0]: row for row in batch}.values())
+        stats["chunks"] += len(batch)
+
+        async with self.db.connection() as conn:
+            existing = {
+                row["content_hash"]: (row["jurisdiction"], row["regulation"], row["effective_date"])
+                for row in await conn.fetch(
+                    """
+                    SELECT content_hash, jurisdiction, regulation, effective_date
+                    FROM knowledge_base WHERE content_hash = ANY($1::text[])
+                    """,
+                    [row[0] for row in unique]
+                )
+            }
+        new = [row for row in unique if row[0] not in existing]
+        # The hash covers text only: rows stored before the metadata columns
+        # existed, or re-ingested with new metadata, still need it written
+        retag = [(digest, *metadata) for digest, _, _, _, metadata in unique
+                 if digest in existing and tuple(metadata) != existing[digest]]
+        stats["skipped"] += len(batch) - len(new) - len(retag)
+        if not new:
+            return [], retag
+
+        embeddings = await self.embedder.encode(
+            [row[3] for row in new], batch_size=int(os.getenv("RAG_ENCODE_BATCH_SIZE", "64"))
+        )
+        rows = [(chunk, source, embedding, digest, index, *metadata)
+                for (digest, source, index, chunk, metadata), embedding in zip(new, embeddings)]
+        return rows, retag
+
+    async def _write(self, rows: List[tuple], retag: List[tuple], stats):
+        try:
+            async with self.db.connection() as conn:
+                written, retagged = [], []
+                if rows:
+                    # pgvector codec is registered by the pool's init hook.
+                    # One row back per chunk actually written: inserted, or stored
+                    # meanwhile by a concurrent ingest with other metadata
+                    written = await conn.fetchmany("""
+                        INSERT INTO knowledge_base (content, source, embedding, content_hash, chunk_index,
+                                                    jurisdiction, regulation, effective_date)
+                        VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
+                        ON CONFLICT (content_hash) DO UPDATE SET
+                            jurisdiction = EXCLUDED.jurisdiction,
+                            regulation = EXCLUDED.regulation,
+                            effective_date = EXCLUDED.effective_date
+                        WHERE (knowledge_base.jurisdiction, knowledge_base.regulation, knowledge_base.effective_date)
+                              IS DISTINCT FROM (EXCLUDED.jurisdiction, EXCLUDED.regulation, EXCLUDED.effective_date)
+                        RETURNING (xmax = 0) AS inserted
+                    """, rows)
+                if retag:
+                    retagged = await conn.fetchmany("""
+                        UPDATE knowledge_base
+                        SET jurisdiction = $2, regulation = $3, effective_date = $4
+                        WHERE content_hash = $1
+                          AND (jurisdiction, regulation, effective_date) IS DISTINCT FROM ($2, $3, $4)
+                        RETURNING 1
+                    """, retag)
+                if written or retagged:
+                    await conn.execute("SELECT pg_notify($1, '')", CHANGE_CHANNEL)
+            inserted = sum(1 for row in written if row["inserted"])
+            stats["inserted"] += inserted
+            stats["updated"] += len(written) - inserted + len(retagged)
+            stats["skipped"] += len(rows) - len(written) + len(retag) - len(retagged)
+            if written or retagged:
+                self.invalidate()
+        except Exception as e:
+            stats["failed"] += len(rows) + len(retag)
+            logger.error(f"Failed to ingest {len(rows) + len(retag)} chunks: {e}")
+
+    async def _remove_superseded(self, sources: Set[str], hashes: Set[str]) -> int:
+        """Delete chunks of `sources` that the latest ingest no longer contains"""
+        async with self.db.connection() as conn:
+            status = await conn.execute("""
+                DELETE FROM knowledge_base
+                WHERE source = ANY($1::text[])
+                  AND (content_hash IS NULL OR content_hash <> ALL($2::text[]))
+            """, list(sources), list(hashes))
+            removed = int(status.split()[-1])
+            if removed:
+                await conn.execute("SELECT pg_notify($1, '')", CHANGE_CHANNEL)
+        if removed:
+            self.invalidate()
+        return removed
+
+    async def query_knowledge(self, query: str, limit: int = 3,
+                              ef_search: Optional[int] = None,
+                              probes: Optional[int] = None,
+                              exact: bool = False,
+                              filters: Optional[Dict[str, Any]] = None,
+                              mode: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Retrieve relevant documents.
+        mode "hybrid" fuses full-text and vector rankings (exact identifiers like
+        "2023/959" match lexically); "vector" is cosine only. `filters` (source,
+        jurisdiction, regulation, as_of) are applied in SQL before ranking.
+        """
+        mode = "vector" if exact else (mode or RETRIEVAL_MODE)
+        if mode not in ("vector", "hybrid"):
+            raise ValueError(f"Unknown retrieval mode: {mode}")
+        filter_key = tuple(sorted((k, str(v)) for k, v in (filters or {}).items()))
+        key = (self.generation, " ".join(query.split()), limit, ef_search, probes, exact, filter_key, mode)
+        cached = self._results.get(key)
+        if cached is not None:
+            return [dict(row) for row in cached]
+
+        query_embedding = await self.embed_query(query)
         
-        conn = await asyncpg.connect(self.db.dsn)
         try:
-            await register_vector(conn)
-            # Cosine similarity (<=> is L2 distance, <=> is cosine distance operator in pgvector? 
-            # Actually <=> is cosine distance. 
-            # Docs say: <-> Euclidean, <=> Cosine, <#> Inner Product
-            # We want closest distance = most similar.
-            rows = await conn.fetch("""
-                SELECT content, source, (embedding <=> $1) as distance
-                FROM knowledge_base
-                ORDER BY distance ASC
-                LIMIT $2
-            """, query_embedding, limit)
-            
-            return [dict(row) for row in rows]
+            async with self.db.connection() as conn:
+                # <=> is cosine distance; closest distance = most similar
+                if mode == "hybrid":
+                    rows = await hybrid_search(conn, query_embedding, query, limit,
+                                               ef_search=ef_search, probes=probes, filters=filters)
+                else:
+                    rows = await search_embeddings(conn, query_embedding, limit, ef_search, probes, exact, filters)
         except Exception as e:
             logger.error(f"Failed to query knowledge: {e}")
             return []
-        finally:
-            await conn.close()
+
+        results = [{k: row[k] for k in ("content", "source", "distance")} for row in rows]
+        # If an ingest landed mid-search, `key` holds the old generation and is never read again
+        self._results.set(key, results)
+        return [dict(row) for row in results]
+
+    async def ensure_index(self, kind: Optional[str] = None, rebuild: bool = False) -> Optional[str]:
+        """
+        Create the ANN index if missing or left INVALID by a failed concurrent
+        build. IVFFlat clusters are trained on the rows present at build time,
+        so it is rebuilt once the corpus has grown or shrunk well past its list
+        count; HNSW stays current on insert. Switching kinds drops the other
+        kind's index once the new one is built, so only one is maintained.
+        Returns the index name (None when ANN is disabled).
+        """
+        kind = kind or ANN_INDEX
+        if kind == "none":
+            return None
+        if kind not in ANN_INDEX_NAMES:
+            raise ValueError(f"Unknown ANN index type: {kind}")
+        name = ANN_INDEX_NAMES[kind]
+
+        async with self.db.connection() as conn:
+            # NULL: missing; false: a failed CREATE INDEX CONCURRENTLY left it unusable
+            valid = await conn.fetchval(
+                "SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass($1)", name
+            )
+            exists = valid is not None
+            if valid is False:
+                logger.warning(f"ANN index {name} is INVALID, rebuilding")
+                rebuild = True
+
+            if kind == "ivfflat":
+                rows = await conn.fetchval("SELECT count(*) FROM knowledge_base")
+                lists = ivfflat_lists(rows)
+                if exists and not rebuild:
+                    options = await conn.fetchval("SELECT reloptions FROM pg_class WHERE relname = $1", name) or []
+                    built = next((int(o.split("=")[1]) for o in options if o.startswith("lists=")), lists)
+                    rebuild = not (built / 2 <= lists <= built * 2)
+                method = f"ivfflat (embedding vector_cosine_ops) WITH (lists = {lists})"
+            else:
+                method = (
+                    f"hnsw (embedding vector_cosine_ops) WITH "
+                    f"(m = {int(os.getenv('RAG_HNSW_M', '16'))}, "
+                    f"ef_construction = {int(os.getenv('RAG_HNSW_EF_CONSTRUCTION', '64'))})"
+                )
+
+            if rebuild or not exists:
+                if exists:
+                    await conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+                # CONCURRENTLY keeps the table writable (and readable) during the build
+                started = time.monotonic()
+                await conn.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON knowledge_base USING {method}")
+                logger.info(f"Built ANN index {name} ({method}) in {time.monotonic() - started:.1f}s")
+
+            # Otherwise the planner may keep using the old kind, and both pay on every insert
+            for other in ANN_INDEX_NAMES.values():
+                if other != name and await conn.fetchval("SELECT to_regclass($1) IS NOT NULL", other):
+                    await conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {other}")
+                    logger.info(f"Dropped ANN index {other} after switching to {kind}")
+        return name
@@ -5,12 +5,21 @@ import signal
 import asyncio
 import json
 import re
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 
 from dotenv import load_dotenv
 from smolagents import CodeAgent, InferenceClientModel
 from utils.logger import get_logger
-from db import ShipmentDB
+from utils.agent_pool import AgentPool
+from utils.rate_limiter import TokenBucket
+from utils.llm_cache import AgentResultCache
+from db import ShipmentDB, RiskUpdateBuffer, close_pool
+from change_tracker import ShipmentChangeTracker
+from prescreen import RiskPreScreener
+from event_gate import HighRiskEventGate
+from utils.geo import record_position
+from utils.http_client import close_async_client
+from utils.redis_client import get_redis, close_redis
 from tools import WeatherTool, CarbonTool, ShippingTool
 
 load_dotenv()
@@ -19,28 +28,54 @@ logger = get_logger("RiskScout")
 
 running = True
 
+# Shipment IDs needing an immediate out-of-sweep rescan (e.g. near a new disruption)
+RESCAN_QUEUE = "agent:task:risk_rescan"
+# Raw disruption reports (JSON, log_disruption fields) from feeds and operators;
+# the scout logs them and rescans the shipments they affect
+DISRUPTION_QUEUE = "event:queue:disruptions"
+
 def signal_handler(signum, frame):
     global running
     logger.info(f"Received signal {signum}, shutting down...")
     running = False
 
+async def report_disruption(db: ShipmentDB, r_client, event_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Log a disruption and queue only the shipments it affects for rescan"""
+    event = await db.log_disruption(event_data)
+    if event["affected_shipments"]:
+        await r_client.rpush(RESCAN_QUEUE, *(str(i) for i in event["affected_shipments"]))
+    return event
+
 class RiskScout:
     def __init__(self):
         self.db = ShipmentDB()
-        self.tools = [WeatherTool(), CarbonTool(), ShippingTool()]
+        self.risk_writer = RiskUpdateBuffer(self.db)
+        self.tracker = ShipmentChangeTracker()
+        self.prescreener = RiskPreScreener()
+        self.event_gate = HighRiskEventGate()
+        self.weather_tool = WeatherTool()
+        self.tools = [self.weather_tool, CarbonTool(), ShippingTool()]
         
         # Configure Model
         # Roadmap suggested mistralai/Mistral-Nemo-12B-Instruct-2407
         # Using Qwen 2.5 Coder as it is free and powerful on HF Inference API
         model_id = os.getenv("RISK_SCOUT_MODEL", "Qwen/Qwen2.5-Coder-32B-Instruct")
         self.model = InferenceClientModel(model_id=model_id)
-        
-        self.agent = CodeAgent(
-            tools=self.tools,
-            model=self.model,
-            max_steps=3,
-            verbosity_level=2
+        # Unchanged scan inputs reuse the previous assessment instead of re-running the model
+        self.llm_cache = AgentResultCache("risk_scout", model=model_id)
+
+        # Sweep scheduling
+        # Concurrency bounds in-flight agent runs; the token bucket bounds
+        # request rate against the inference provider (replaces fixed sleeps)
+        self.concurrency = int(os.getenv("RISK_SCOUT_CONCURRENCY", "8"))
+        self.scan_timeout = float(os.getenv("RISK_SCOUT_SCAN_TIMEOUT", "120"))
+        self.rate_limiter = TokenBucket(
+            rate=float(os.getenv("RISK_SCOUT_RATE_PER_SEC", "0.5")),
+            capacity=float(os.getenv("RISK_SCOUT_RATE_BURST", "4"))
         )
+
+        # One CodeAgent per concurrent scan (agents are stateful)
+        self.agents = AgentPool(self._build_agent, size=self.concurrency, name="risk-scout")
         
         self.system_prompt = """
 You are the Risk Scout agent in EcoLogistix.
@@ -63,7 +98,59 @@ Return ONLY a valid JSON object with this format:
 }
 """
 
-    async def scan_shipment(self, shipment: Dict[str, Any], r_client):
+    def _build_agent(self) -> CodeAgent:
+        return CodeAgent(
+            tools=self.tools,
+            model=self.model,
+            max_steps=3,
+            verbosity_level=2
+        )
+
+    async def prefetch_weather(self, shipments: List[Dict[str, Any]]):
+        """
+        Warm the weather cache for every shipment's position and destination port
+        in a few batched requests, and attach the results to the shipments.
+        Runs before change tracking, pre-screening and any agent run.
+        """
+        targets = []
+        for shipment in shipments:
+            position = record_position(shipment)
+            if position:
+                targets.append((shipment, "position", position))
+            port = ShippingTool.MAJOR_PORTS.get(shipment.get("destination_port"))
+            if port:
+                targets.append((shipment, "destination", port))
+        if not targets:
+            return
+
+        started = time.monotonic()
+        forecasts = await self.weather_tool.afetch_batch([coords for _, _, coords in targets])
+
+        for (shipment, kind, _), weather in zip(targets, forecasts):
+            if "error" in weather:
+                continue
+            if kind == "position":
+                shipment["weather_risk"] = weather["risk_level"]
+                shipment["max_wind_m_s"] = weather["max_wind_speed_m_s"]
+            else:
+                shipment["destination_weather_risk"] = weather["risk_level"]
+
+        logger.info(f"Prefetched weather for {len(targets)} points in {time.monotonic() - started:.2f}s")
+
+    async def prescreen(self, shipments: List[Dict[str, Any]], r_client=None) -> List[Dict[str, Any]]:
+        """Settle clearly low-risk shipments without the agent; return the ones to escalate"""
+        disruptions = await self.db.get_open_disruptions()
+        settled, escalate = self.prescreener.split(shipments, disruptions)
+
+        for shipment, risk_score, risk_factors in settled:
+            await self.risk_writer.add(shipment['id'], risk_score, risk_factors)
+            self.tracker.record(shipment)
+        # Settled shipments are low risk: a later escalation must emit again
+        if r_client is not None and settled:
+            await self.event_gate.reset_many(r_client, [shipment['id'] for shipment, _, _ in settled])
+        return escalate
+
+    async def scan_shipment(self, shipment: Dict[str, Any], r_client=None, bypass_cache: bool = False):
         """Analyze a single shipment"""
         logger.info(f"Scanning shipment {shipment.get('id')} ({shipment.get('vessel_name')})")
         
@@ -73,46 +160,91 @@ Return ONLY a valid JSON object with this format:
 Analyze this shipment:
 - ID: {shipment.get('id')}
 - Vessel: {shipment.get('vessel_name')}
-- Location: {shipment.get('current_location_wkt')}
+- Location: lat {shipment.get('lat')}, lon {shipment.get('lon')}
 - Origin: {shipment.get('origin_port')}
 - Destination: {shipment.get('destination_port')}
 - ETA: {shipment.get('eta')}
+- Weather risk at current location: {shipment.get('weather_risk', 'UNKNOWN')} (max wind {shipment.get('max_wind_m_s', 'n/a')} m/s)
+- Weather risk at destination: {shipment.get('destination_weather_risk', 'UNKNOWN')}
 
-Use the 'fetch_weather' tool if you need weather data.
+Use the 'fetch_weather' tool only if the weather above is UNKNOWN or you need another location.
 """
         try:
-            loop = asyncio.get_event_loop()
-            result = await loop.run_in_executor(None, self.agent.run, prompt)
-            
-            parsed = self._parse_output(result)
+            inputs = self._scan_inputs(shipment)
+            # A disruption nearby isn't part of the cache key: never answer
+            # it with an assessment made before the event
+            bypass = bypass_cache or self.tracker.near_disruption(shipment['id'])
+            parsed = await self.llm_cache.get(inputs, bypass=bypass)
+            if parsed is None:
+                await self.rate_limiter.acquire()
+                result = await self.agents.run(prompt, timeout=self.scan_timeout)
+                parsed = self._parse_output(result)
+                if parsed:
+                    await self.llm_cache.set(inputs, parsed)
+
             if parsed:
                 risk_score = parsed['risk_score']
                 logger.info(f"Risk assessment for {shipment.get('vessel_name')}: {risk_score} ({parsed['recommended_action']})")
                 
-                await self.db.update_shipment_risk(
-                    shipment['id'], 
-                    risk_score, 
+                await self.risk_writer.add(
+                    shipment['id'],
+                    risk_score,
                     parsed.get('risk_factors', [])
                 )
+                # Only successful scans count; failed ones stay due next sweep
+                self.tracker.record(shipment)
                 
                 # INTEGRATION HOOK: If High Risk, trigger Orchestrator
-                if risk_score > 0.7:
-                     event = {
-                        "event_type": "HIGH_RISK_DETECTED",
-                        "shipment_id": shipment['id'],
-                        "risk_score": risk_score,
-                        "risk_factors": parsed.get('risk_factors', []),
-                        "detected_at": time.strftime("%Y-%m-%dT%H:%M:%SZ")
-                     }
-                     r_client.lpush("event:queue:high_priority", json.dumps(event))
-                     logger.warning(f"HIGH RISK EVENT TRIGGERED for {shipment.get('vessel_name')}")
+                # (once per shipment/factor set per cooldown, or when it escalates)
+                if r_client is not None:
+                    await self._publish_high_risk(r_client, shipment, risk_score, parsed.get('risk_factors', []))
 
             else:
                 logger.warning(f"Failed to parse agent output for {shipment.get('id')}")
 
+        except asyncio.TimeoutError:
+            logger.error(f"Scan of shipment {shipment.get('id')} timed out after {self.scan_timeout}s")
         except Exception as e:
             logger.error(f"Error scanning shipment {shipment.get('id')}: {e}")
 
+    @staticmethod
+    def _scan_inputs(shipment: Dict[str, Any]) -> Dict[str, Any]:
+        """Everything the scan prompt depends on, at cache-key precision"""
+        lat, lon = shipment.get('lat'), shipment.get('lon')
+        return {
+            "id": shipment.get('id'),
+            "vessel_name": shipment.get('vessel_name'),
+            # ~1 km; finer moves don't change the assessment
+            "position": [round(lat, 2), round(lon, 2)] if lat is not None and lon is not None else None,
+            "origin_port": shipment.get('origin_port'),
+            "destination_port": shipment.get('destination_port'),
+            "eta": shipment.get('eta'),
+            "weather_risk": shipment.get('weather_risk'),
+            "max_wind_m_s": round(shipment['max_wind_m_s'], 1) if shipment.get('max_wind_m_s') is not None else None,
+            "destination_weather_risk": shipment.get('destination_weather_risk'),
+        }
+
+    async def _publish_high_risk(self, r_client, shipment: Dict[str, Any], risk_score: float, risk_factors: List[str]):
+        shipment_id = str(shipment['id'])
+        if risk_score <= 0.7:
+            await self.event_gate.reset(r_client, shipment_id)
+            return
+
+        trigger = await self.event_gate.should_emit(r_client, shipment_id, risk_score, risk_factors)
+        if trigger is None:
+            return
+
+        event = {
+            "event_type": "HIGH_RISK_DETECTED",
+            "shipment_id": shipment_id,
+            "risk_score": risk_score,
+            "risk_factors": risk_factors,
+            "trigger": trigger,
+            "detected_at": time.strftime("%Y-%m-%dT%H:%M:%SZ")
+        }
+        await r_client.lpush("event:queue:high_priority", json.dumps(event))
+        logger.warning(f"HIGH RISK EVENT TRIGGERED for {shipment.get('vessel_name')} ({trigger})")
+
     def _parse_output(self, output: Any) -> Optional[Dict[str, Any]]:
         try:
             # If output is already dict (sometimes agent returns structured)
@@ -128,10 +260,89 @@ Use the 'fetch_weather' tool if you need weather data.
             logger.error(f"JSON Parse Error: {e}")
             return None
 
+    async def sweep(self, shipments: List[Dict[str, Any]], r_client, bypass_cache: bool = False) -> Dict[str, float]:
+        """Scan shipments concurrently with bounded parallelism"""
+        queue: asyncio.Queue = asyncio.Queue()
+        for shipment in shipments:
+            queue.put_nowait(shipment)
+
+        scanned = 0
+
+        async def worker():
+            nonlocal scanned
+            while running:
+                try:
+                    shipment = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                # scan_shipment handles its own errors/timeouts, so a slow
+                # vessel only occupies one worker
+                await self.scan_shipment(shipment, r_client, bypass_cache)
+                scanned += 1
+
+        started = time.monotonic()
+        workers = min(self.concurrency, len(shipments))
+        await asyncio.gather(*(worker() for _ in range(workers)))
+        duration = time.monotonic() - started
+
+        stats = {
+            "scanned": scanned,
+            "cache_hit_rate": self.llm_cache.stats()["hit_rate"],
+            "duration_s": round(duration, 2),
+            "throughput_per_min": round(scanned / duration * 60, 2) if duration > 0 else 0.0
+        }
+        logger.info(
+            f"Sweep complete: {stats['scanned']}/{len(shipments)} shipments in "
+            f"{stats['duration_s']}s ({stats['throughput_per_min']} shipments/min, concurrency={workers}, "
+            f"result cache hit rate {stats['cache_hit_rate']})"
+        )
+        return stats
+
+    async def wait_for_rescans(self, r_client, timeout: float) -> List[str]:
+        """
+        Wait up to `timeout` seconds for queued rescan requests; returns the
+        drained shipment IDs. Disruption reports arriving meanwhile are logged
+        and queue their affected shipments.
+        """
+        deadline = time.monotonic() + timeout
+        while running:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            # Short blocking pop parks only this coroutine, then drain the rest in one call.
+            # BLPOP treats 0 as "block forever": never let the timeout round down to it
+            popped = await r_client.blpop([DISRUPTION_QUEUE, RESCAN_QUEUE], timeout=max(0.01, min(remaining, 5.0)))
+            if popped and popped[0] == DISRUPTION_QUEUE:
+                await self.handle_disruption_report(r_client, popped[1])
+                continue
+            if popped:
+                ids = [popped[1], *(await r_client.lpop(RESCAN_QUEUE, 499) or [])]
+                return list(dict.fromkeys(ids))
+        return []
+
+    async def handle_disruption_report(self, r_client, payload: str):
+        try:
+            event = await report_disruption(self.db, r_client, json.loads(payload))
+        except Exception as e:
+            logger.error(f"Failed to log disruption report {payload[:200]}: {e}")
+            return
+        logger.warning(f"Disruption {event['id']} logged, {len(event['affected_shipments'])} shipments queued for rescan")
+
+    async def rescan(self, shipment_ids: List[str], r_client):
+        """Targeted rescan of specific shipments, bypassing change tracking, pre-screen and the result cache"""
+        shipments = await self.db.get_shipments(shipment_ids)
+        if not shipments:
+            return
+        logger.info(f"Rescanning {len(shipments)} shipments on request")
+        await self.prefetch_weather(shipments)
+        # Rescans follow a reported disruption: fresh assessments only
+        await self.sweep(shipments, r_client, bypass_cache=True)
+        await self.risk_writer.flush()
+
     async def run(self):
         logger.info("Risk Scout Loop Starting...")
-        import redis
-        r = redis.Redis(host=os.getenv("REDIS_HOST", "localhost"), port=int(os.getenv("REDIS_PORT", 6379)), decode_responses=True)
+        self.risk_writer.start()
+        r = get_redis()
         
         while running:
             try:
@@ -141,24 +352,44 @@ Use the 'fetch_weather' tool if you need weather data.
                     await asyncio.sleep(60)
                     continue
                 
-                for shipment in shipments:
-                    if not running: break
-                    
-                    # Store previous risk score (optional optimization, skip if already high? Na, re-evaluate)
-                    # For MVP, scan everyone.
-                    
-                    await self.scan_shipment(shipment, r)
-                    await asyncio.sleep(2) # Rate limit
-                
-                await asyncio.sleep(30)
+                # Warm weather for the whole fleet before any agent runs
+                await self.prefetch_weather(shipments)
+
+                # Incremental sweep: only re-evaluate shipments whose inputs changed
+                disruptions = await self.db.get_disruptions_since(self.tracker.disruption_cursor)
+                due = self.tracker.select_due(shipments, disruptions)
+                if due:
+                    # Cheap numeric pre-screen; only ambiguous/high-risk ones reach the LLM
+                    escalate = await self.prescreen(due, r)
+                    if escalate:
+                        await self.sweep(escalate, r)
+                    await self.risk_writer.flush()
+
+                # Between sweeps, serve targeted rescans as soon as they arrive
+                deadline = time.monotonic() + 30
+                while running and time.monotonic() < deadline:
+                    ids = await self.wait_for_rescans(r, deadline - time.monotonic())
+                    if ids:
+                        await self.rescan(ids, r)
                 
             except Exception as e:
                 logger.error(f"Error in main loop: {e}")
                 await asyncio.sleep(10)
 
+async def main():
+    scout = RiskScout()
+    try:
+        await scout.run()
+    finally:
+        await scout.risk_writer.stop()
+        scout.agents.shutdown()
+        await scout.weather_tool.cache.aclose()
+        await close_async_client()
+        await close_redis()
+        await close_pool()
+
 if __name__ == "__main__":
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
 
-    scout = RiskScout()
-    asyncio.run(scout.run())
+    asyncio.run(main())
@@ -1,9 +1,8 @@
 import os
 import sys
-import json
-import time
 import asyncio
 import redis
+from typing import Dict, List, Set
 from dotenv import load_dotenv
 
 # Add current directory to path so imports work
@@ -12,62 +11,122 @@ sys.path.append(current_dir)
 
 from smolagents import CodeAgent, InferenceClientModel
 
-from tools.routing_tool import RoutingTool
+from tools.routing_tool import RoutingTool, AlternativeRoutesTool
 from tools.carbon_tool import CarbonTool
 from tools.shipping_tool import ShippingTool
-from db import ShipmentDB
+from db import ShipmentDB, close_pool
 from utils.logger import get_logger
+from utils.agent_pool import AgentPool
+from utils.llm_cache import AgentResultCache
+from utils.task_queue import Task, TaskQueue
+from utils.redis_client import get_redis, close_redis
 
 load_dotenv()
 logger = get_logger("RoutePlanner")
 
+# Reason fields that differ between shipments hit by the same disruption
+# (or between re-sends of one event) and don't change the plan
+VOLATILE_REASON_FIELDS = {"shipment_id", "risk_score", "trigger", "detected_at", "created_at"}
+
 class RoutePlanner:
     def __init__(self):
-        # Redis Connection
-        redis_host = os.getenv("REDIS_HOST", "localhost")
-        redis_port = os.getenv("REDIS_PORT", "6379")
-        self.redis_client = redis.Redis(host=redis_host, port=int(redis_port), decode_responses=True)
-        self.task_queue = "agent:task:route_planner"
+        # Redis (shared async pool; queue waits don't block the event loop)
+        self.redis_client = get_redis()
+        # Per-task budget; the queue keeps its claim window well above it
+        self.task_timeout = float(os.getenv("ROUTE_PLANNER_TASK_TIMEOUT", "300"))
+        self.tasks = TaskQueue(self.redis_client, "route_planner", task_timeout_s=self.task_timeout)
+        self.audit_tasks = TaskQueue(self.redis_client, "carbon_audit")
         
         # DB Connection
         self.db = ShipmentDB()
         
         # Tools
-        self.tools = [RoutingTool(), CarbonTool(), ShippingTool()]
+        router = RoutingTool()
+        self.tools = [AlternativeRoutesTool(router), router, CarbonTool(), ShippingTool()]
         
         # Model
         # Use deepseek-coder if available or fallback to Qwen
         model_id = os.getenv("ROUTE_PLANNER_MODEL", "Qwen/Qwen2.5-Coder-32B-Instruct")
         self.model = InferenceClientModel(model_id=model_id)
+        # Plans depend on the lane and the disruption, not the vessel, so
+        # shipments on the same lane hit by the same event share one result
+        self.llm_cache = AgentResultCache("route_planner", model=model_id)
+        
+        # Concurrent planning: each task borrows its own CodeAgent and runs on
+        # the pool's bounded executor, so the queue loop never stalls on a run
+        self.concurrency = int(os.getenv("ROUTE_PLANNER_CONCURRENCY", "4"))
+        self.agents = AgentPool(self._build_agent, size=self.concurrency, name="route-planner")
+        # shipment_id -> tasks covered by that shipment's in-flight plan
+        self._planning: Dict[str, List[Task]] = {}
         
-        self.agent = CodeAgent(
+        self.running = True
+
+    def _build_agent(self) -> CodeAgent:
+        return CodeAgent(
             tools=self.tools,
             model=self.model,
             max_iterations=8,
             additional_authorized_imports=["networkx", "json"]
         )
-        
-        self.running = True
 
     async def run(self):
-        logger.info(f"Route Planner Agent started. Listening on {self.task_queue}...")
-        
-        while self.running:
-            try:
-                # Blocking pop from Redis (timeout 5s to allow graceful shutdown check)
-                task_data = self.redis_client.blpop(self.task_queue, timeout=5)
-                
-                if task_data:
-                    queue, payload = task_data
-                    logger.info(f"Received task: {payload}")
-                    await self.process_task(json.loads(payload))
-                    
-            except redis.exceptions.ConnectionError:
-                logger.error("Redis connection lost. Retrying in 5s...")
-                await asyncio.sleep(5)
-            except Exception as e:
-                logger.error(f"Error in worker loop: {e}")
-                await asyncio.sleep(1)
+        logger.info(
+            f"Route Planner Agent started. Listening on {self.tasks.key} ({self.tasks.mode}), "
+            f"concurrency={self.concurrency}..."
+        )
+        inflight: Set[asyncio.Task] = set()
+
+        try:
+            while self.running:
+                try:
+                    if len(inflight) >= self.concurrency:
+                        await asyncio.wait(inflight, return_when=asyncio.FIRST_COMPLETED)
+                        continue
+                    # Only take as many tasks as there are free slots, so other
+                    # workers in the group can pick up the rest
+                    for task in await self.tasks.read(count=self.concurrency - len(inflight)):
+                        # Bursts for one shipment merge into a single replanning run
+                        key = str(task.data.get("shipment_id") or task.id)
+                        if key in self._planning:
+                            self._planning[key].append(task)
+                            logger.info(f"Coalesced task {task.id} into in-flight plan for {key}")
+                            continue
+                        self._planning[key] = [task]
+                        job = asyncio.create_task(self.handle_task(key, task))
+                        inflight.add(job)
+                        job.add_done_callback(inflight.discard)
+
+                except redis.exceptions.ConnectionError:
+                    logger.error("Redis connection lost. Retrying in 5s...")
+                    await asyncio.sleep(5)
+                except Exception as e:
+                    logger.error(f"Error in worker loop: {e}")
+                    await asyncio.sleep(1)
+
+            # Graceful stop: let in-flight plans finish
+            if inflight:
+                await asyncio.wait(inflight, timeout=self.task_timeout)
+        finally:
+            # Cancelled or drained past the timeout: unacked tasks get reclaimed
+            for job in inflight:
+                job.cancel()
+            await asyncio.gather(*inflight, return_exceptions=True)
+
+    async def handle_task(self, key: str, task: Task):
+        logger.info(f"Received task: {task.data}")
+        try:
+            await self.process_task(task.data)
+        except asyncio.TimeoutError:
+            logger.error(f"Planning timed out after {self.task_timeout}s, leaving task {task.id} for retry")
+            return
+        except Exception as e:
+            # Left pending: reclaimed and retried, dead-lettered after TASK_MAX_DELIVERIES
+            logger.error(f"Task {task.id} failed, leaving it for retry: {e}")
+            return
+        finally:
+            covered = self._planning.pop(key, [task])
+        # Ack only once handled (incl. coalesced duplicates); a crash leaves them pending for reclaim
+        await self.tasks.ack(*(t.id for t in covered))
 
     async def process_task(self, task: dict):
         task_type = task.get("task_type")
@@ -80,11 +139,11 @@ class RoutePlanner:
 
         logger.info(f"Planning new route for Shipment {shipment_id} due to {reason_data.get('event_type', 'UNKNOWN')}")
         
-        # Fetch shipment details
-        shipments = await self.db.get_active_shipments()
-        # Find specific shipment (inefficient fetch all, but ok for prototype)
-        shipment = next((s for s in shipments if str(s['id']) == shipment_id), None)
-        
+        # Fetch shipment details (primary key lookup, only the fields the prompt uses)
+        shipment = await self.db.get_shipment(
+            shipment_id, columns=["vessel_name", "origin_port", "destination_port"]
+        )
+
         if not shipment:
             logger.error(f"Shipment {shipment_id} not found in DB")
             return
@@ -98,11 +157,11 @@ class RoutePlanner:
         Current Status: AT_RISK
         Disruption Reason: {reason_data}
         
-        1. Use the 'find_route' tool to get the standard route.
-        2. Use the 'find_route' tool again with 'avoid_nodes' if the disruption implies a blockage (e.g., if reason is 'Suez Canal Blockage', avoid 'Suez Canal').
-        3. If no specific blockage, try to find an alternative route via a different hub (e.g., via Cape of Good Hope if Suez is risky).
-        4. Calculate Carbon Emissions for each route using 'calculate_carbon'.
-        5. Return a JSON object with 2-3 options.
+        1. Call the 'find_alternatives' tool ONCE with k=3. Pass 'avoid_nodes' if the disruption implies a blockage
+           (e.g., if reason is 'Suez Canal Blockage', avoid 'Suez Canal').
+           It returns ranked, distinct routes with distance_km, estimated_days and carbon_kg already computed.
+        2. Add a short risk_analysis to each option based on the disruption.
+        3. Return a JSON object with the 2-3 options.
         
         Output Format:
         {{
@@ -125,10 +184,22 @@ class RoutePlanner:
         """
         
         try:
-            # Run Agent
-            # Note: CodeAgent runs synchronously. We might want to offload to thread if blocking event loop too much.
-            # For now, simplistic approach.
-            result = self.agent.run(prompt)
+            inputs = {
+                "origin_port": shipment['origin_port'],
+                "destination_port": shipment['destination_port'],
+                # Everything about the disruption the prompt shows (type, factors,
+                # location, description...) except per-shipment/per-event bookkeeping
+                "disruption": {
+                    k: (set(v) if k == "risk_factors" and isinstance(v, list) else v)
+                    for k, v in reason_data.items() if k not in VOLATILE_REASON_FIELDS
+                },
+            }
+            result = await self.llm_cache.get(inputs, bypass=bool(task.get("no_cache")))
+            if result is None:
+                # Run Agent on a pooled instance in the executor (bounded by task_timeout)
+                result = await self.agents.run(prompt, timeout=self.task_timeout)
+                if isinstance(result, dict) and "options" in result:
+                    await self.llm_cache.set(inputs, result)
             logger.info(f"Agent generated plan: {result}")
             
             # Save to DB
@@ -145,12 +216,23 @@ class RoutePlanner:
                 # Fix variable scope
                 audit_task["shipment_id"] = shipment_id 
                 
-                self.redis_client.rpush("agent:task:carbon_audit", json.dumps(audit_task))
+                await self.audit_tasks.publish(audit_task)
                 logger.info("Chained task: Pushed to Carbon Auditor queue")
             
+        except asyncio.TimeoutError:
+            raise
         except Exception as e:
             logger.error(f"Agent failed to plan route: {e}")
+            raise
 
-if __name__ == "__main__":
+async def main():
     planner = RoutePlanner()
-    asyncio.run(planner.run())
+    try:
+        await planner.run()
+    finally:
+        planner.agents.shutdown()
+        await close_redis()
+        await close_pool()
+
+if __name__ == "__main__":
+    asyncio.run(main())
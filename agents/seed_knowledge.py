@@ -5,31 +5,54 @@ import sys
 current_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(current_dir)
 
+import json
 import asyncio
 from rag_manager import RAGManager
+from db import close_pool
 
-async def seed():
+def read_jsonl(path: str):
+    """Stream {"content", "source", ...metadata} documents from a JSONL file without loading it whole"""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+async def seed(path: str = None):
     rag = RAGManager()
     
-    docs = [
+    docs = read_jsonl(path) if path else [
         {
             "content": "EU ETS 2025: Shipping companies must surrender allowances for 40% of verified emissions reported for 2024. By 2027, this increases to 100%.",
-            "source": "EU Commission Directive 2023/959"
+            "source": "EU Commission Directive 2023/959",
+            "jurisdiction": "EU",
+            "regulation": "2023/959",
+            "effective_date": "2024-01-01"
         },
         {
             "content": "Scope 3 Emissions: Logistics providers must report indirect emissions from transportation and distribution. The carbon intensity cap for container ships is 8g CO2/ton-km.",
-            "source": "CSRD Reporting Standard E1"
+            "source": "CSRD Reporting Standard E1",
+            "jurisdiction": "EU",
+            "regulation": "ESRS E1",
+            "effective_date": "2024-01-01"
         },
         {
             "content": "Carbon Border Adjustment Mechanism (CBAM): Importers of cement, iron, steel, aluminum, fertilizers, electricity and hydrogen must buy certificates corresponding to the carbon price that would have been paid had the goods been produced under the EU's carbon pricing rules.",
-            "source": "Regulation (EU) 2023/956"
+            "source": "Regulation (EU) 2023/956",
+            "jurisdiction": "EU",
+            "regulation": "2023/956",
+            "effective_date": "2023-10-01"
         }
     ]
     
     print("Seeding Knowledge Base...")
-    for doc in docs:
-        await rag.ingest_document(doc["content"], doc["source"])
-    print("Seeding Complete.")
+    try:
+        stats = await rag.ingest_documents(docs)
+        # Build (or re-train, for IVFFlat) the ANN index after bulk loads
+        await rag.ensure_index()
+    finally:
+        await close_pool()
+    print(f"Seeding Complete: {stats}")
 
 if __name__ == "__main__":
-    asyncio.run(seed())
+    # Optional: python seed_knowledge.py regulations.jsonl
+    asyncio.run(seed(sys.argv[1] if len(sys.argv) > 1 else None))
@@ -8,18 +8,12 @@ sys.path.append(current_dir)
 import json
 import time
 import asyncio
-import redis
-from db import ShipmentDB
-
-# Configuration
-REDIS_HOST = "localhost"
-REDIS_PORT = 6379
+from db import ShipmentDB, close_pool
+from utils.redis_client import get_redis, close_redis
 
 async def reset_db(db):
     print("[SIM] Resetting DB constraints and seeding test shipment...")
-    import asyncpg
-    conn = await asyncpg.connect(db.dsn)
-    try:
+    async with db.connection() as conn:
         # Create test shipment
         await conn.execute("""
             INSERT INTO active_shipments (id, vessel_name, origin_port, destination_port, status)
@@ -29,10 +23,8 @@ async def reset_db(db):
         # Clear previous history
         await conn.execute("DELETE FROM route_history WHERE shipment_id = 'e2e-test-shipment'")
         await conn.execute("DELETE FROM audit_reports WHERE shipment_id = 'e2e-test-shipment'")
-    finally:
-        await conn.close()
 
-def inject_high_risk_event(r):
+async def inject_high_risk_event(r):
     event = {
         "event_type": "HIGH_RISK_DETECTED",
         "shipment_id": "e2e-test-shipment",
@@ -41,17 +33,15 @@ def inject_high_risk_event(r):
         "detected_at": time.strftime("%Y-%m-%dT%H:%M:%SZ")
     }
     print(f"[SIM] Injecting High Risk Event: {json.dumps(event)}")
-    r.lpush("event:queue:high_priority", json.dumps(event))
+    await r.lpush("event:queue:high_priority", json.dumps(event))
 
 async def monitor_progress(db):
     print("[SIM] Monitoring progress...")
     
-    import asyncpg
     # Wait for Route Plan
     for i in range(30):
-        conn = await asyncpg.connect(db.dsn)
-        routes = await conn.fetchval("SELECT count(*) FROM route_history WHERE shipment_id = 'e2e-test-shipment'")
-        await conn.close()
+        async with db.connection() as conn:
+            routes = await conn.fetchval("SELECT count(*) FROM route_history WHERE shipment_id = 'e2e-test-shipment'")
         if routes > 0:
             print("[SIM] ✅ Route Planner produced alternatives!")
             break
@@ -63,9 +53,8 @@ async def monitor_progress(db):
 
     # Wait for Audit
     for i in range(30):
-        conn = await asyncpg.connect(db.dsn)
-        audits = await conn.fetchval("SELECT count(*) FROM audit_reports WHERE shipment_id = 'e2e-test-shipment'")
-        await conn.close()
+        async with db.connection() as conn:
+            audits = await conn.fetchval("SELECT count(*) FROM audit_reports WHERE shipment_id = 'e2e-test-shipment'")
         if audits > 0:
             print("[SIM] ✅ Carbon Auditor produced report!")
             break
@@ -79,11 +68,15 @@ async def monitor_progress(db):
 
 async def run_simulation():
     db = ShipmentDB()
-    r = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
+    r = get_redis()
     
-    await reset_db(db)
-    inject_high_risk_event(r)
-    await monitor_progress(db)
+    try:
+        await reset_db(db)
+        await inject_high_risk_event(r)
+        await monitor_progress(db)
+    finally:
+        await close_redis()
+        await close_pool()
 
 if __name__ == "__main__":
     asyncio.run(run_simulation())
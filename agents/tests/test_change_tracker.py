@@ -0,0 +1,53 @@
+import sys
+import os
+from datetime import datetime
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from change_tracker import ShipmentChangeTracker
+
+def make_shipment(lon=103.8, lat=1.35, eta="2025-12-25"):
+    return {"id": "ship-1", "lat": lat, "lon": lon, "eta": eta}
+
+def test_unchanged_shipment_is_skipped():
+    tracker = ShipmentChangeTracker(move_threshold_km=50, disruption_radius_km=500, max_staleness_s=3600)
+    shipment = make_shipment()
+    assert tracker.select_due([shipment]) == [shipment]
+
+    tracker.record(shipment)
+    # Small drift within threshold
+    assert tracker.select_due([make_shipment(lon=103.85)]) == []
+
+def test_changes_trigger_rescan():
+    tracker = ShipmentChangeTracker(move_threshold_km=50, disruption_radius_km=500, max_staleness_s=3600)
+    tracker.record(make_shipment())
+
+    assert tracker.change_reason(make_shipment(lon=106.0)) == "moved"
+    assert tracker.change_reason(make_shipment(eta="2025-12-30")) == "eta_changed"
+    assert tracker.change_reason(make_shipment(), now=tracker._fingerprints["ship-1"]["scanned_at"] + 7200) == "stale"
+
+def test_nearby_disruption_triggers_rescan_and_advances_cursor():
+    tracker = ShipmentChangeTracker(move_threshold_km=50, disruption_radius_km=500, max_staleness_s=3600)
+    shipment = make_shipment()
+    tracker.record(shipment)
+
+    created = datetime(2025, 1, 1, 12, 0)
+    far = {"lat": 51.9, "lon": 4.05, "created_at": created}
+    assert tracker.select_due([shipment], [far]) == []
+    assert tracker.disruption_cursor == created
+
+    near = {"lat": 1.5, "lon": 104.0, "created_at": created}
+    assert tracker.select_due([shipment], [near]) == [shipment]
+
+def test_disruption_trigger_survives_a_failed_scan():
+    tracker = ShipmentChangeTracker(move_threshold_km=50, disruption_radius_km=500, max_staleness_s=3600)
+    shipment = make_shipment()
+    tracker.record(shipment)
+
+    near = {"lat": 1.5, "lon": 104.0, "created_at": datetime(2025, 1, 1, 12, 0)}
+    assert tracker.select_due([shipment], [near]) == [shipment]
+    # Scan failed (no record); the cursor moved past the event, but it stays due
+    assert tracker.select_due([shipment], []) == [shipment]
+
+    tracker.record(shipment)
+    assert tracker.select_due([shipment], []) == []
@@ -0,0 +1,39 @@
+import pytest
+import sys
+import os
+from contextlib import asynccontextmanager
+from unittest.mock import AsyncMock
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from db import ShipmentDB
+
+SHIPMENT_ID = "3f1c2b9e-8d4a-4c3e-9b1a-0e5f6a7b8c9d"
+
+def make_db():
+    db = ShipmentDB(dsn="postgresql://test")
+    conn = AsyncMock()
+    conn.fetchrow.return_value = {"id": SHIPMENT_ID}
+    conn.fetch.return_value = [{"id": SHIPMENT_ID}]
+
+    @asynccontextmanager
+    async def connection():
+        yield conn
+    db.connection = connection
+    return db, conn
+
+@pytest.mark.asyncio
+async def test_get_shipment_with_non_uuid_id_is_missing():
+    db, conn = make_db()
+    assert await db.get_shipment("not-a-uuid") is None
+    conn.fetchrow.assert_not_called()
+    assert await db.get_shipment(SHIPMENT_ID) == {"id": SHIPMENT_ID}
+
+@pytest.mark.asyncio
+async def test_get_shipments_skips_non_uuid_ids():
+    db, conn = make_db()
+    assert await db.get_shipments(["ship-1"]) == []
+    conn.fetch.assert_not_called()
+
+    await db.get_shipments(["ship-1", SHIPMENT_ID])
+    assert conn.fetch.call_args.args[1] == [SHIPMENT_ID]
@@ -0,0 +1,95 @@
+import pytest
+import sys
+import os
+import asyncio
+import tempfile
+from unittest.mock import patch
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from utils import embeddings
+from utils.embeddings import MicroBatcher, RemoteEmbedder
+from embedding_service import EmbeddingService
+
+def fake_encode(calls):
+    def encode(texts, batch_size=64):
+        calls.append(list(texts))
+        return np.array([[float(len(t)), 1.0] for t in texts], dtype=np.float32)
+    return encode
+
+def test_model_is_not_loaded_until_first_encode():
+    from rag_manager import RAGManager
+    with patch("rag_manager.ShipmentDB"):
+        RAGManager()
+    assert embeddings._model is None
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_share_one_encode():
+    calls = []
+    batcher = MicroBatcher(fake_encode(calls), max_batch=100, max_wait_s=0.01)
+
+    results = await asyncio.gather(*(batcher.submit(["a" * i, "b"]) for i in range(1, 6)))
+
+    assert len(calls) == 1 and len(calls[0]) == 10
+    # Each caller gets back only its own rows, in order
+    for i, result in enumerate(results, start=1):
+        assert result[:, 0].tolist() == [float(i), 1.0]
+
+@pytest.mark.asyncio
+async def test_full_batch_flushes_without_waiting():
+    calls = []
+    batcher = MicroBatcher(fake_encode(calls), max_batch=4, max_wait_s=10)
+    result = await asyncio.wait_for(batcher.submit(["a", "b", "c", "d"]), timeout=1)
+    assert result.shape == (4, 2)
+
+@pytest.mark.asyncio
+async def test_service_round_trip_over_unix_socket():
+    calls = []
+    path = os.path.join(tempfile.mkdtemp(), "embed.sock")
+    service = EmbeddingService(path, MicroBatcher(fake_encode(calls), max_batch=64, max_wait_s=0.01))
+    server = await service.start()
+    try:
+        client = RemoteEmbedder(path)
+        first, second = await asyncio.gather(client.encode(["hello"]), client.encode(["hi", "there"]))
+        assert first.tolist() == [[5.0, 1.0]]
+        assert second[:, 0].tolist() == [2.0, 5.0]
+        assert service.batcher.batches == 1
+    finally:
+        server.close()
+        await server.wait_closed()
+
+@pytest.mark.asyncio
+async def test_client_falls_back_per_call_and_retries_the_service():
+    calls = []
+    path = os.path.join(tempfile.mkdtemp(), "embed.sock")
+    client = RemoteEmbedder(path, timeout_s=1, retry_s=0)
+    client._fallback.encode = lambda texts, batch_size=64: asyncio.sleep(0, np.zeros((len(texts), 2), dtype=np.float32))
+
+    # Service not up yet: served locally
+    assert (await client.encode(["hello"])).tolist() == [[0.0, 0.0]]
+
+    service = EmbeddingService(path, MicroBatcher(fake_encode(calls), max_batch=64, max_wait_s=0.01))
+    server = await service.start()
+    try:
+        # Once it is, the next call goes to the shared host again
+        assert (await client.encode(["hello"])).tolist() == [[5.0, 1.0]]
+    finally:
+        server.close()
+        await server.wait_closed()
+
+@pytest.mark.asyncio
+async def test_hung_service_times_out():
+    path = os.path.join(tempfile.mkdtemp(), "embed.sock")
+
+    async def never_answer(reader, writer):
+        await asyncio.sleep(10)
+
+    server = await asyncio.start_unix_server(never_answer, path=path)
+    try:
+        client = RemoteEmbedder(path, timeout_s=0.1, retry_s=60)
+        client._fallback.encode = lambda texts, batch_size=64: asyncio.sleep(0, np.ones((len(texts), 2), dtype=np.float32))
+        assert (await asyncio.wait_for(client.encode(["hi"]), 2)).tolist() == [[1.0, 1.0]]
+    finally:
+        server.close()
@@ -0,0 +1,44 @@
+import pytest
+import sys
+import os
+
+import fakeredis
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from event_gate import HighRiskEventGate
+
+@pytest.mark.asyncio
+async def test_repeated_high_risk_is_suppressed_until_it_changes():
+    r = fakeredis.FakeAsyncRedis(decode_responses=True)
+    gate = HighRiskEventGate(cooldown_s=3600, bands=[0.7, 0.85, 0.95])
+
+    assert await gate.should_emit(r, "ship-1", 0.75, ["Typhoon"]) == "new"
+    assert await gate.should_emit(r, "ship-1", 0.78, ["typhoon "]) is None
+    assert await gate.should_emit(r, "ship-1", 0.9, ["Typhoon"]) == "escalated"
+    # Dropping back within the band is not news
+    assert await gate.should_emit(r, "ship-1", 0.8, ["Typhoon"]) is None
+    assert await gate.should_emit(r, "ship-1", 0.8, ["Typhoon", "Port Closure"]) == "factors_changed"
+
+@pytest.mark.asyncio
+async def test_reset_and_cooldown_expiry_allow_new_event():
+    r = fakeredis.FakeAsyncRedis(decode_responses=True)
+    gate = HighRiskEventGate(cooldown_s=3600)
+
+    assert await gate.should_emit(r, "ship-1", 0.8, ["Typhoon"]) == "new"
+    await gate.reset(r, "ship-1")
+    assert await gate.should_emit(r, "ship-1", 0.8, ["Typhoon"]) == "new"
+
+    assert await r.ttl(gate.key("ship-1")) > 0
+    await r.delete(gate.key("ship-1"))  # cooldown elapsed
+    assert await gate.should_emit(r, "ship-1", 0.8, ["Typhoon"]) == "new"
+
+@pytest.mark.asyncio
+async def test_concurrent_scouts_emit_once():
+    import asyncio
+    r = fakeredis.FakeAsyncRedis(decode_responses=True)
+    gate = HighRiskEventGate(cooldown_s=3600)
+
+    results = await asyncio.gather(*(gate.should_emit(r, "ship-1", 0.8, ["Typhoon"]) for _ in range(5)))
+    assert results.count("new") == 1
+    assert results.count(None) == 4
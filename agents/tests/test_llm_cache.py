@@ -0,0 +1,43 @@
+import pytest
+import sys
+import os
+from datetime import datetime
+
+import fakeredis
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from utils.llm_cache import AgentResultCache
+
+def test_key_ignores_ordering_whitespace_and_float_noise():
+    cache = AgentResultCache("route_planner", model="m", backend="off")
+    a = {"origin_port": "Shanghai", "risk_factors": {"Typhoon", "Port Closure"}, "distance": 1234.000001}
+    b = {"risk_factors": {"Port Closure", "Typhoon"}, "distance": 1234.0, "origin_port": " Shanghai "}
+    assert cache.key(a) == cache.key(b)
+    assert cache.key(a) != cache.key({**a, "origin_port": "Ningbo"})
+    assert cache.key(a) != AgentResultCache("route_planner", model="other", backend="off").key(a)
+
+@pytest.mark.asyncio
+async def test_redis_backend_hits_misses_and_bypass():
+    r = fakeredis.FakeAsyncRedis(decode_responses=True)
+    cache = AgentResultCache("risk_scout", backend="redis", redis_client=r, ttl_s=60)
+    inputs = {"id": "ship-1", "eta": datetime(2025, 12, 25)}
+
+    assert await cache.get(inputs) is None
+    await cache.set(inputs, {"risk_score": 0.8})
+    assert await cache.get(inputs) == {"risk_score": 0.8}
+    assert await cache.get(inputs, bypass=True) is None
+    assert cache.stats() == {"hits": 1, "misses": 1, "hit_rate": 0.5}
+    assert 0 < await r.ttl(f"llm:risk_scout:{cache.key(inputs)}") <= 60
+
+@pytest.mark.asyncio
+async def test_disk_backend_expires_entries(tmp_path):
+    cache = AgentResultCache("carbon_auditor", backend="disk", cache_dir=str(tmp_path), ttl_s=60)
+    inputs = {"route_options": [{"route_name": "Cape Route", "distance_km": 24000}]}
+
+    await cache.set(inputs, {"compliance_status": "COMPLIANT"})
+    assert await cache.get(inputs) == {"compliance_status": "COMPLIANT"}
+
+    cache.ttl_s = -1
+    await cache.set(inputs, {"compliance_status": "COMPLIANT"})
+    assert await cache.get(inputs) is None
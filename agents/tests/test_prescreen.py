@@ -0,0 +1,54 @@
+import sys
+import os
+from datetime import datetime, timedelta, timezone
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from prescreen import RiskPreScreener
+
+def make_shipment(shipment_id, wind=None, lon=100.0, lat=5.0, eta_days=30):
+    return {
+        "id": shipment_id,
+        "lat": lat, "lon": lon,
+        "destination_port": "Singapore",
+        "eta": datetime.now(timezone.utc) + timedelta(days=eta_days),
+        "max_wind_m_s": wind
+    }
+
+def test_calm_weather_is_settled():
+    screener = RiskPreScreener(low_threshold=0.4, disruption_radius_km=500)
+    settled, escalate = screener.split([make_shipment("calm", wind=5.0)])
+    assert escalate == []
+    shipment, score, factors = settled[0]
+    assert shipment["id"] == "calm"
+    assert score < 0.4
+    assert factors == []
+
+def test_storm_unknown_weather_and_disruption_escalate():
+    screener = RiskPreScreener(low_threshold=0.4, disruption_radius_km=500)
+    shipments = [
+        make_shipment("storm", wind=22.0),
+        make_shipment("unknown", wind=None),
+        make_shipment("near-event", wind=5.0, lon=60.0, lat=20.0),
+        make_shipment("late", wind=5.0, eta_days=0.1),
+    ]
+    disruptions = [{"lat": 20.1, "lon": 60.1, "severity": "CRITICAL"}]
+    settled, escalate = screener.split(shipments, disruptions)
+    assert settled == []
+    assert [s["id"] for s in escalate] == ["storm", "unknown", "near-event", "late"]
+
+def test_scores_are_vectorized_over_fleet():
+    screener = RiskPreScreener(low_threshold=0.4, disruption_radius_km=500)
+    shipments = [make_shipment(str(i), wind=float(i % 25)) for i in range(5000)]
+    scores = screener.score(shipments)
+    assert scores["combined"].shape == (5000,)
+    assert scores["weather"][21] == 0.95
+
+def test_aware_eta_is_measured_from_the_given_now():
+    now = datetime(2024, 1, 1, 12, 0)
+    eta = datetime(2024, 1, 2, 12, 0, tzinfo=timezone(timedelta(hours=8)))
+    # Naive now is UTC: the ETA is 04:00 UTC on the 2nd
+    assert RiskPreScreener._hours_until(eta, now) == 16.0
+    assert RiskPreScreener._hours_until(eta.isoformat(), now.replace(tzinfo=timezone.utc)) == 16.0
+    # Naive DB ETA (UTC) against the default aware clock
+    assert RiskPreScreener._hours_until(datetime(2024, 1, 2, 4, 0), now.replace(tzinfo=timezone.utc)) == 16.0
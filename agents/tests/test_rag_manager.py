@@ -0,0 +1,361 @@
+import pytest
+import sys
+import os
+from contextlib import asynccontextmanager
+from unittest.mock import patch
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from rag_manager import RAGManager, chunk_text
+
+class FakeEmbedder:
+    def __init__(self):
+        self.calls = []
+
+    async def encode(self, texts, batch_size=64):
+        self.calls.append(len(texts))
+        return np.zeros((len(texts), 384), dtype=np.float32)
+
+class FakeKnowledgeDB:
+    """Stands in for ShipmentDB: knowledge_base rows keyed by content_hash"""
+    def __init__(self):
+        self.dsn = "postgresql://test"
+        self.rows = {}
+        self.writes = 0
+        self.notifications = 0
+
+    @asynccontextmanager
+    async def connection(self):
+        yield self
+
+    async def fetch(self, query, hashes):
+        return [
+            {"content_hash": h, "jurisdiction": self.rows[h][3], "regulation": self.rows[h][4], "effective_date": self.rows[h][5]}
+            for h in hashes if h in self.rows
+        ]
+
+    async def execute(self, query, *args):
+        if "pg_notify" in query:
+            self.notifications += 1
+        if query.strip().startswith("DELETE"):
+            sources, hashes = args
+            stale = [h for h, row in self.rows.items() if row[0] in sources and h not in hashes]
+            for digest in stale:
+                del self.rows[digest]
+            return f"DELETE {len(stale)}"
+
+    async def fetchmany(self, query, rows):
+        self.writes += 1
+        written = []
+        if query.strip().startswith("UPDATE"):
+            for digest, *metadata in rows:
+                if digest in self.rows and list(self.rows[digest][3:]) != metadata:
+                    self.rows[digest] = (*self.rows[digest][:3], *metadata)
+                    written.append({"?column?": 1})
+            return written
+        for content, source, embedding, digest, index, *metadata in rows:
+            if digest not in self.rows:
+                self.rows[digest] = (source, index, content, *metadata)
+                written.append({"inserted": True})
+        return written
+
+def test_chunks_respect_limit_and_overlap():
+    text = " ".join(f"Sentence {i} on emission allowances." for i in range(100))
+    chunks = chunk_text(text, max_chars=200, overlap=40)
+    assert len(chunks) > 1
+    assert all(len(c) <= 200 for c in chunks)
+    # Neighbouring chunks share context
+    assert chunks[1].split(". ")[0] in chunks[0]
+    assert chunk_text("Short rule.", max_chars=200) == ["Short rule."]
+
+@pytest.mark.asyncio
+async def test_bulk_ingest_batches_and_skips_unchanged_chunks():
+    with patch("rag_manager.get_embedder", FakeEmbedder), patch("rag_manager.ShipmentDB", FakeKnowledgeDB):
+        rag = RAGManager()
+        docs = [{"content": f"Rule {i}. " * 150, "source": f"doc-{i}"} for i in range(20)]
+
+        stats = await rag.ingest_documents(docs, batch_size=16)
+        assert stats["documents"] == 20
+        assert stats["inserted"] == len(rag.db.rows) == stats["chunks"] - stats["skipped"]
+        # One encode call per batch rather than per chunk
+        assert len(rag.embedder.calls) < stats["chunks"]
+
+        encoded_before = sum(rag.embedder.calls)
+        assert rag.db.notifications == rag.db.writes
+        again = await rag.ingest_documents(docs, batch_size=16)
+        assert again["inserted"] == 0
+        assert sum(rag.embedder.calls) == encoded_before
+
+def test_chunks_never_exceed_limit_with_overlap():
+    text = " ".join(("word " * 30).strip() + "." for _ in range(20))  # ~150-char sentences
+    for max_chars, overlap in [(200, 40), (200, 199), (160, 100)]:
+        assert all(len(c) <= max_chars for c in chunk_text(text, max_chars=max_chars, overlap=overlap))
+    with pytest.raises(ValueError):
+        chunk_text(text, max_chars=200, overlap=200)
+
+@pytest.mark.asyncio
+async def test_reingesting_a_changed_source_removes_superseded_chunks():
+    with patch("rag_manager.get_embedder", FakeEmbedder), patch("rag_manager.ShipmentDB", FakeKnowledgeDB):
+        rag = RAGManager()
+        await rag.ingest_documents([
+            {"content": "Allowances cover 40% of 2024 emissions.", "source": "ets"},
+            {"content": "CBAM applies to steel.", "source": "cbam"},
+        ])
+        stats = await rag.ingest_documents([{"content": "Allowances cover 70% of 2025 emissions.", "source": "ets"}])
+
+        assert stats["removed"] == 1
+        contents = sorted(row[2] for row in rag.db.rows.values())
+        # Other sources are untouched
+        assert contents == ["Allowances cover 70% of 2025 emissions.", "CBAM applies to steel."]
+
+@pytest.mark.asyncio
+async def test_single_document_ingest_appends_to_its_source():
+    with patch("rag_manager.get_embedder", FakeEmbedder), patch("rag_manager.ShipmentDB", FakeKnowledgeDB):
+        rag = RAGManager()
+        await rag.ingest_document("Allowances cover 40% of 2024 emissions.", "ets")
+        await rag.ingest_document("Shipping joined the ETS in 2024.", "ets")
+        assert len(rag.db.rows) == 2
+
+        await rag.ingest_document("Allowances cover 70% of 2025 emissions.", "ets", replace_source=True)
+        assert [row[2] for row in rag.db.rows.values()] == ["Allowances cover 70% of 2025 emissions."]
+
+@pytest.mark.asyncio
+async def test_reingest_updates_metadata_without_reembedding():
+    from datetime import date
+
+    with patch("rag_manager.get_embedder", FakeEmbedder), patch("rag_manager.ShipmentDB", FakeKnowledgeDB):
+        rag = RAGManager()
+        # Stored before the metadata columns were populated
+        await rag.ingest_documents([{"content": "Shipping joined the ETS in 2024.", "source": "ets"}])
+        encoded = sum(rag.embedder.calls)
+
+        doc = {"content": "Shipping joined the ETS in 2024.", "source": "ets",
+               "jurisdiction": "EU", "regulation": "2023/959", "effective_date": "2024-01-01"}
+        stats = await rag.ingest_documents([doc])
+        assert stats["updated"] == 1 and stats["inserted"] == 0
+        assert sum(rag.embedder.calls) == encoded
+        (row,) = rag.db.rows.values()
+        assert row[3:] == ("EU", "2023/959", date(2024, 1, 1))
+
+        assert (await rag.ingest_documents([doc]))["skipped"] == 1
+
+class RacingKnowledgeDB(FakeKnowledgeDB):
+    """Another ingest stores the same chunks between our existence check and insert"""
+    async def fetch(self, query, hashes):
+        return []
+
+@pytest.mark.asyncio
+async def test_inserted_counts_only_rows_written():
+    with patch("rag_manager.get_embedder", FakeEmbedder), patch("rag_manager.ShipmentDB", RacingKnowledgeDB):
+        rag = RAGManager()
+        docs = [{"content": "CBAM applies to steel.", "source": "cbam"}]
+        assert (await rag.ingest_documents(docs))["inserted"] == 1
+
+        generation = rag.generation
+        stats = await rag.ingest_documents(docs)
+        assert stats["inserted"] == 0 and stats["skipped"] == 1
+        assert rag.generation == generation
+
+class RecordingConn:
+    def __init__(self):
+        self.statements = []
+        self.in_transaction = False
+
+    @asynccontextmanager
+    async def transaction(self):
+        self.in_transaction = True
+        yield
+        self.in_transaction = False
+
+    async def execute(self, query, *args):
+        assert self.in_transaction
+        self.statements.append((query, args))
+
+    async def fetch(self, query, *args):
+        assert self.in_transaction
+        self.statements.append((query, args))
+        return [{"id": 1, "content": "EU ETS", "source": "doc", "distance": 0.1}]
+
+@pytest.mark.asyncio
+async def test_search_settings_are_scoped_to_the_query():
+    from rag_manager import search_embeddings
+
+    conn = RecordingConn()
+    rows = await search_embeddings(conn, np.zeros(384), limit=50, ef_search=20, probes=7)
+    assert rows[0]["content"] == "EU ETS"
+    set_config, args = conn.statements[0]
+    assert "set_config('hnsw.ef_search', $1, true)" in set_config
+    # ef_search is raised to the limit so HNSW can return enough rows
+    assert args == ("50", "7")
+
+    conn = RecordingConn()
+    await search_embeddings(conn, np.zeros(384), limit=3, exact=True)
+    assert any("enable_indexscan = off" in q for q, _ in conn.statements)
+
+def test_filters_are_parameterized_sql():
+    from datetime import date
+    from rag_manager import filter_clause
+
+    where, args = filter_clause({"jurisdiction": "EU", "as_of": "2025-06-01", "source": None}, 6)
+    assert where == " AND (effective_date IS NULL OR effective_date <= $6) AND jurisdiction = ANY($7)"
+    assert args == [date(2025, 6, 1), ["EU"]]
+    with pytest.raises(ValueError):
+        filter_clause({"country": "NL"}, 1)
+
+class HybridConn(RecordingConn):
+    """Vector and lexical candidate queries return different rankings"""
+    def __init__(self, vector_ids, lexical_ids):
+        super().__init__()
+        self.vector_ids, self.lexical_ids = vector_ids, lexical_ids
+
+    async def fetch(self, query, *args):
+        await super().fetch(query, *args)
+        ids = self.lexical_ids if "content_tsv" in query else self.vector_ids
+        return [{"id": i, "content": f"chunk {i}", "source": "doc", "distance": 0.5} for i in ids]
+
+@pytest.mark.asyncio
+async def test_hybrid_search_surfaces_lexical_only_hits():
+    from rag_manager import hybrid_search
+
+    # "reg-959" quotes the regulation id but is no nearest neighbour
+    conn = HybridConn(vector_ids=["a", "b", "c", "d"], lexical_ids=["reg-959", "b"])
+    rows = await hybrid_search(conn, np.zeros(384), "EU ETS caps Directive 2023/959", limit=3,
+                               filters={"regulation": ["2023/959"]})
+    ids = [row["id"] for row in rows]
+    assert ids[0] == "b"  # ranked by both sides
+    assert "reg-959" in ids
+
+    statements = [q for q, _ in conn.statements]
+    lexical = next(q for q in statements if "content_tsv" in q)
+    assert "replace(plainto_tsquery('english', $3)::text, ' & ', ' | ')" in lexical
+    # Filters reach both candidate queries, and filtered ANN scans iterate
+    assert "regulation = ANY($4)" in lexical
+    assert any("regulation = ANY($3)" in q and "content_tsv" not in q for q in statements)
+    assert any("iterative_scan" in q for q in statements)
+
+def test_ivfflat_lists_follow_corpus_size():
+    from rag_manager import ivfflat_lists
+    assert ivfflat_lists(0) == 1
+    assert ivfflat_lists(50_000) == 50
+    assert ivfflat_lists(4_000_000) == 2000
+
+@pytest.mark.asyncio
+async def test_repeated_queries_hit_caches_until_ingest():
+    searches = []
+
+    async def fake_search(conn, embedding, limit, *args):
+        searches.append(limit)
+        return [{"id": len(searches), "content": "EU ETS 2025", "source": "doc", "distance": 0.1}]
+
+    with patch("rag_manager.get_embedder", FakeEmbedder), \
+         patch("rag_manager.ShipmentDB", FakeKnowledgeDB), \
+         patch("rag_manager.search_embeddings", fake_search), \
+         patch("rag_manager.RETRIEVAL_MODE", "vector"):
+        rag = RAGManager()
+
+        first = await rag.query_knowledge("EU ETS shipping emissions caps 2025")
+        first[0]["content"] = "mutated by caller"
+        again = await rag.query_knowledge("EU ETS  shipping emissions caps 2025 ")
+        assert again[0]["content"] == "EU ETS 2025"
+        assert len(searches) == 1
+
+        await rag.ingest_documents([{"content": "CBAM certificates apply to steel.", "source": "cbam"}])
+        await rag.query_knowledge("EU ETS shipping emissions caps 2025")
+        assert len(searches) == 2
+        # The query embedding itself survives invalidation
+        assert rag._embeddings.hits == 1
+
+class IndexCatalogConn:
+    """pg_index/pg_class lookups over a dict of index name -> valid flag"""
+    def __init__(self, indexes):
+        self.indexes = dict(indexes)
+        self.statements = []
+
+    async def fetchval(self, query, *args):
+        if "indisvalid" in query:
+            return self.indexes.get(args[0])
+        if "to_regclass" in query:
+            return args[0] in self.indexes
+        return 0
+
+    async def execute(self, query, *args):
+        self.statements.append(query)
+        if query.startswith("DROP"):
+            self.indexes.pop(query.split()[-1], None)
+        else:
+            self.indexes[query.split()[6]] = True  # CREATE INDEX CONCURRENTLY IF NOT EXISTS <name>
+
+@pytest.mark.asyncio
+async def test_ensure_index_rebuilds_invalid_and_drops_other_kind():
+    from rag_manager import ANN_INDEX_NAMES
+
+    hnsw, ivfflat = ANN_INDEX_NAMES["hnsw"], ANN_INDEX_NAMES["ivfflat"]
+    conn = IndexCatalogConn({hnsw: False})
+
+    class CatalogDB:
+        @asynccontextmanager
+        async def connection(self):
+            yield conn
+
+    with patch("rag_manager.get_embedder", FakeEmbedder), patch("rag_manager.ShipmentDB", CatalogDB):
+        rag = RAGManager()
+        # Left INVALID by a failed concurrent build: rebuilt, not trusted
+        assert await rag.ensure_index("hnsw") == hnsw
+        assert conn.statements[0] == f"DROP INDEX CONCURRENTLY IF EXISTS {hnsw}"
+        assert conn.indexes == {hnsw: True}
+
+        # Switching kinds builds the new index, then drops the old one
+        await rag.ensure_index("ivfflat")
+        assert conn.indexes == {ivfflat: True}
+
+class FakeListenerConn:
+    def __init__(self):
+        self.on_terminate = None
+        self.closed = False
+
+    async def add_listener(self, channel, callback):
+        pass
+
+    def add_termination_listener(self, callback):
+        self.on_terminate = callback
+
+    async def close(self):
+        self.closed = True
+
+@pytest.mark.asyncio
+async def test_change_listener_reconnects_after_connection_loss():
+    import asyncio
+
+    connections = []
+
+    async def connect(dsn):
+        if len(connections) == 1:
+            connections.append(None)  # database briefly unreachable
+            raise OSError("connection refused")
+        conn = FakeListenerConn()
+        connections.append(conn)
+        return conn
+
+    with patch("rag_manager.get_embedder", FakeEmbedder), patch("rag_manager.ShipmentDB", FakeKnowledgeDB), \
+         patch("asyncpg.connect", connect):
+        rag = RAGManager()
+        rag.listener_retry_s = 0.01
+        await rag.start_change_listener()
+        first = rag._listener
+        generation = rag.generation
+
+        first.on_terminate(first)
+        assert rag._listener is None
+        for _ in range(100):
+            if rag._listener is not None:
+                break
+            await asyncio.sleep(0.01)
+
+        assert rag._listener is connections[-1] and rag._listener is not first
+        # Changes missed while disconnected can't be trusted to the cache
+        assert rag.generation > generation
+
+        await rag.stop_change_listener()
+        assert connections[-1].closed and rag._reconnect is None
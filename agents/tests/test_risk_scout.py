@@ -20,13 +20,13 @@ async def test_run_analysis_flow():
             {
                 "id": "ship-123",
                 "vessel_name": "Test Vessel",
-                "current_location_wkt": "POINT(103.8 1.35)", # Singapore
+                "lat": 1.35, "lon": 103.8, # Singapore
                 "origin_port": "Shanghai",
                 "destination_port": "Rotterdam",
                 "eta": "2025-12-25"
             }
         ])
-        mock_db_instance.update_shipment_risk = AsyncMock()
+        mock_db_instance.update_shipment_risks = AsyncMock()
         
         mock_agent_instance = MockAgent.return_value
         # Mock agent output to be valid JSON
@@ -42,17 +42,120 @@ async def test_run_analysis_flow():
         
         # Instantiate System Under Test
         scout = RiskScout()
+        scout.llm_cache.backend = "off"
         
         # Run single scan
         await scout.scan_shipment({
             "id": "ship-123", 
             "vessel_name": "Test Vessel",
-            "current_location_wkt": "POINT(103.8 1.35)"
+            "lat": 1.35,
+            "lon": 103.8
         })
         
+        # Writes are buffered until flushed
+        mock_db_instance.update_shipment_risks.assert_not_called()
+        await scout.risk_writer.flush()
+
         # Verify
-        mock_db_instance.update_shipment_risk.assert_called_once()
-        call_args = mock_db_instance.update_shipment_risk.call_args
-        assert call_args[0][0] == "ship-123" # shipment_id
-        assert call_args[0][1] == 0.8        # risk_score
-        assert "Typhoon Warning" in call_args[0][2] # risk_factors
+        mock_db_instance.update_shipment_risks.assert_called_once()
+        updates = mock_db_instance.update_shipment_risks.call_args[0][0]
+        assert len(updates) == 1
+        assert updates[0][0] == "ship-123" # shipment_id
+        assert updates[0][1] == 0.8        # risk_score
+        assert "Typhoon Warning" in updates[0][2] # risk_factors
+
+@pytest.mark.asyncio
+async def test_disruption_queues_only_affected_shipments():
+    import fakeredis
+    from risk_scout import report_disruption, RESCAN_QUEUE
+
+    r = fakeredis.FakeAsyncRedis(decode_responses=True)
+    db = MagicMock()
+    db.log_disruption = AsyncMock(return_value={"id": "evt-1", "affected_shipments": ["ship-1", "ship-2"]})
+
+    event = await report_disruption(db, r, {
+        "event_type": "WEATHER_STORM", "severity": "HIGH", "location_wkt": "POINT(103.8 1.35)",
+        "description": "Typhoon", "data_source": "test"
+    })
+    assert event["affected_shipments"] == ["ship-1", "ship-2"]
+    assert await r.lrange(RESCAN_QUEUE, 0, -1) == ["ship-1", "ship-2"]
+
+    with patch("risk_scout.ShipmentDB"), patch("risk_scout.CodeAgent"), patch("risk_scout.InferenceClientModel"):
+        scout = RiskScout()
+        await r.rpush(RESCAN_QUEUE, "ship-1")  # duplicates collapse
+        assert await scout.wait_for_rescans(r, timeout=0.1) == ["ship-1", "ship-2"]
+        assert await scout.wait_for_rescans(r, timeout=0.1) == []
+
+@pytest.mark.asyncio
+async def test_prescreen_settled_shipments_clear_event_gate():
+    import fakeredis
+
+    r = fakeredis.FakeAsyncRedis(decode_responses=True)
+    with patch("risk_scout.ShipmentDB") as MockDB, patch("risk_scout.CodeAgent"), patch("risk_scout.InferenceClientModel"):
+        MockDB.return_value.get_open_disruptions = AsyncMock(return_value=[])
+        scout = RiskScout()
+        scout.risk_writer.add = AsyncMock()
+        assert await scout.event_gate.should_emit(r, "ship-1", 0.8, ["Typhoon"]) == "new"
+
+        shipment = {"id": "ship-1", "lat": 1.0, "lon": 2.0, "weather_risk": "LOW", "max_wind_m_s": 2.0}
+        scout.prescreener.split = MagicMock(return_value=([(shipment, 0.1, [])], []))
+        await scout.prescreen([shipment], r)
+
+        # Re-escalating with the same factors is news again
+        assert await scout.event_gate.should_emit(r, "ship-1", 0.8, ["Typhoon"]) == "new"
+
+@pytest.mark.asyncio
+async def test_rescan_wait_never_blocks_forever():
+    r = MagicMock()
+    r.blpop = AsyncMock(return_value=None)
+    with patch("risk_scout.ShipmentDB"), patch("risk_scout.CodeAgent"), patch("risk_scout.InferenceClientModel"):
+        scout = RiskScout()
+        assert await scout.wait_for_rescans(r, timeout=0.0001) == []
+        assert await scout.wait_for_rescans(r, timeout=0) == []
+
+    assert all(call.kwargs["timeout"] >= 0.01 for call in r.blpop.await_args_list)
+
+@pytest.mark.asyncio
+async def test_disruption_reports_are_logged_and_rescanned():
+    import json
+    import fakeredis
+    from risk_scout import DISRUPTION_QUEUE
+
+    r = fakeredis.FakeAsyncRedis(decode_responses=True)
+    with patch("risk_scout.ShipmentDB") as MockDB, patch("risk_scout.CodeAgent"), patch("risk_scout.InferenceClientModel"):
+        db = MockDB.return_value
+        db.log_disruption = AsyncMock(return_value={"id": "evt-1", "affected_shipments": ["ship-7", "ship-9"]})
+        scout = RiskScout()
+
+        report = {"event_type": "PORT_CLOSURE", "severity": "HIGH", "location_wkt": "POINT(4.05 51.9)",
+                  "description": "Rotterdam closed", "data_source": "feed"}
+        await r.rpush(DISRUPTION_QUEUE, json.dumps(report), "not json")
+        assert await scout.wait_for_rescans(r, timeout=0.5) == ["ship-7", "ship-9"]
+
+    db.log_disruption.assert_awaited_once_with(report)
+
+@pytest.mark.asyncio
+async def test_disruption_rescans_skip_cached_assessments():
+    with patch("risk_scout.ShipmentDB") as MockDB, patch("risk_scout.CodeAgent"), patch("risk_scout.InferenceClientModel"):
+        shipment = {"id": "ship-1", "vessel_name": "Test Vessel", "lat": 20.0, "lon": 60.0}
+        MockDB.return_value.get_shipments = AsyncMock(return_value=[shipment])
+        scout = RiskScout()
+        scout.prefetch_weather = AsyncMock()
+        scout.risk_writer.flush = AsyncMock()
+        scout.llm_cache.get = AsyncMock(return_value=None)
+        scout.agents.run = AsyncMock(return_value='{"risk_score": 0.2, "risk_factors": [], "recommended_action": "MONITOR"}')
+
+        # Ordinary sweep may reuse a cached assessment
+        await scout.scan_shipment(shipment)
+        assert scout.llm_cache.get.await_args.kwargs["bypass"] is False
+
+        # Flagged by a new disruption nearby: fresh assessment until scanned
+        scout.tracker.select_due([shipment], [{"lat": 20.1, "lon": 60.1, "created_at": 1}])
+        await scout.scan_shipment(shipment)
+        assert scout.llm_cache.get.await_args.kwargs["bypass"] is True
+        await scout.scan_shipment(shipment)
+        assert scout.llm_cache.get.await_args.kwargs["bypass"] is False
+
+        # Targeted rescans (after report_disruption) always bypass
+        await scout.rescan(["ship-1"], None)
+        assert scout.llm_cache.get.await_args.kwargs["bypass"] is True
@@ -0,0 +1,157 @@
+import pytest
+import sys
+import os
+import time
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+import fakeredis
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from route_planner import RoutePlanner
+
+class SlowPlanningAgent:
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def run(self, prompt):
+        time.sleep(0.3)
+        return {"options": [{"route_name": "Cape Route", "distance_km": 24000}]}
+
+@pytest.mark.asyncio
+async def test_planner_runs_tasks_concurrently(monkeypatch):
+    monkeypatch.setenv("ROUTE_PLANNER_CONCURRENCY", "4")
+    monkeypatch.setenv("TASK_BLOCK_MS", "20")
+    r = fakeredis.FakeAsyncRedis(decode_responses=True)
+
+    with patch("route_planner.get_redis", return_value=r), \
+         patch("route_planner.ShipmentDB") as MockDB, \
+         patch("route_planner.CodeAgent", SlowPlanningAgent), \
+         patch("route_planner.InferenceClientModel"):
+        db = MockDB.return_value
+        db.get_shipment = AsyncMock(return_value={
+            "id": "ship-1", "vessel_name": "Test Vessel", "origin_port": "Shanghai", "destination_port": "Rotterdam"
+        })
+        db.save_route_alternatives = AsyncMock()
+
+        planner = RoutePlanner()
+        planner.llm_cache.backend = "off"  # measure the agent runs themselves
+        for i in range(4):
+            await planner.tasks.publish({"task_type": "PLAN_NEW_ROUTE", "shipment_id": f"ship-{i}"})
+
+        started = time.monotonic()
+        worker = asyncio.create_task(planner.run())
+        while db.save_route_alternatives.await_count < 4:
+            await asyncio.sleep(0.02)
+            assert time.monotonic() - started < 5
+        elapsed = time.monotonic() - started
+
+        planner.running = False
+        await worker
+        planner.agents.shutdown()
+
+    # 4 x 0.3s runs overlapped rather than back to back
+    assert elapsed < 1.0
+    assert (await r.xpending(planner.tasks.key, planner.tasks.group))["pending"] == 0
+    assert await r.xlen(planner.audit_tasks.key) == 4
+
+@pytest.mark.asyncio
+async def test_burst_for_one_shipment_is_planned_once(monkeypatch):
+    monkeypatch.setenv("ROUTE_PLANNER_CONCURRENCY", "4")
+    monkeypatch.setenv("TASK_BLOCK_MS", "20")
+    r = fakeredis.FakeAsyncRedis(decode_responses=True)
+
+    with patch("route_planner.get_redis", return_value=r), \
+         patch("route_planner.ShipmentDB") as MockDB, \
+         patch("route_planner.CodeAgent", SlowPlanningAgent), \
+         patch("route_planner.InferenceClientModel"):
+        db = MockDB.return_value
+        db.get_shipment = AsyncMock(return_value={
+            "id": "ship-1", "vessel_name": "Test Vessel", "origin_port": "Shanghai", "destination_port": "Rotterdam"
+        })
+        db.save_route_alternatives = AsyncMock()
+
+        planner = RoutePlanner()
+        planner.llm_cache._redis = r
+        await planner.tasks.ensure_group()
+        for _ in range(3):
+            await planner.tasks.publish({"task_type": "PLAN_NEW_ROUTE", "shipment_id": "ship-1"})
+
+        worker = asyncio.create_task(planner.run())
+        started = time.monotonic()
+        while (await r.xpending(planner.tasks.key, planner.tasks.group))["pending"] or \
+                db.save_route_alternatives.await_count == 0:
+            await asyncio.sleep(0.02)
+            assert time.monotonic() - started < 5
+
+        planner.running = False
+        await worker
+        planner.agents.shutdown()
+
+    assert db.save_route_alternatives.await_count == 1
+
+@pytest.mark.asyncio
+async def test_same_lane_and_disruption_reuses_cached_plan():
+    r = fakeredis.FakeAsyncRedis(decode_responses=True)
+
+    with patch("route_planner.get_redis", return_value=r), \
+         patch("route_planner.ShipmentDB") as MockDB, \
+         patch("route_planner.CodeAgent", SlowPlanningAgent), \
+         patch("route_planner.InferenceClientModel"):
+        db = MockDB.return_value
+        db.get_shipment = AsyncMock(return_value={
+            "id": "ship-1", "vessel_name": "Test Vessel", "origin_port": "Shanghai", "destination_port": "Rotterdam"
+        })
+        db.save_route_alternatives = AsyncMock()
+
+        planner = RoutePlanner()
+        planner.llm_cache._redis = r
+        reason = {"event_type": "HIGH_RISK_DETECTED", "risk_factors": ["Suez Canal Blockage"],
+                  "location": "Suez Canal", "description": "Vessel aground"}
+        # Same disruption reported for another shipment, later, with another score
+        same = {**reason, "shipment_id": "ship-2", "risk_score": 0.91, "detected_at": "2025-01-01T12:05:00Z"}
+        # Same type and factors, different place: must not reuse the Suez plan
+        elsewhere = {**reason, "location": "Strait of Hormuz", "description": "Strait closed"}
+        with patch.object(planner.agents, "run", wraps=planner.agents.run) as run:
+            await planner.process_task({"task_type": "PLAN_NEW_ROUTE", "shipment_id": "ship-1", "reason": reason})
+            await planner.process_task({"task_type": "PLAN_NEW_ROUTE", "shipment_id": "ship-2", "reason": same})
+            await planner.process_task({"task_type": "PLAN_NEW_ROUTE", "shipment_id": "ship-3", "reason": reason, "no_cache": True})
+            await planner.process_task({"task_type": "PLAN_NEW_ROUTE", "shipment_id": "ship-4", "reason": elsewhere})
+        planner.agents.shutdown()
+
+    assert run.await_count == 3
+    assert db.save_route_alternatives.await_count == 4
+    assert planner.llm_cache.stats()["hits"] == 1
+
+@pytest.mark.asyncio
+async def test_failed_plan_stays_pending_for_retry(monkeypatch):
+    monkeypatch.setenv("ROUTE_PLANNER_TASK_TIMEOUT", "600")
+    monkeypatch.setenv("TASK_CLAIM_IDLE_MS", "300000")
+    r = fakeredis.FakeAsyncRedis(decode_responses=True)
+
+    with patch("route_planner.get_redis", return_value=r), \
+         patch("route_planner.ShipmentDB") as MockDB, \
+         patch("route_planner.CodeAgent", SlowPlanningAgent), \
+         patch("route_planner.InferenceClientModel"):
+        db = MockDB.return_value
+        db.get_shipment = AsyncMock(return_value={
+            "id": "ship-1", "vessel_name": "Test Vessel", "origin_port": "Shanghai", "destination_port": "Rotterdam"
+        })
+        db.save_route_alternatives = AsyncMock()
+
+        planner = RoutePlanner()
+        planner.llm_cache.backend = "off"
+        planner.agents.run = AsyncMock(side_effect=RuntimeError("model unavailable"))
+        # A running plan can't be reclaimed before its own timeout
+        assert planner.tasks.claim_idle_ms >= 2 * 600_000
+
+        await planner.tasks.ensure_group()
+        await planner.tasks.publish({"task_type": "PLAN_NEW_ROUTE", "shipment_id": "ship-1"})
+        task = (await planner.tasks.read())[0]
+        planner._planning["ship-1"] = [task]
+        await planner.handle_task("ship-1", task)
+        planner.agents.shutdown()
+
+    assert (await r.xpending(planner.tasks.key, planner.tasks.group))["pending"] == 1
+    assert "ship-1" not in planner._planning
@@ -0,0 +1,73 @@
+import pytest
+import sys
+import os
+import time
+import asyncio
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from utils.rate_limiter import TokenBucket
+from utils.agent_pool import AgentPool
+from unittest.mock import AsyncMock, MagicMock
+
+class SlowAgent:
+    def __init__(self, delay):
+        self.delay = delay
+        self.interrupted = False
+
+    def run(self, prompt):
+        time.sleep(self.delay)
+        return f"done: {prompt}"
+
+    def interrupt(self):
+        self.interrupted = True
+
+@pytest.mark.asyncio
+async def test_token_bucket_limits_rate():
+    bucket = TokenBucket(rate=20, capacity=2)
+    started = time.monotonic()
+    for _ in range(6):
+        await bucket.acquire()
+    # 2 burst tokens free, remaining 4 at 20/s
+    assert time.monotonic() - started >= 0.18
+
+@pytest.mark.asyncio
+async def test_agent_pool_runs_concurrently():
+    pool = AgentPool(lambda: SlowAgent(0.2), size=4)
+    started = time.monotonic()
+    results = await asyncio.gather(*(pool.run(str(i)) for i in range(4)))
+    assert time.monotonic() - started < 0.6
+    assert results == [f"done: {i}" for i in range(4)]
+    pool.shutdown()
+
+@pytest.mark.asyncio
+async def test_agent_pool_replaces_timed_out_agent():
+    pool = AgentPool(lambda: SlowAgent(0.5), size=1)
+    stuck = pool._agents[0]
+    with pytest.raises(asyncio.TimeoutError):
+        await pool.run("slow", timeout=0.05)
+    assert stuck.interrupted
+    # The abandoned agent is not handed out again
+    assert pool._queue().get_nowait() is not stuck
+    pool.shutdown()
+
+@pytest.mark.asyncio
+async def test_risk_update_buffer_flushes_in_batches():
+    from db import RiskUpdateBuffer
+    db = MagicMock()
+    db.update_shipment_risks = AsyncMock()
+    buffer = RiskUpdateBuffer(db, max_size=3, max_delay_s=60)
+
+    await buffer.add("a", 0.1, [])
+    await buffer.add("a", 0.9, ["Storm"])  # newer assessment replaces the pending one
+    await buffer.add("b", 0.2, [])
+    db.update_shipment_risks.assert_not_called()
+
+    await buffer.add("c", 0.3, [])
+    db.update_shipment_risks.assert_called_once()
+    batch = db.update_shipment_risks.call_args[0][0]
+    assert batch == [("a", 0.9, ["Storm"]), ("b", 0.2, []), ("c", 0.3, [])]
+
+    await buffer.add("d", 0.4, [])
+    await buffer.stop()
+    assert db.update_shipment_risks.call_count == 2
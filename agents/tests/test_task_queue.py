@@ -0,0 +1,79 @@
+import sys
+import os
+import asyncio
+
+import fakeredis
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from utils.task_queue import TaskQueue
+
+def make_queue(r, consumer, **kwargs):
+    return TaskQueue(r, "route_planner", consumer=consumer, mode="stream", block_ms=10, **kwargs)
+
+@pytest.mark.asyncio
+async def test_stream_batch_read_and_ack():
+    r = fakeredis.FakeAsyncRedis(decode_responses=True)
+    queue = make_queue(r, "worker-1", batch_size=10)
+    for i in range(3):
+        await queue.publish({"shipment_id": f"ship-{i}"})
+
+    tasks = await queue.read()
+    assert [t.data["shipment_id"] for t in tasks] == ["ship-0", "ship-1", "ship-2"]
+    assert await queue.read() == []
+
+    await queue.ack(*(t.id for t in tasks))
+    assert (await r.xpending(queue.key, queue.group))["pending"] == 0
+
+@pytest.mark.asyncio
+async def test_serial_batch_fits_in_claim_window():
+    r = fakeredis.FakeAsyncRedis(decode_responses=True)
+    # 60s per task, 300s before a pending task may be reclaimed: 4 back to back
+    queue = make_queue(r, "worker-1", batch_size=10, claim_idle_ms=300_000, task_timeout_s=60)
+    for i in range(10):
+        await queue.publish({"n": i})
+
+    assert len(await queue.read()) == 4
+    # Explicit counts (concurrent consumers) are left alone
+    assert len(await queue.read(count=6)) == 6
+
+@pytest.mark.asyncio
+async def test_workers_share_a_group():
+    r = fakeredis.FakeAsyncRedis(decode_responses=True)
+    a = make_queue(r, "worker-a", batch_size=2)
+    b = make_queue(r, "worker-b", batch_size=2)
+    for i in range(4):
+        await a.publish({"n": i})
+
+    seen = [t.data["n"] for t in await a.read()] + [t.data["n"] for t in await b.read()]
+    assert sorted(seen) == [0, 1, 2, 3]
+
+@pytest.mark.asyncio
+async def test_stalled_task_is_reclaimed_then_dead_lettered():
+    r = fakeredis.FakeAsyncRedis(decode_responses=True)
+    crashed = make_queue(r, "crashed", claim_idle_ms=20, max_deliveries=2)
+    await crashed.publish({"shipment_id": "ship-1"})
+    assert len(await crashed.read()) == 1  # never acked
+
+    await asyncio.sleep(0.05)
+    survivor = make_queue(r, "survivor", claim_idle_ms=20, max_deliveries=2)
+    reclaimed = await survivor.read()
+    assert [t.data["shipment_id"] for t in reclaimed] == ["ship-1"]
+
+    # Fails again: past max_deliveries it moves to the dead-letter stream
+    await asyncio.sleep(0.05)
+    survivor._next_claim = 0
+    assert await survivor.read() == []
+    assert (await r.xpending(survivor.key, survivor.group))["pending"] == 0
+    assert await r.xlen(survivor.dead_key) == 1
+
+@pytest.mark.asyncio
+async def test_list_mode_keeps_legacy_queue():
+    r = fakeredis.FakeAsyncRedis(decode_responses=True)
+    queue = TaskQueue(r, "carbon_audit", mode="list", block_ms=1000)
+    await queue.publish({"shipment_id": "ship-1"})
+    assert await r.llen("agent:task:carbon_audit") == 1
+    tasks = await queue.read()
+    assert tasks[0].data == {"shipment_id": "ship-1"}
+    await queue.ack(tasks[0].id)
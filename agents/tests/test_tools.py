@@ -1,5 +1,14 @@
 import pytest
-from tools import WeatherTool, CarbonTool, ShippingTool
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlparse
+from tools import WeatherTool, CarbonTool, ShippingTool, RoutingTool, AlternativeRoutesTool
+from tools.weather_cache import WeatherCache
+from tools import sea_lanes
+import networkx as nx
+import numpy as np
+from utils import http_client
 
 def test_weather_tool():
     tool = WeatherTool()
@@ -29,3 +38,208 @@ def test_shipping_tool():
     result = tool.forward("Singapore", "Rotterdam")
     assert "straight_line_km" in result
     assert result["estimated_sea_route_km"] > result["straight_line_km"]
+
+class _StandInOpenMeteo(BaseHTTPRequestHandler):
+    """Local stand-in for the Open-Meteo forecast endpoint"""
+    requests_seen = 0
+
+    def do_GET(self):
+        type(self).requests_seen += 1
+        query = parse_qs(urlparse(self.path).query)
+        latitudes = query["latitude"][0].split(",")
+        locations = [{"hourly": {"wind_speed_10m": [4.0, 12.5, 7.0]}} for _ in latitudes]
+        # Open-Meteo returns a list only for multi-location queries
+        body = json.dumps(locations if len(locations) > 1 else locations[0]).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def open_meteo_stand_in():
+    _StandInOpenMeteo.requests_seen = 0
+    server = HTTPServer(("127.0.0.1", 0), _StandInOpenMeteo)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/v1"
+    server.shutdown()
+
+def test_weather_tool_caches_by_grid_cell(open_meteo_stand_in):
+    tool = WeatherTool(cache=WeatherCache(resolution_deg=0.5, ttl_s=60), base_url=open_meteo_stand_in)
+
+    first = tool.forward(latitude=1.30, longitude=103.81, days_ahead=3)
+    # A few km away, same 0.5 deg cell -> served from cache
+    second = tool.forward(latitude=1.32, longitude=103.85, days_ahead=3)
+    assert first == second
+    assert first["risk_level"] == "MEDIUM"
+    assert _StandInOpenMeteo.requests_seen == 1
+
+    # Different horizon or cell -> new fetch
+    tool.forward(latitude=1.30, longitude=103.81, days_ahead=5)
+    tool.forward(latitude=10.0, longitude=103.81, days_ahead=3)
+    assert _StandInOpenMeteo.requests_seen == 3
+
+def test_weather_cache_lru_bound():
+    cache = WeatherCache(resolution_deg=1.0, ttl_s=60, max_entries=2)
+    fetch = lambda lat, lon, days: {"risk_level": "LOW", "lat": lat}
+    for lat in (0.5, 1.5, 2.5):
+        cache.get_or_fetch(lat, 0.0, 3, fetch)
+    assert len(cache.memory) == 2
+
+def test_weather_tool_batch_fetch(open_meteo_stand_in):
+    tool = WeatherTool(cache=WeatherCache(resolution_deg=0.5, ttl_s=60), base_url=open_meteo_stand_in)
+    tool.batch_size = 2
+
+    coords = [(1.30, 103.81), (1.32, 103.85), (20.0, 60.0), (40.0, -70.0), (51.9, 4.05)]
+    results = tool.fetch_batch(coords, days_ahead=3)
+
+    assert len(results) == len(coords)
+    assert all(r["risk_level"] == "MEDIUM" for r in results)
+    # 4 distinct cells, 2 per request
+    assert _StandInOpenMeteo.requests_seen == 2
+
+    # Everything is warm now, including single-point lookups
+    tool.forward(latitude=20.1, longitude=60.1, days_ahead=3)
+    tool.fetch_batch(coords, days_ahead=3)
+    assert _StandInOpenMeteo.requests_seen == 2
+
+@pytest.mark.asyncio
+async def test_weather_tool_async_batch_fetch(open_meteo_stand_in):
+    tool = WeatherTool(cache=WeatherCache(resolution_deg=0.5, ttl_s=60), base_url=open_meteo_stand_in)
+    tool.batch_size = 1
+
+    results = await tool.afetch_batch([(1.30, 103.81), (20.0, 60.0), (1.31, 103.82)])
+    assert [r["risk_level"] for r in results] == ["MEDIUM"] * 3
+    assert _StandInOpenMeteo.requests_seen == 2
+    await http_client.close_async_client()
+
+@pytest.mark.asyncio
+async def test_async_batch_uses_async_shared_tier(open_meteo_stand_in):
+    import fakeredis
+    from unittest.mock import MagicMock
+
+    shared = fakeredis.FakeAsyncRedis(decode_responses=True)
+    caches = []
+    for _ in range(2):
+        cache = WeatherCache(resolution_deg=0.5, ttl_s=60, redis_url="redis://weather-cache")
+        # The blocking client must stay off the event loop
+        cache.redis_client = MagicMock(get=MagicMock(side_effect=AssertionError), set=MagicMock(side_effect=AssertionError))
+        cache._async_redis = shared
+        caches.append(cache)
+
+    first = WeatherTool(cache=caches[0], base_url=open_meteo_stand_in)
+    await first.afetch_batch([(1.30, 103.81), (20.0, 60.0)])
+    seen = _StandInOpenMeteo.requests_seen
+
+    # Another process's cache is warm from Redis alone
+    second = WeatherTool(cache=caches[1], base_url=open_meteo_stand_in)
+    results = await second.afetch_batch([(1.31, 103.82), (20.1, 60.1)])
+    assert [r["risk_level"] for r in results] == ["MEDIUM"] * 2
+    assert _StandInOpenMeteo.requests_seen == seen
+    await http_client.close_async_client()
+
+def test_routing_tool_memoizes_per_avoidance_set():
+    tool = RoutingTool()
+    standard = tool.forward("Shanghai", "Rotterdam")
+    assert "Suez Canal" in standard["route"]
+
+    detour = tool.forward("Shanghai", "Rotterdam", avoid_nodes=["Suez Canal", "Atlantis"])
+    assert "Suez Canal" not in detour["route"]
+    assert detour["total_distance_km"] > standard["total_distance_km"]
+    # Avoidance never mutates the shared graph
+    assert "Suez Canal" in tool.graph
+
+    hits = tool._paths.hits
+    tool.forward("Shanghai", "Rotterdam", avoid_nodes=["Atlantis", "Suez Canal"])
+    assert tool._paths.hits == hits + 1
+
+def test_routing_network_covers_ports_and_loads_from_disk(tmp_path, monkeypatch):
+    tool = RoutingTool()
+    for port in ShippingTool.MAJOR_PORTS:
+        assert "error" not in tool.forward(port, "Rotterdam"), port
+
+    path = str(tmp_path / "lanes.npz")
+    sea_lanes.save_network(tool.graph, path)
+    monkeypatch.setenv("SEA_LANE_GRAPH_PATH", path)
+    loaded = RoutingTool()
+    assert loaded.graph.number_of_edges() == tool.graph.number_of_edges()
+    # A* on the loaded network agrees with Dijkstra
+    route = loaded.forward("Busan", "Santos", avoid_nodes=["Suez Canal"])
+    expected = nx.shortest_path_length(nx.subgraph_view(loaded.graph, filter_node=lambda n: n != "Suez Canal"),
+                                       "Busan", "Santos", weight="weight")
+    assert route["total_distance_km"] == pytest.approx(expected)
+
+def test_alternative_routes_are_distinct_and_annotated():
+    tool = AlternativeRoutesTool()
+    result = tool.forward("Shanghai", "Rotterdam", k=3, diversity=0.3)
+    options = result["options"]
+
+    assert 2 <= len(options) <= 3
+    assert options[0]["path"] == tool.router.forward("Shanghai", "Rotterdam")["route"]
+    distances = [o["distance_km"] for o in options]
+    assert distances == sorted(distances)
+    for option in options:
+        assert option["estimated_days"] > 0 and option["carbon_kg"] > 0
+        assert len(option["path"]) == len(set(option["path"]))  # loopless
+
+    blocked = tool.forward("Shanghai", "Rotterdam", avoid_nodes=["Suez Canal"])
+    assert all("Suez Canal" not in o["path"] for o in blocked["options"])
+
+def test_alternatives_leave_the_corridor_on_dense_lane_graphs(monkeypatch):
+    from tools import sea_lanes
+
+    # Two corridors of 60 waypoints each; the northern one has a cheap
+    # one-waypoint detour at every step (what Yen's search drowns in)
+    G = nx.Graph()
+    for name, lat in (("n", 1.0), ("s", -1.2)):
+        nodes = ["A", *(f"{name}{i}" for i in range(60)), "B"]
+        for i, node in enumerate(nodes):
+            G.add_node(node, pos=(0.0 if node in "AB" else lat, i * 0.5))
+        for u, v in zip(nodes, nodes[1:]):
+            G.add_edge(u, v, weight=50.0 if name == "n" else 58.0)
+        if name == "n":
+            for i in range(59):
+                G.add_node(f"d{i}", pos=(lat + 0.1, i * 0.5 + 0.25))
+                G.add_edge(f"n{i}", f"d{i}", weight=25.5)
+                G.add_edge(f"d{i}", f"n{i + 1}", weight=25.5)
+    G.nodes["A"]["pos"], G.nodes["B"]["pos"] = (0.0, -0.5), (0.0, 30.5)
+
+    monkeypatch.setenv("ROUTING_PRECOMPUTE", "0")
+    router = RoutingTool()
+    router.graph, router._pos = G, nx.get_node_attributes(G, "pos")
+    router._heuristic_scale = sea_lanes.heuristic_scale(G)
+    router.clear_cache()
+    tool = AlternativeRoutesTool(router)
+
+    options = tool.forward("A", "B", k=2, diversity=0.5)["options"]
+    assert len(options) == 2
+    assert any(n.startswith("s") for n in options[1]["path"])
+
+    # Callers get copies, never the cached paths
+    options[0]["path"].clear()
+    assert tool.forward("A", "B", k=2, diversity=0.5)["options"][0]["path"]
+
+def test_shipping_tool_bulk_distances():
+    names, matrix = ShippingTool.port_distance_matrix()
+    assert matrix.shape == (len(names), len(names))
+    assert np.allclose(matrix, matrix.T)
+    # Port-to-port answers keep ellipsoidal accuracy
+    from geopy.distance import geodesic
+    result = ShippingTool().forward("Callao", "Cartagena")
+    expected = geodesic(ShippingTool.MAJOR_PORTS["Callao"], ShippingTool.MAJOR_PORTS["Cartagena"]).km
+    assert abs(result["straight_line_km"] - expected) < 1e-6 * expected
+
+    rng = np.random.default_rng(0)
+    lats, lons = rng.uniform(-60, 60, 20000), rng.uniform(-180, 180, 20000)
+    ports, distances = ShippingTool.nearest_ports(lats, lons, k=3)
+    assert distances.shape == (20000, 3)
+    assert np.all(np.diff(distances, axis=1) >= 0)
+
+    # Nearest port to a point just off Singapore
+    ports, distances = ShippingTool.nearest_ports([1.30], [103.9], k=1)
+    assert ports[0][0] == "Singapore"
+    assert distances[0, 0] < 20
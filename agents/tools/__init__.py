@@ -1,4 +1,4 @@
 from .weather_tool import WeatherTool
 from .carbon_tool import CarbonTool
 from .shipping_tool import ShippingTool
-from .routing_tool import RoutingTool
+from .routing_tool import RoutingTool, AlternativeRoutesTool
@@ -1,6 +1,13 @@
 from smolagents import Tool
-import requests
 import os
+from utils import http_client
+
+# kg CO2 per ton-km used when the Carbon Interface API is unavailable
+FALLBACK_KG_CO2_PER_TON_KM = 0.015
+
+def estimate_emissions_kg(distance_km: float, cargo_weight_tons: float) -> float:
+    """Offline emission estimate (same mock factor as CarbonTool's fallback)"""
+    return distance_km * cargo_weight_tons * FALLBACK_KG_CO2_PER_TON_KM
 
 class CarbonTool(Tool):
     """
@@ -39,13 +46,13 @@ class CarbonTool(Tool):
         try:
             # Mocking response for dev if no API key
             if not os.getenv('CARBON_INTERFACE_API_KEY'):
-                kg_co2 = distance_km * cargo_weight_tons * 0.015 # Mock calculation
+                kg_co2 = estimate_emissions_kg(distance_km, cargo_weight_tons) # Mock calculation
             else:
-                response = requests.post(url, json=payload, headers=headers).json()
+                response = http_client.request("POST", url, json=payload, headers=headers).json()
                 if 'data' in response:
                     kg_co2 = response['data']['attributes']['carbon_kg']
                 else:
-                    kg_co2 = distance_km * cargo_weight_tons * 0.015
+                    kg_co2 = estimate_emissions_kg(distance_km, cargo_weight_tons)
             
             return {
                 "total_emissions_kg_co2": kg_co2,
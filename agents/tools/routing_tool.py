@@ -1,6 +1,14 @@
 from smolagents import Tool
+import os
 import networkx as nx
-from typing import List, Dict, Any
+from typing import List, Dict, FrozenSet, Optional, Tuple
+from utils.cache import LRUCache
+from utils.geo import haversine_km
+from . import sea_lanes
+from .carbon_tool import estimate_emissions_kg
+from .shipping_tool import ShippingTool
+
+_UNSET = object()
 
 class RoutingTool(Tool):
     """
@@ -19,96 +27,208 @@ class RoutingTool(Tool):
     def __init__(self):
         super().__init__()
         self.graph = self._build_graph()
+        self._pos = nx.get_node_attributes(self.graph, "pos")
+        self._heuristic_scale = sea_lanes.heuristic_scale(self.graph)
+
+        # Unconstrained port-to-port table, filled once at startup
+        self._table: Dict[Tuple[str, str], Tuple[List[str], float]] = {}
+        # (origin, destination, avoided nodes) -> (path, distance) or None if unreachable
+        self._paths = LRUCache(maxsize=int(os.getenv("ROUTING_CACHE_SIZE", "256")))
+        if os.getenv("ROUTING_PRECOMPUTE", "1") == "1":
+            self._precompute()
 
     def _build_graph(self):
-        G = nx.Graph()
-        # Define ports with coordinates
-        ports = {
-            "Singapore": (1.3521, 103.8198),
-            "Rotterdam": (51.9225, 4.0500),
-            "Shanghai": (30.0728, 120.5954),
-            "Dubai": (25.2048, 55.2708),
-            "Hamburg": (53.5136, 10.0080),
-            "Los Angeles": (33.7405, -118.2786),
-            "New York": (40.7128, -74.0060),
-            "Mumbai": (18.9446, 72.8223),
-            "Chennai": (13.0827, 80.2707),
-            "Mundra": (22.8389, 69.7452),
-            "Kolkata": (22.5726, 88.3639),
-            "Cochin": (9.9312, 76.2673),
-            "JNPT": (18.9500, 72.9500),
-            "Suez Canal": (30.5852, 32.2654),
-            "Cape of Good Hope": (-34.3568, 18.4724),
-            "Malacca Strait": (4.1936, 100.1739),
-            "Panama Canal": (9.0768, -79.7196)
-        }
-        
-        for port, coords in ports.items():
-            G.add_node(port, pos=coords)
-            
-        # Define routes (edges) with approximate distances (km)
-        # Verify these in production with real data
-        routes = [
-            ("Shanghai", "Singapore", 4200),
-            ("Singapore", "Mumbai", 3900),
-            ("Singapore", "Chennai", 2900),
-            ("Mumbai", "Dubai", 1930),
-            ("Dubai", "Suez Canal", 2600),
-            ("Suez Canal", "Rotterdam", 6400), # Via Med
-            ("Rotterdam", "Hamburg", 500),
-            ("Shanghai", "Los Angeles", 10400),
-            ("Los Angeles", "Panama Canal", 5400),
-            ("Panama Canal", "New York", 3700),
-            ("New York", "Rotterdam", 6100),
-            # Alternative Route avoiding Suez (Cape Route)
-            ("Singapore", "Cape of Good Hope", 9600),
-            ("Cape of Good Hope", "Rotterdam", 12800),
-            # Indian Coastal
-            ("Mundra", "Mumbai", 800),
-            ("Mumbai", "Cochin", 1100),
-            ("Cochin", "Chennai", 1500), # Around Sri Lanka technically
-            ("Chennai", "Kolkata", 1400),
-        ]
-        
-        for u, v, dist in routes:
-            G.add_edge(u, v, weight=dist)
-            
+        # Lane network from disk if configured, else the built-in hub network
+        path = os.getenv("SEA_LANE_GRAPH_PATH")
+        G = sea_lanes.load_network(path) if path else sea_lanes.builtin_network()
+        # Make sure every port the other tools know about is routable
+        sea_lanes.connect_ports(G, ShippingTool.MAJOR_PORTS, sea_route_factor=ShippingTool.SEA_ROUTE_FACTOR)
         return G
 
+    def _ports(self) -> List[str]:
+        names = set(ShippingTool.MAJOR_PORTS) | set(sea_lanes.BUILTIN_NODES)
+        return [n for n in names if n in self.graph]
+
+    def _precompute(self):
+        """Fill the all-pairs table between ports for the unconstrained network"""
+        ports = self._ports()
+        for source in ports:
+            distances, paths = nx.single_source_dijkstra(self.graph, source, weight="weight")
+            for target in ports:
+                if target in paths:
+                    self._table[(source, target)] = (paths[target], distances[target])
+
+    def clear_cache(self):
+        """Drop memoized paths (call after changing self.graph)"""
+        self._table.clear()
+        self._paths.clear()
+
+    def _heuristic(self, u: str, v: str) -> float:
+        # Great-circle lower bound, scaled so it never overestimates a lane distance
+        return haversine_km(*self._pos[u], *self._pos[v]) * self._heuristic_scale
+
+    def _shortest(self, origin: str, destination: str, avoid: FrozenSet[str]) -> Optional[Tuple[List[str], float]]:
+        if not avoid and (origin, destination) in self._table:
+            return self._table[(origin, destination)]
+
+        key = (origin, destination, avoid)
+        cached = self._paths.get(key, _UNSET)
+        if cached is not _UNSET:
+            return cached
+
+        # Filtered view instead of copying the graph and removing nodes
+        graph = nx.subgraph_view(self.graph, filter_node=lambda n: n not in avoid) if avoid else self.graph
+        try:
+            path = nx.astar_path(graph, origin, destination, heuristic=self._heuristic, weight="weight")
+            result = (path, nx.path_weight(graph, path, weight="weight"))
+        except nx.NetworkXNoPath:
+            result = None
+        self._paths.set(key, result)
+        return result
+
     def forward(self, origin: str, destination: str, avoid_nodes: List[str] = None):
         if origin not in self.graph or destination not in self.graph:
             return {"error": f"Port not found in network: {origin} or {destination}"}
-        
-        # Create a temporary view of graph logic for avoidance
-        # Ideally we don't modify self.graph, but filter paths
-        # NetworkX shortest_path supports standard weight
-        
-        if avoid_nodes:
-            # Check if avoid nodes exist
-            valid_avoids = [n for n in avoid_nodes if n in self.graph]
-            if valid_avoids:
-                # Use a subgraph view without the avoided nodes
-                view = self.graph.copy()
-                view.remove_nodes_from(valid_avoids)
-                try:
-                    path = nx.shortest_path(view, source=origin, target=destination, weight="weight")
-                    dist = nx.path_weight(view, path, weight="weight")
-                    return {
-                        "route": path,
-                        "total_distance_km": dist,
-                        "note": f"Route avoids {valid_avoids}"
-                    }
-                except nx.NetworkXNoPath:
-                    return {"error": "No path found with avoidance constraints"}
-        
-        # Standard shortest path
-        try:
-            path = nx.shortest_path(self.graph, source=origin, target=destination, weight="weight")
-            dist = nx.path_weight(self.graph, path, weight="weight")
+
+        # Ignore avoid nodes that don't exist in the network
+        valid_avoids = sorted(n for n in (avoid_nodes or []) if n in self.graph)
+        if valid_avoids:
+            if origin in valid_avoids or destination in valid_avoids:
+                return {"error": "No path found with avoidance constraints"}
+
+            result = self._shortest(origin, destination, frozenset(valid_avoids))
+            if result is None:
+                return {"error": "No path found with avoidance constraints"}
             return {
-                "route": path,
-                "total_distance_km": dist,
-                "note": "Standard shortest route"
+                "route": list(result[0]),
+                "total_distance_km": result[1],
+                "note": f"Route avoids {valid_avoids}"
             }
-        except nx.NetworkXNoPath:
+
+        # Standard shortest path
+        result = self._shortest(origin, destination, frozenset())
+        if result is None:
             return {"error": "No path found"}
+        return {
+            "route": list(result[0]),
+            "total_distance_km": result[1],
+            "note": "Standard shortest route"
+        }
+
+
+class AlternativeRoutesTool(Tool):
+    """
+    Returns the k best loopless, mutually distinct routes in one call,
+    each with distance, estimated transit days and estimated emissions.
+    Shares the network of a RoutingTool (the best route comes from its path
+    cache); alternatives come from the penalty method: after each route,
+    every leg touching one of its waypoints gets longer, so the next search
+    is pushed onto a different corridor instead of a one-waypoint detour.
+    """
+    name = "find_alternatives"
+    description = (
+        "Find up to k alternative maritime routes between two ports in one call. "
+        "Routes are ranked by distance and differ from each other by at least `diversity` "
+        "(fraction of legs not shared). Each option includes distance_km, estimated_days and carbon_kg."
+    )
+    inputs = {
+        "origin": {"type": "string", "description": "Origin port name"},
+        "destination": {"type": "string", "description": "Destination port name"},
+        "k": {"type": "integer", "description": "Number of routes to return (default 3)", "nullable": True},
+        "avoid_nodes": {"type": "array", "items": {"type": "string"}, "description": "List of ports or regions to avoid", "nullable": True},
+        "diversity": {"type": "number", "description": "Minimum fraction of legs not shared with any better route, 0-1 (default 0.3)", "nullable": True},
+        "cargo_weight_tons": {"type": "number", "description": "Cargo weight for the emission estimate (default 10000)", "nullable": True}
+    }
+    output_type = "object"
+
+    DEFAULT_CARGO_WEIGHT_TONS = 10000
+    # Penalized searches per requested route before giving up on diversity
+    CANDIDATES_PER_ROUTE = 4
+    # Each time a route passes a waypoint, legs touching it grow by this fraction
+    PENALTY = 0.5
+    # Alternatives longer than this multiple of the best route are not worth proposing
+    MAX_STRETCH = 2.0
+
+    def __init__(self, router: RoutingTool = None):
+        super().__init__()
+        self.router = router or RoutingTool()
+        self._results = LRUCache(maxsize=int(os.getenv("ROUTING_CACHE_SIZE", "256")))
+
+    @staticmethod
+    def _legs(path: List[str]) -> FrozenSet[FrozenSet[str]]:
+        return frozenset(frozenset(leg) for leg in zip(path, path[1:]))
+
+    def _search(self, origin: str, destination: str, k: int, avoid: FrozenSet[str], diversity: float) -> List[List[str]]:
+        best = self.router._shortest(origin, destination, avoid)
+        if best is None:
+            return []
+        graph = self.router.graph
+        if avoid:
+            graph = nx.subgraph_view(graph, filter_node=lambda n: n not in avoid)
+
+        path, best_distance = best
+        accepted = [(best_distance, list(path))]
+        accepted_legs = [self._legs(path)]
+        uses: Dict[str, int] = {}
+
+        def penalized(u, v, data):
+            return data["weight"] * (1.0 + self.PENALTY * max(uses.get(u, 0), uses.get(v, 0)))
+
+        # Penalties only lengthen legs, so the great-circle heuristic stays admissible
+        for _ in range(k * self.CANDIDATES_PER_ROUTE):
+            if len(accepted) >= k:
+                break
+            for node in path:
+                uses[node] = uses.get(node, 0) + 1
+            path = nx.astar_path(graph, origin, destination, heuristic=self.router._heuristic, weight=penalized)
+            distance = nx.path_weight(graph, path, weight="weight")
+            if distance > best_distance * self.MAX_STRETCH:
+                continue
+            legs = self._legs(path)
+            # Share of this path's legs that an already accepted route also uses
+            if all(len(legs & other) / len(legs) <= 1.0 - diversity for other in accepted_legs):
+                accepted.append((distance, path))
+                accepted_legs.append(legs)
+        return [path for _, path in sorted(accepted, key=lambda item: item[0])]
+
+    def forward(self, origin: str, destination: str, k: int = 3, avoid_nodes: List[str] = None,
+                diversity: float = 0.3, cargo_weight_tons: float = None):
+        if origin not in self.router.graph or destination not in self.router.graph:
+            return {"error": f"Port not found in network: {origin} or {destination}"}
+
+        k = max(1, min(k or 3, 10))
+        diversity = min(max(diversity if diversity is not None else 0.3, 0.0), 1.0)
+        cargo_weight_tons = cargo_weight_tons or self.DEFAULT_CARGO_WEIGHT_TONS
+        avoid = frozenset(n for n in (avoid_nodes or []) if n in self.router.graph)
+        if origin in avoid or destination in avoid:
+            return {"error": "No path found with avoidance constraints"}
+
+        key = (origin, destination, k, avoid, diversity)
+        paths = self._results.get(key)
+        if paths is None:
+            paths = self._search(origin, destination, k, avoid, diversity)
+            self._results.set(key, paths)
+        if not paths:
+            return {"error": "No path found" + (" with avoidance constraints" if avoid else "")}
+
+        options = []
+        for i, path in enumerate(paths):
+            distance = nx.path_weight(self.router.graph, path, weight="weight")
+            if i == 0:
+                route_name = "Standard Route" if not avoid else "Best Available Route"
+            else:
+                # Name alternatives after the first waypoint the best route doesn't use
+                via = next((n for n in path[1:-1] if n not in paths[0]), None)
+                route_name = f"Via {via}" if via else f"Alternative {i}"
+            options.append({
+                "route_name": route_name,
+                "path": list(path),
+                "distance_km": distance,
+                "estimated_days": round(distance / (ShippingTool.AVG_SPEED_KMH * 24), 1),
+                "carbon_kg": round(estimate_emissions_kg(distance, cargo_weight_tons), 1)
+            })
+
+        return {
+            "options": options,
+            "note": f"Avoids {sorted(avoid)}" if avoid else "No avoidance constraints"
+        }
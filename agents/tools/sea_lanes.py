@@ -0,0 +1,140 @@
+import numpy as np
+import networkx as nx
+from typing import Dict, Tuple
+
+from utils.geo import haversine_km, haversine_km_matrix
+
+# Sea-lane network storage.
+#
+# A lane network is stored as a single .npz archive of flat arrays:
+#   names   (N,)   node names (str)
+#   lat/lon (N,)   node coordinates in degrees
+#   edges   (E, 2) int32 node indices
+#   weights (E,)   float32 lane distance in km
+# which keeps thousands of waypoints to a few hundred KB and loads
+# without any per-line parsing.
+
+# Hub/chokepoint network used when no lane file is configured
+BUILTIN_NODES = {
+    "Singapore": (1.3521, 103.8198),
+    "Rotterdam": (51.9225, 4.0500),
+    "Shanghai": (30.0728, 120.5954),
+    "Dubai": (25.2048, 55.2708),
+    "Hamburg": (53.5136, 10.0080),
+    "Los Angeles": (33.7405, -118.2786),
+    "New York": (40.7128, -74.0060),
+    "Mumbai": (18.9446, 72.8223),
+    "Chennai": (13.0827, 80.2707),
+    "Mundra": (22.8389, 69.7452),
+    "Kolkata": (22.5726, 88.3639),
+    "Cochin": (9.9312, 76.2673),
+    "JNPT": (18.9500, 72.9500),
+    "Suez Canal": (30.5852, 32.2654),
+    "Cape of Good Hope": (-34.3568, 18.4724),
+    "Malacca Strait": (4.1936, 100.1739),
+    "Panama Canal": (9.0768, -79.7196)
+}
+
+# Routes (edges) with approximate distances (km)
+# Verify these in production with real data
+BUILTIN_EDGES = [
+    ("Shanghai", "Singapore", 4200),
+    ("Singapore", "Mumbai", 3900),
+    ("Singapore", "Chennai", 2900),
+    ("Mumbai", "Dubai", 1930),
+    ("Dubai", "Suez Canal", 2600),
+    ("Suez Canal", "Rotterdam", 6400), # Via Med
+    ("Rotterdam", "Hamburg", 500),
+    ("Shanghai", "Los Angeles", 10400),
+    ("Los Angeles", "Panama Canal", 5400),
+    ("Panama Canal", "New York", 3700),
+    ("New York", "Rotterdam", 6100),
+    # Alternative Route avoiding Suez (Cape Route)
+    ("Singapore", "Cape of Good Hope", 9600),
+    ("Cape of Good Hope", "Rotterdam", 12800),
+    # Indian Coastal
+    ("Mundra", "Mumbai", 800),
+    ("Mumbai", "Cochin", 1100),
+    ("Cochin", "Chennai", 1500), # Around Sri Lanka technically
+    ("Chennai", "Kolkata", 1400),
+]
+
+def builtin_network() -> nx.Graph:
+    G = nx.Graph()
+    for node, coords in BUILTIN_NODES.items():
+        G.add_node(node, pos=coords)
+    for u, v, dist in BUILTIN_EDGES:
+        G.add_edge(u, v, weight=dist)
+    return G
+
+def load_network(path: str) -> nx.Graph:
+    """Load a lane network saved with save_network"""
+    with np.load(path, allow_pickle=False) as data:
+        names = data["names"].tolist()
+        lat = data["lat"].tolist()
+        lon = data["lon"].tolist()
+        edges = data["edges"]
+        weights = data["weights"].tolist()
+
+    G = nx.Graph()
+    G.add_nodes_from((name, {"pos": (la, lo)}) for name, la, lo in zip(names, lat, lon))
+    G.add_weighted_edges_from(
+        (names[u], names[v], w) for (u, v), w in zip(edges.tolist(), weights)
+    )
+    return G
+
+def save_network(graph: nx.Graph, path: str):
+    names = list(graph.nodes)
+    index = {name: i for i, name in enumerate(names)}
+    positions = [graph.nodes[name]["pos"] for name in names]
+    edges = list(graph.edges(data="weight"))
+
+    np.savez_compressed(
+        path,
+        names=np.array(names),
+        lat=np.array([p[0] for p in positions], dtype=np.float64),
+        lon=np.array([p[1] for p in positions], dtype=np.float64),
+        edges=np.array([(index[u], index[v]) for u, v, _ in edges], dtype=np.int32).reshape(-1, 2),
+        weights=np.array([w for _, _, w in edges], dtype=np.float32)
+    )
+
+def connect_ports(graph: nx.Graph, ports: Dict[str, Tuple[float, float]], neighbors: int = 1,
+                  sea_route_factor: float = 1.15):
+    """
+    Attach every port missing from the network (and any stranded node with
+    no lanes) to its `neighbors` nearest lane nodes, with
+    great-circle * sea_route_factor as the leg distance.
+    The default single spur keeps ports as leaves, so a straight-line
+    connection can never become an overland shortcut for through traffic.
+    """
+    ports = {**{n: pos for n, pos in graph.nodes(data="pos") if graph.degree(n) == 0}, **ports}
+    missing = [name for name in ports if name not in graph or graph.degree(name) == 0]
+    if not missing:
+        return
+
+    names = [n for n in graph.nodes if graph.degree(n) > 0]
+    lane_lat = np.array([graph.nodes[n]["pos"][0] for n in names])
+    lane_lon = np.array([graph.nodes[n]["pos"][1] for n in names])
+    port_lat = np.array([ports[n][0] for n in missing])
+    port_lon = np.array([ports[n][1] for n in missing])
+
+    dist = haversine_km_matrix(port_lat, port_lon, lane_lat, lane_lon)
+    k = min(neighbors, len(names))
+    nearest = np.argpartition(dist, k - 1, axis=1)[:, :k]
+
+    for i, port in enumerate(missing):
+        graph.add_node(port, pos=ports[port])
+        for j in nearest[i]:
+            graph.add_edge(port, names[j], weight=round(float(dist[i, j]) * sea_route_factor, 1))
+
+def heuristic_scale(graph: nx.Graph) -> float:
+    """
+    Largest factor that keeps the great-circle A* heuristic admissible:
+    no edge may be shorter than scale * its great-circle length.
+    """
+    scale = 1.0
+    for u, v, weight in graph.edges(data="weight"):
+        gc = haversine_km(*graph.nodes[u]["pos"], *graph.nodes[v]["pos"])
+        if gc > 0:
+            scale = min(scale, weight / gc)
+    return scale
@@ -1,5 +1,8 @@
 from smolagents import Tool
+import numpy as np
+from typing import List, Tuple
 from geopy.distance import geodesic
+from utils.geo import haversine_km_matrix
 
 class ShippingTool(Tool):
     """
@@ -13,7 +16,12 @@ class ShippingTool(Tool):
         "port_to": {"type": "string", "description": "Destination port name"}
     }
     output_type = "object"
-    
+
+    # Great-circle -> sea-lane distance allowance (~15% for actual maritime routes)
+    SEA_ROUTE_FACTOR = 1.15
+    # Average speed including port times (see estimated_transit_days note below)
+    AVG_SPEED_KMH = 30
+
     MAJOR_PORTS = {
         # Asia (East/SE)
         "Singapore": (1.3521, 103.8198),
@@ -74,27 +82,81 @@ class ShippingTool(Tool):
         "Lagos": (6.4541, 3.3947),
     }
     
+    # Lazily built distance engine over MAJOR_PORTS (shared by all instances)
+    _port_names: List[str] = None
+    _port_rows: dict = None
+    _port_lat: np.ndarray = None
+    _port_lon: np.ndarray = None
+    _port_matrix: np.ndarray = None
+
+    @classmethod
+    def _ensure_port_index(cls):
+        if cls._port_matrix is None:
+            cls._port_names = list(cls.MAJOR_PORTS)
+            cls._port_rows = {name: i for i, name in enumerate(cls._port_names)}
+            cls._port_lat = np.array([cls.MAJOR_PORTS[n][0] for n in cls._port_names])
+            cls._port_lon = np.array([cls.MAJOR_PORTS[n][1] for n in cls._port_names])
+            # Ellipsoidal (WGS-84) distances, computed once for the ~1k port pairs;
+            # the bulk vessel-to-port lookups below use the faster spherical formula
+            n = len(cls._port_names)
+            matrix = np.zeros((n, n))
+            for i in range(n):
+                for j in range(i + 1, n):
+                    matrix[i, j] = matrix[j, i] = geodesic(
+                        cls.MAJOR_PORTS[cls._port_names[i]], cls.MAJOR_PORTS[cls._port_names[j]]
+                    ).km
+            cls._port_matrix = matrix
+
+    @classmethod
+    def port_distance_matrix(cls) -> Tuple[List[str], np.ndarray]:
+        """Precomputed port x port geodesic distances (km), with row/column port names"""
+        cls._ensure_port_index()
+        return cls._port_names, cls._port_matrix
+
+    @classmethod
+    def distances_to_ports(cls, latitudes, longitudes) -> np.ndarray:
+        """
+        Great-circle distance (km) from each position to every port, shape (N, ports).
+        Spherical: within ~0.6% of the geodesic distance.
+        """
+        cls._ensure_port_index()
+        return haversine_km_matrix(latitudes, longitudes, cls._port_lat, cls._port_lon)
+
+    @classmethod
+    def nearest_ports(cls, latitudes, longitudes, k: int = 1) -> Tuple[List[List[str]], np.ndarray]:
+        """
+        k nearest ports per position, closest first.
+        Returns (port names per position, distances in km with shape (N, k)).
+        With ~50 ports a brute-force distance matrix is faster than building a spatial tree.
+        """
+        distances = cls.distances_to_ports(latitudes, longitudes)
+        k = max(1, min(k, distances.shape[1]))
+        nearest = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        nearest_dist = np.take_along_axis(distances, nearest, axis=1)
+        order = np.argsort(nearest_dist, axis=1)
+        nearest = np.take_along_axis(nearest, order, axis=1)
+        nearest_dist = np.take_along_axis(nearest_dist, order, axis=1)
+        return [[cls._port_names[j] for j in row] for row in nearest], nearest_dist
+
     def forward(self, port_from: str, port_to: str):
         if port_from not in self.MAJOR_PORTS:
             return {"error": f"Unknown origin port: {port_from}"}
         if port_to not in self.MAJOR_PORTS:
             return {"error": f"Unknown destination port: {port_to}"}
         
-        coord_from = self.MAJOR_PORTS[port_from]
-        coord_to = self.MAJOR_PORTS[port_to]
-        
-        # Great circle distance
-        distance_km = geodesic(coord_from, coord_to).kilometers
+        # Geodesic distance (precomputed table lookup)
+        _, matrix = self.port_distance_matrix()
+        distance_km = float(matrix[self._port_rows[port_from], self._port_rows[port_to]])
         
         # Estimate sea distance (add ~15% for actual maritime routes)
-        sea_distance = distance_km * 1.15
+        sea_distance = distance_km * self.SEA_ROUTE_FACTOR
         
         return {
             "origin": port_from,
             "destination": port_to,
             "straight_line_km": distance_km,
             "estimated_sea_route_km": sea_distance,
-            "estimated_transit_days": sea_distance / (30 * 24) # 30km/h avg speed? Roadmap said 30km/day avg which is absurdly slow. 
+            "estimated_transit_days": sea_distance / (self.AVG_SPEED_KMH * 24) # 30km/h avg speed? Roadmap said 30km/day avg which is absurdly slow. 
             # Roadmap: `sea_distance / 30  # ~30 km/day avg` -> Wait, 30km/day is walking speed. 
             # Ships go ~15-25 knots. 20 knots ~= 37 km/h. 
             # 37 km/h * 24h = 888 km/day.
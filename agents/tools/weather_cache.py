@@ -0,0 +1,149 @@
+import os
+import json
+import math
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import redis
+import redis.asyncio as aioredis
+
+from utils.cache import LRUCache
+from utils.logger import get_logger
+
+logger = get_logger("WeatherCache")
+
+class WeatherCache:
+    """
+    Two-tier cache for forecasts, keyed on a quantized lat/lon grid cell.
+
+    Vessels in the same lane sit within a few km of each other and get the
+    same forecast, so lookups snap to a cell of `resolution_deg` and fetch
+    once per (cell, horizon, model run). Tier 1 is a per-process LRU with
+    TTL; tier 2 is an optional shared Redis so every agent process reuses
+    the same fetch. Code on an event loop uses aget_many/aset_many, which
+    reach Redis through the async client in one round trip per batch.
+    """
+    def __init__(self,
+                 resolution_deg: Optional[float] = None,
+                 ttl_s: Optional[float] = None,
+                 max_entries: Optional[int] = None,
+                 model_run_interval_s: Optional[float] = None,
+                 redis_url: Optional[str] = None):
+        self.resolution_deg = resolution_deg or float(os.getenv("WEATHER_CACHE_RESOLUTION_DEG", "0.25"))
+        self.ttl_s = ttl_s or float(os.getenv("WEATHER_CACHE_TTL_S", "1800"))
+        # Forecast models re-run on a fixed cadence; entries from an older run are never reused
+        self.model_run_interval_s = model_run_interval_s or float(os.getenv("WEATHER_MODEL_RUN_INTERVAL_S", "3600"))
+        self.memory = LRUCache(
+            maxsize=max_entries or int(os.getenv("WEATHER_CACHE_MAX_ENTRIES", "10000")),
+            ttl=self.ttl_s
+        )
+
+        self.redis_url = redis_url or os.getenv("WEATHER_CACHE_REDIS_URL")
+        self.redis_client = redis.Redis.from_url(self.redis_url, decode_responses=True) if self.redis_url else None
+        # Created on first async use, on the caller's event loop
+        self._async_redis: Optional[aioredis.Redis] = None
+
+    def cell(self, latitude: float, longitude: float) -> Tuple[int, int]:
+        # Normalize longitude so 180 and -180 land in the same cell
+        longitude = ((longitude + 180.0) % 360.0) - 180.0
+        return (math.floor(latitude / self.resolution_deg), math.floor(longitude / self.resolution_deg))
+
+    def cell_center(self, cell: Tuple[int, int]) -> Tuple[float, float]:
+        lat = (cell[0] + 0.5) * self.resolution_deg
+        lon = (cell[1] + 0.5) * self.resolution_deg
+        return round(max(-90.0, min(90.0, lat)), 4), round(lon, 4)
+
+    def model_run(self, now: Optional[float] = None) -> int:
+        now = now if now is not None else time.time()
+        return int(now // self.model_run_interval_s)
+
+    def key(self, cell: Tuple[int, int], days_ahead: int, model_run: Optional[int] = None) -> str:
+        model_run = model_run if model_run is not None else self.model_run()
+        return f"weather:{self.resolution_deg}:{cell[0]}:{cell[1]}:{days_ahead}:{model_run}"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        value = self.memory.get(key)
+        if value is not None or self.redis_client is None:
+            return value
+
+        try:
+            raw = self.redis_client.get(key)
+        except redis.exceptions.RedisError as e:
+            logger.warning(f"Redis weather tier unavailable: {e}")
+            return None
+        if raw is None:
+            return None
+
+        value = json.loads(raw)
+        self.memory.set(key, value)
+        return value
+
+    def set(self, key: str, value: Dict[str, Any]):
+        self.memory.set(key, value)
+        if self.redis_client is None:
+            return
+        try:
+            self.redis_client.set(key, json.dumps(value), ex=int(self.ttl_s))
+        except redis.exceptions.RedisError as e:
+            logger.warning(f"Redis weather tier unavailable: {e}")
+
+    def _async_client(self) -> aioredis.Redis:
+        if self._async_redis is None:
+            self._async_redis = aioredis.Redis.from_url(self.redis_url, decode_responses=True)
+        return self._async_redis
+
+    async def aget_many(self, keys: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Cached values for `keys` (misses omitted), without blocking the event loop"""
+        found = {}
+        for key in keys:
+            value = self.memory.get(key)
+            if value is not None:
+                found[key] = value
+        missing = [key for key in keys if key not in found]
+        if not missing or self.redis_url is None:
+            return found
+
+        try:
+            raws = await self._async_client().mget(missing)
+        except redis.exceptions.RedisError as e:
+            logger.warning(f"Redis weather tier unavailable: {e}")
+            return found
+        for key, raw in zip(missing, raws):
+            if raw is not None:
+                found[key] = json.loads(raw)
+                self.memory.set(key, found[key])
+        return found
+
+    async def aset_many(self, values: Dict[str, Dict[str, Any]]):
+        for key, value in values.items():
+            self.memory.set(key, value)
+        if not values or self.redis_url is None:
+            return
+        try:
+            async with self._async_client().pipeline(transaction=False) as pipe:
+                for key, value in values.items():
+                    pipe.set(key, json.dumps(value), ex=int(self.ttl_s))
+                await pipe.execute()
+        except redis.exceptions.RedisError as e:
+            logger.warning(f"Redis weather tier unavailable: {e}")
+
+    async def aclose(self):
+        if self._async_redis is not None:
+            await self._async_redis.aclose()
+            self._async_redis = None
+
+    def get_or_fetch(self, latitude: float, longitude: float, days_ahead: int,
+                     fetch: Callable[[float, float, int], Dict[str, Any]]) -> Dict[str, Any]:
+        """Return the cached forecast for the point's cell, fetching at the cell center on a miss"""
+        cell = self.cell(latitude, longitude)
+        key = self.key(cell, days_ahead)
+
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        value = fetch(*self.cell_center(cell), days_ahead)
+        # Errors are not cached so the next call retries
+        if "error" not in value:
+            self.set(key, value)
+        return value
@@ -1,5 +1,13 @@
 from smolagents import Tool
-import requests
+import os
+import asyncio
+from typing import Any, Dict, List, Tuple
+from utils import http_client
+from .weather_cache import WeatherCache
+
+# Wind speed thresholds (m/s) per risk level, highest first.
+# Shared with the fleet pre-screener so both agree on what "LOW" means.
+WIND_RISK_THRESHOLDS = [(20, "CRITICAL"), (15, "HIGH"), (10, "MEDIUM")]
 
 class WeatherTool(Tool):
     """
@@ -18,36 +26,137 @@ class WeatherTool(Tool):
         "days_ahead": {"type": "integer", "description": "Forecast days (1-7)", "nullable": True}
     }
     output_type = "object"
-    
+
+    def __init__(self, cache: WeatherCache = None, base_url: str = None):
+        super().__init__()
+        # Base URL is configurable so a local stand-in server can be used in tests
+        self.base_url = (base_url or os.getenv("OPEN_METEO_BASE_URL", "https://api.open-meteo.com/v1")).rstrip("/")
+        self.cache = cache or WeatherCache()
+        # Locations per multi-point request (keeps URLs well under server limits)
+        self.batch_size = int(os.getenv("WEATHER_BATCH_SIZE", "100"))
+
     def forward(self, latitude: float, longitude: float, days_ahead: int = 3):
-        url = "https://api.open-meteo.com/v1/forecast"
-        params = {
-            "latitude": latitude,
-            "longitude": longitude,
+        days_ahead = min(days_ahead or 3, 7)
+        return self.cache.get_or_fetch(latitude, longitude, days_ahead, self._fetch)
+
+    def fetch_batch(self, coordinates: List[Tuple[float, float]], days_ahead: int = 3) -> List[Dict[str, Any]]:
+        """
+        Forecasts for many (lat, lon) points, in input order.
+        Points are deduplicated by cache cell and the misses are fetched
+        with Open-Meteo's multi-location query, `batch_size` points per request.
+        """
+        days_ahead = min(days_ahead or 3, 7)
+        cells, keys, results, misses = self._plan_batch(coordinates, days_ahead)
+
+        for chunk in self._chunks(misses):
+            centers = [self.cache.cell_center(cell) for cell in chunk]
+            self._store(chunk, keys, results, self._fetch_many(centers, days_ahead))
+
+        return [results[cell] for cell in cells]
+
+    async def afetch_batch(self, coordinates: List[Tuple[float, float]], days_ahead: int = 3) -> List[Dict[str, Any]]:
+        """
+        Async fetch_batch for use directly on an agent's event loop
+        (the shared cache tier is read and written with the async client).
+        """
+        days_ahead = min(days_ahead or 3, 7)
+        cells, keys = self._cell_keys(coordinates, days_ahead)
+        cached = await self.cache.aget_many(list(keys.values()))
+        results = {cell: cached[key] for cell, key in keys.items() if key in cached}
+        misses = [cell for cell in keys if cell not in results]
+
+        chunks = self._chunks(misses)
+        responses = await asyncio.gather(*(
+            self._afetch_many([self.cache.cell_center(cell) for cell in chunk], days_ahead)
+            for chunk in chunks
+        ))
+        fresh = {}
+        for chunk, values in zip(chunks, responses):
+            for cell, value in zip(chunk, values):
+                results[cell] = value
+                if "error" not in value:
+                    fresh[keys[cell]] = value
+        await self.cache.aset_many(fresh)
+
+        return [results[cell] for cell in cells]
+
+    def _cell_keys(self, coordinates, days_ahead):
+        cells = [self.cache.cell(lat, lon) for lat, lon in coordinates]
+        return cells, {cell: self.cache.key(cell, days_ahead) for cell in set(cells)}
+
+    def _plan_batch(self, coordinates, days_ahead):
+        """Map points to cells and split cells into cache hits and misses"""
+        cells, keys = self._cell_keys(coordinates, days_ahead)
+
+        results = {}
+        misses = []
+        for cell, key in keys.items():
+            cached = self.cache.get(key)
+            if cached is not None:
+                results[cell] = cached
+            else:
+                misses.append(cell)
+        return cells, keys, results, misses
+
+    def _chunks(self, cells):
+        return [cells[i:i + self.batch_size] for i in range(0, len(cells), self.batch_size)]
+
+    def _store(self, chunk, keys, results, values):
+        for cell, value in zip(chunk, values):
+            results[cell] = value
+            if "error" not in value:
+                self.cache.set(keys[cell], value)
+
+    def _fetch(self, latitude: float, longitude: float, days_ahead: int):
+        return self._fetch_many([(latitude, longitude)], days_ahead)[0]
+
+    def _params(self, coordinates: List[Tuple[float, float]], days_ahead: int) -> Dict[str, Any]:
+        return {
+            "latitude": ",".join(str(lat) for lat, _ in coordinates),
+            "longitude": ",".join(str(lon) for _, lon in coordinates),
             "hourly": "wind_speed_10m,wave_height,precipitation",
-            "forecast_days": min(days_ahead, 7)
+            "wind_speed_unit": "ms", # API defaults to km/h; thresholds are m/s
+            "forecast_days": days_ahead
         }
+
+    def _fetch_many(self, coordinates: List[Tuple[float, float]], days_ahead: int) -> List[Dict[str, Any]]:
+        try:
+            response = http_client.request("GET", f"{self.base_url}/forecast", params=self._params(coordinates, days_ahead))
+            return self._parse_many(response.json(), coordinates, days_ahead)
+        except Exception as e:
+            return [{"error": str(e)}] * len(coordinates)
+
+    async def _afetch_many(self, coordinates: List[Tuple[float, float]], days_ahead: int) -> List[Dict[str, Any]]:
         try:
-            response = requests.get(url, params=params).json()
-            
-            # Extract worst-case values
-            if 'hourly' not in response:
-                return {"error": "Weather data unavailable"}
-                
-            wind_speeds = response['hourly']['wind_speed_10m']
-            max_wind = max(wind_speeds) if wind_speeds else 0
-            risk_level = self._assess_risk(max_wind)
-            
-            return {
-                "max_wind_speed_kn": max_wind * 1.944,  # m/s to knots
-                "risk_level": risk_level,
-                "summary": f"Max wind {max_wind} m/s in next {days_ahead} days"
-            }
+            response = await http_client.async_request("GET", f"{self.base_url}/forecast", params=self._params(coordinates, days_ahead))
+            return self._parse_many(response.json(), coordinates, days_ahead)
         except Exception as e:
-            return {"error": str(e)}
-    
+            return [{"error": str(e)}] * len(coordinates)
+
+    def _parse_many(self, response: Any, coordinates: List[Tuple[float, float]], days_ahead: int) -> List[Dict[str, Any]]:
+        # Multi-location queries return a list, single-location an object
+        locations = response if isinstance(response, list) else [response]
+        if len(locations) != len(coordinates):
+            return [{"error": "Weather data unavailable"}] * len(coordinates)
+        return [self._summarize(location, days_ahead) for location in locations]
+
+    def _summarize(self, response: Dict[str, Any], days_ahead: int) -> Dict[str, Any]:
+        # Extract worst-case values
+        if 'hourly' not in response:
+            return {"error": "Weather data unavailable"}
+
+        wind_speeds = [w for w in response['hourly']['wind_speed_10m'] if w is not None]
+        max_wind = max(wind_speeds) if wind_speeds else 0
+        risk_level = self._assess_risk(max_wind)
+
+        return {
+            "max_wind_speed_kn": max_wind * 1.944,  # m/s to knots
+            "max_wind_speed_m_s": max_wind,
+            "risk_level": risk_level,
+            "summary": f"Max wind {max_wind} m/s in next {days_ahead} days"
+        }
+
     def _assess_risk(self, wind_m_s: float) -> str:
-        if wind_m_s > 20: return "CRITICAL"
-        elif wind_m_s > 15: return "HIGH"
-        elif wind_m_s > 10: return "MEDIUM"
-        else: return "LOW"
+        for threshold, level in WIND_RISK_THRESHOLDS:
+            if wind_m_s > threshold: return level
+        return "LOW"
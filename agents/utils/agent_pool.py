@@ -0,0 +1,56 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+from utils.logger import get_logger
+
+logger = get_logger("AgentPool")
+
+class AgentPool:
+    """
+    Fixed set of (synchronous) CodeAgent instances run on a bounded executor.
+
+    CodeAgent keeps per-run memory, so one instance must never serve two
+    runs at once. Each concurrent run borrows its own agent, and runs are
+    offloaded to a dedicated thread pool so they never tie up the event
+    loop or the default executor.
+    """
+    def __init__(self, factory: Callable[[], Any], size: int, name: str = "agent"):
+        self.size = max(1, size)
+        self.name = name
+        self._factory = factory
+        self._agents = [factory() for _ in range(self.size)]
+        self._idle: Optional[asyncio.Queue] = None
+        # Spare threads absorb runs abandoned after a timeout,
+        # which keep their thread until the in-flight model call returns
+        self.executor = ThreadPoolExecutor(max_workers=self.size * 2, thread_name_prefix=name)
+
+    def _queue(self) -> asyncio.Queue:
+        if self._idle is None:
+            self._idle = asyncio.Queue()
+            for agent in self._agents:
+                self._idle.put_nowait(agent)
+        return self._idle
+
+    async def run(self, prompt: str, timeout: Optional[float] = None) -> Any:
+        """Run `prompt` on an idle agent, waiting for one if all are busy"""
+        idle = self._queue()
+        agent = await idle.get()
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self.executor, agent.run, prompt)
+        abandoned = False
+        try:
+            return await asyncio.wait_for(future, timeout) if timeout else await future
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            # The thread can't be killed: ask the agent to stop after its
+            # current step and hand out a fresh instance in its place
+            abandoned = True
+            interrupt = getattr(agent, "interrupt", None)
+            if callable(interrupt):
+                interrupt()
+            logger.warning(f"{self.name} run abandoned (timeout={timeout}s), replacing agent")
+            raise
+        finally:
+            idle.put_nowait(self._factory() if abandoned else agent)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
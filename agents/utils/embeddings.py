@@ -0,0 +1,184 @@
+import os
+import json
+import time
+import struct
+import asyncio
+import threading
+from typing import Any, Callable, List, Optional
+
+import numpy as np
+
+from utils.logger import get_logger
+
+logger = get_logger("Embeddings")
+
+# Text embeddings for RAG.
+#
+# The SentenceTransformer is loaded lazily, once per process, on the first
+# encode, so workers that never query pay neither the load time nor its RSS.
+# With EMBEDDING_SERVICE_SOCKET set, processes instead send encode requests
+# to one local model host (embedding_service.py), which merges concurrent
+# requests into micro-batches.
+#
+# Wire format (both directions): 4-byte big-endian length + body.
+#   request body:  JSON {"texts": [...], "batch_size": n}
+#   response body: 8-byte (rows, dim) uint32 header + float32 row-major data,
+#                  or rows == 0xFFFFFFFF followed by a UTF-8 error message
+
+MODEL_NAME = os.getenv("RAG_EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+_ERROR = 0xFFFFFFFF
+
+_model = None
+_model_lock = threading.Lock()
+
+
+def get_embedding_model():
+    """Per-process SentenceTransformer singleton, loaded on first use"""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                from sentence_transformers import SentenceTransformer
+                logger.info(f"Loading embedding model {MODEL_NAME}")
+                _model = SentenceTransformer(MODEL_NAME)
+    return _model
+
+
+def encode_local(texts: List[str], batch_size: int = 64) -> np.ndarray:
+    return np.asarray(
+        get_embedding_model().encode(texts, batch_size=batch_size, convert_to_numpy=True, show_progress_bar=False),
+        dtype=np.float32
+    )
+
+
+class LocalEmbedder:
+    async def encode(self, texts: List[str], batch_size: int = 64) -> np.ndarray:
+        # CPU/GPU bound: keep it off the event loop
+        return await asyncio.to_thread(encode_local, texts, batch_size)
+
+
+class RemoteEmbedder:
+    """
+    Client for the local embedding service. While the service is unreachable
+    (not started yet, restarting, hung) calls fall back to the in-process
+    model, and the socket is retried after `retry_s`.
+    """
+    def __init__(self, socket_path: str, timeout_s: Optional[float] = None, retry_s: Optional[float] = None):
+        self.socket_path = socket_path
+        self.timeout_s = timeout_s or float(os.getenv("EMBEDDING_SERVICE_TIMEOUT_S", "10"))
+        self.retry_s = retry_s if retry_s is not None else float(os.getenv("EMBEDDING_SERVICE_RETRY_S", "30"))
+        self._fallback = LocalEmbedder()
+        self._retry_at = 0.0
+
+    async def encode(self, texts: List[str], batch_size: int = 64) -> np.ndarray:
+        if time.monotonic() >= self._retry_at:
+            try:
+                return await asyncio.wait_for(self._request(texts, batch_size), self.timeout_s)
+            except (ConnectionError, FileNotFoundError, asyncio.IncompleteReadError, asyncio.TimeoutError) as e:
+                logger.warning(
+                    f"Embedding service at {self.socket_path} unavailable ({e!r}), "
+                    f"encoding locally; retrying in {self.retry_s}s"
+                )
+                self._retry_at = time.monotonic() + self.retry_s
+        return await self._fallback.encode(texts, batch_size)
+
+    async def _request(self, texts: List[str], batch_size: int) -> np.ndarray:
+        reader, writer = await asyncio.open_unix_connection(self.socket_path)
+        try:
+            await write_frame(writer, json.dumps({"texts": texts, "batch_size": batch_size}).encode())
+            return decode_embeddings(await read_frame(reader))
+        finally:
+            writer.close()
+
+
+async def read_frame(reader: asyncio.StreamReader) -> bytes:
+    (length,) = struct.unpack(">I", await reader.readexactly(4))
+    return await reader.readexactly(length)
+
+
+async def write_frame(writer: asyncio.StreamWriter, body: bytes):
+    writer.write(struct.pack(">I", len(body)) + body)
+    await writer.drain()
+
+
+def encode_embeddings(embeddings: np.ndarray) -> bytes:
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    rows, dim = embeddings.shape
+    return struct.pack(">II", rows, dim) + embeddings.tobytes()
+
+
+def encode_error(message: str) -> bytes:
+    return struct.pack(">II", _ERROR, 0) + message.encode()
+
+
+def decode_embeddings(body: bytes) -> np.ndarray:
+    rows, dim = struct.unpack(">II", body[:8])
+    if rows == _ERROR:
+        raise RuntimeError(f"Embedding service error: {body[8:].decode()}")
+    return np.frombuffer(body[8:], dtype=np.float32).reshape(rows, dim)
+
+
+class MicroBatcher:
+    """
+    Merges concurrent encode requests into one model call.
+    A batch is flushed when it reaches `max_batch` texts or `max_wait_s`
+    after its first request, whichever comes first.
+    """
+    def __init__(self, encode: Callable[[List[str], int], np.ndarray],
+                 max_batch: Optional[int] = None, max_wait_s: Optional[float] = None):
+        self._encode = encode
+        self.max_batch = max_batch or int(os.getenv("EMBEDDING_MAX_BATCH", "256"))
+        self.max_wait_s = max_wait_s if max_wait_s is not None else \
+            float(os.getenv("EMBEDDING_MAX_WAIT_MS", "5")) / 1000
+        self._pending: List[Any] = []  # (texts, batch_size, future)
+        self._size = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.batches = 0
+
+    async def submit(self, texts: List[str], batch_size: int = 64) -> np.ndarray:
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((texts, batch_size, future))
+        self._size += len(texts)
+        if self._size >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_wait_s, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pending, self._pending, self._size = self._pending, [], 0
+        if pending:
+            asyncio.get_running_loop().create_task(self._run(pending))
+
+    async def _run(self, pending):
+        texts = [text for request_texts, _, _ in pending for text in request_texts]
+        batch_size = max(size for _, size, _ in pending)
+        self.batches += 1
+        try:
+            embeddings = await asyncio.to_thread(self._encode, texts, batch_size)
+        except Exception as e:
+            for _, _, future in pending:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        offset = 0
+        for request_texts, _, future in pending:
+            if not future.done():
+                future.set_result(embeddings[offset:offset + len(request_texts)])
+            offset += len(request_texts)
+
+
+_embedder = None
+
+
+def get_embedder():
+    """Process-wide embedder: the local service if configured, else the lazy in-process model"""
+    global _embedder
+    if _embedder is None:
+        socket_path = os.getenv("EMBEDDING_SERVICE_SOCKET")
+        _embedder = RemoteEmbedder(socket_path) if socket_path else LocalEmbedder()
+    return _embedder
@@ -0,0 +1,44 @@
+import math
+import numpy as np
+from typing import Any, Mapping, Optional, Tuple
+
+# Mean Earth radius. Spherical (haversine) distances differ from the
+# WGS-84 geodesic by up to ~0.6%, which is fine for thresholds and ranking
+EARTH_RADIUS_KM = 6371.0088
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance between two (lat, lon) points in km"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+def haversine_km_array(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """Element-wise great-circle distances in km for equal-length (or broadcastable) arrays"""
+    phi1 = np.radians(np.asarray(lat1, dtype=np.float64))
+    phi2 = np.radians(np.asarray(lat2, dtype=np.float64))
+    dlmb = np.radians(np.asarray(lon2, dtype=np.float64) - np.asarray(lon1, dtype=np.float64))
+
+    a = np.sin((phi2 - phi1) / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+def haversine_km_matrix(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """
+    Pairwise great-circle distances in km.
+    Inputs are 1-D arrays of degrees; returns an (len(lat1), len(lat2)) matrix.
+    """
+    phi1 = np.radians(np.asarray(lat1, dtype=np.float64))[:, None]
+    phi2 = np.radians(np.asarray(lat2, dtype=np.float64))[None, :]
+    lmb1 = np.radians(np.asarray(lon1, dtype=np.float64))[:, None]
+    lmb2 = np.radians(np.asarray(lon2, dtype=np.float64))[None, :]
+
+    a = np.sin((phi2 - phi1) / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin((lmb2 - lmb1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+def record_position(record: Mapping[str, Any]) -> Optional[Tuple[float, float]]:
+    """(lat, lon) of a shipment/disruption record, or None if it has no position"""
+    lat, lon = record.get("lat"), record.get("lon")
+    if lat is None or lon is None:
+        return None
+    return lat, lon
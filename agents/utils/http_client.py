@@ -0,0 +1,114 @@
+import os
+import random
+import asyncio
+import threading
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from utils.logger import get_logger
+
+logger = get_logger("HTTPClient")
+
+# Shared HTTP layer for every external tool.
+# Sync callers (smolagents tools running in agent threads) share one pooled
+# keep-alive requests.Session; async callers on the agents' event loops share
+# one httpx.AsyncClient. Both apply the same timeout, per-host connection
+# limit and retry-with-jittered-backoff policy.
+
+TIMEOUT_S = float(os.getenv("HTTP_TIMEOUT_S", "10"))
+MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "3"))
+BACKOFF_S = float(os.getenv("HTTP_BACKOFF_S", "0.5"))
+MAX_CONNECTIONS_PER_HOST = int(os.getenv("HTTP_MAX_CONNECTIONS_PER_HOST", "10"))
+MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+_async_client: Optional[httpx.AsyncClient] = None
+_host_limits: Dict[str, asyncio.Semaphore] = {}
+
+
+def get_session() -> requests.Session:
+    """Process-wide pooled session (thread-safe to share across tool threads)"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                retry = Retry(
+                    total=MAX_RETRIES,
+                    backoff_factor=BACKOFF_S,
+                    backoff_jitter=BACKOFF_S,
+                    status_forcelist=RETRY_STATUSES,
+                    # Our POSTs (emission calculations) are side-effect free
+                    allowed_methods=frozenset({"GET", "POST"}),
+                    raise_on_status=False
+                )
+                # pool_block caps concurrent connections per host instead of
+                # opening throwaway extra connections under load
+                adapter = HTTPAdapter(
+                    pool_connections=MAX_CONNECTIONS // MAX_CONNECTIONS_PER_HOST or 1,
+                    pool_maxsize=MAX_CONNECTIONS_PER_HOST,
+                    pool_block=True,
+                    max_retries=retry
+                )
+                session = requests.Session()
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _session = session
+    return _session
+
+
+def request(method: str, url: str, timeout: Optional[float] = None, **kwargs) -> requests.Response:
+    """Sync request through the shared session with the default timeout"""
+    return get_session().request(method, url, timeout=timeout or TIMEOUT_S, **kwargs)
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """Shared keep-alive async client (create/use from the agent's event loop)"""
+    global _async_client
+    if _async_client is None or _async_client.is_closed:
+        _async_client = httpx.AsyncClient(
+            timeout=TIMEOUT_S,
+            limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS)
+        )
+        _host_limits.clear()
+    return _async_client
+
+
+def _backoff(attempt: int) -> float:
+    return BACKOFF_S * (2 ** attempt) + random.uniform(0, BACKOFF_S)
+
+
+async def async_request(method: str, url: str, timeout: Optional[float] = None, **kwargs) -> httpx.Response:
+    """Async request with per-host concurrency limit and jittered-backoff retries"""
+    client = get_async_client()
+    host = urlparse(url).netloc
+    limit = _host_limits.setdefault(host, asyncio.Semaphore(MAX_CONNECTIONS_PER_HOST))
+
+    attempt = 0
+    while True:
+        try:
+            async with limit:
+                response = await client.request(method, url, timeout=timeout or TIMEOUT_S, **kwargs)
+            if response.status_code not in RETRY_STATUSES or attempt >= MAX_RETRIES:
+                return response
+            logger.warning(f"{method} {host} returned {response.status_code}, retrying")
+        except httpx.TransportError as e:
+            if attempt >= MAX_RETRIES:
+                raise
+            logger.warning(f"{method} {host} failed ({e!r}), retrying")
+        await asyncio.sleep(_backoff(attempt))
+        attempt += 1
+
+
+async def close_async_client():
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
@@ -0,0 +1,153 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import hashlib
+from datetime import date, datetime
+from decimal import Decimal
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import redis
+
+from utils.logger import get_logger
+
+logger = get_logger("LLMCache")
+
+# Content-addressed cache of agent results.
+#
+# Keys are a hash of the *structured* inputs an agent run depends on
+# (canonicalized: sorted keys, rounded floats, normalized strings), plus the
+# agent name, model id and LLM_CACHE_VERSION, never of the rendered prompt text.
+# Backends: "redis" (shared by every agent process), "disk" (one JSON file
+# per entry under LLM_CACHE_DIR) or "off".
+
+# Bump to invalidate every cached result (e.g. after prompt changes)
+CACHE_VERSION = os.getenv("LLM_CACHE_VERSION", "1")
+
+DEFAULT_TTL_S = {
+    "risk_scout": 1800,       # weather and positions move on
+    "route_planner": 21600,
+    "carbon_auditor": 86400,
+}
+
+
+def canonicalize(value: Any, float_digits: int = 4) -> Any:
+    """Normalize inputs so equivalent values produce identical JSON"""
+    if isinstance(value, dict):
+        return {str(k): canonicalize(v, float_digits) for k, v in sorted(value.items(), key=lambda kv: str(kv[0]))}
+    if isinstance(value, (set, frozenset)):
+        return sorted(canonicalize(v, float_digits) for v in value)
+    if isinstance(value, (list, tuple)):
+        return [canonicalize(v, float_digits) for v in value]
+    if isinstance(value, bool) or value is None or isinstance(value, int):
+        return value
+    if isinstance(value, (float, Decimal)):
+        return round(float(value), float_digits)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    return " ".join(str(value).split())
+
+
+class AgentResultCache:
+    def __init__(self, agent: str,
+                 ttl_s: Optional[float] = None,
+                 backend: Optional[str] = None,
+                 model: str = "",
+                 redis_client=None,
+                 cache_dir: Optional[str] = None,
+                 bypass: Optional[bool] = None):
+        self.agent = agent
+        self.model = model
+        self.ttl_s = ttl_s or float(os.getenv(f"LLM_CACHE_TTL_{agent.upper()}_S", DEFAULT_TTL_S.get(agent, 3600)))
+        self.backend = backend or os.getenv("LLM_CACHE_BACKEND", "redis")
+        if self.backend not in ("redis", "disk", "off"):
+            raise ValueError(f"Unknown LLM cache backend: {self.backend}")
+        # Bypass skips lookups but still stores fresh results
+        self.bypass = bypass if bypass is not None else os.getenv("LLM_CACHE_BYPASS", "0") == "1"
+
+        self._redis = redis_client
+        self.cache_dir = Path(cache_dir or os.getenv("LLM_CACHE_DIR", ".cache/agent_results")) / agent
+
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, inputs: Dict[str, Any]) -> str:
+        payload = json.dumps(
+            {"agent": self.agent, "model": self.model, "version": CACHE_VERSION, "inputs": canonicalize(inputs)},
+            sort_keys=True, separators=(",", ":")
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _redis_client(self):
+        if self._redis is None:
+            from utils.redis_client import get_redis
+            self._redis = get_redis()
+        return self._redis
+
+    async def get(self, inputs: Dict[str, Any], bypass: bool = False) -> Optional[Any]:
+        if self.backend == "off" or self.bypass or bypass:
+            return None
+
+        key = self.key(inputs)
+        try:
+            if self.backend == "redis":
+                raw = await self._redis_client().get(f"llm:{self.agent}:{key}")
+                value = json.loads(raw) if raw else None
+            else:
+                value = await asyncio.to_thread(self._disk_get, key)
+        except (redis.exceptions.RedisError, OSError, ValueError) as e:
+            logger.warning(f"{self.agent} result cache unavailable: {e}")
+            value = None
+
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        logger.debug(f"{self.agent} result cache hit {key[:12]}")
+        return value
+
+    async def set(self, inputs: Dict[str, Any], result: Any):
+        if self.backend == "off":
+            return
+        key = self.key(inputs)
+        try:
+            if self.backend == "redis":
+                await self._redis_client().set(f"llm:{self.agent}:{key}", json.dumps(result, default=str), ex=int(self.ttl_s))
+            else:
+                await asyncio.to_thread(self._disk_set, key, result)
+        except (redis.exceptions.RedisError, OSError, TypeError) as e:
+            logger.warning(f"Could not cache {self.agent} result: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
+
+    def _disk_path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def _disk_get(self, key: str) -> Optional[Any]:
+        path = self._disk_path(key)
+        try:
+            entry = json.loads(path.read_text())
+        except FileNotFoundError:
+            return None
+        if entry["expires_at"] <= time.time():
+            path.unlink(missing_ok=True)
+            return None
+        return entry["result"]
+
+    def _disk_set(self, key: str, result: Any):
+        path = self._disk_path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write-then-rename so concurrent readers never see a partial file
+        tmp = path.with_suffix(f".{uuid.uuid4().hex}.tmp")
+        tmp.write_text(json.dumps({"expires_at": time.time() + self.ttl_s, "result": result}, default=str))
+        tmp.replace(path)
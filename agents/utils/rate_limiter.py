@@ -0,0 +1,38 @@
+import time
+import asyncio
+from typing import Optional
+
+class TokenBucket:
+    """
+    Async token-bucket rate limiter.
+    Allows bursts of up to `capacity` calls, refilling at `rate` tokens/sec.
+    A rate <= 0 disables limiting.
+    """
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock: Optional[asyncio.Lock] = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    async def acquire(self, tokens: float = 1.0):
+        """Wait until `tokens` are available, then consume them"""
+        if self.rate <= 0:
+            return
+
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        # Lock keeps waiters FIFO so a burst can't starve earlier callers
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
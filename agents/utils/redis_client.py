@@ -0,0 +1,38 @@
+import os
+from typing import Optional
+
+import redis.asyncio as aioredis
+
+from utils.logger import get_logger
+
+logger = get_logger("RedisClient")
+
+# Process-wide async Redis client.
+# All agent coroutines share one connection pool, so a blocking queue read
+# only parks its own connection and coroutine while event publishing and
+# DB I/O keep running on the same event loop.
+
+_client: Optional[aioredis.Redis] = None
+
+
+def get_redis() -> aioredis.Redis:
+    """Shared async client (connections are opened lazily on the running loop)"""
+    global _client
+    if _client is None:
+        # Client owns its pool, so aclose() also disconnects it
+        _client = aioredis.Redis(
+            host=os.getenv("REDIS_HOST", "localhost"),
+            port=int(os.getenv("REDIS_PORT", "6379")),
+            max_connections=int(os.getenv("REDIS_MAX_CONNECTIONS", "50")),
+            decode_responses=True
+        )
+    return _client
+
+
+async def close_redis():
+    """Close the shared client and its pool (call on shutdown)"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+        logger.info("Redis pool closed")
@@ -0,0 +1,188 @@
+import os
+import json
+import time
+import socket
+from typing import Any, Dict, List, NamedTuple, Optional
+
+import redis
+import redis.asyncio as aioredis
+
+from utils.logger import get_logger
+
+logger = get_logger("TaskQueue")
+
+# Agent task transport.
+#
+# "stream" mode (default) uses a Redis Stream per agent with a consumer group:
+# workers read in batches (XREADGROUP COUNT n), acknowledge after the task is
+# handled (XACK), and tasks left pending by a crashed worker are reclaimed by
+# a live one after TASK_CLAIM_IDLE_MS. Any number of workers can share a
+# group. Tasks that keep failing are moved to a dead-letter stream.
+#
+# A task still being worked on must never look stalled: consumers pass their
+# per-task timeout (task_timeout_s), claim_idle_ms is kept at least
+# CLAIM_IDLE_FACTOR times that timeout, and a serial consumer's default batch
+# is capped so the whole batch finishes inside the claim window.
+#
+# "list" mode keeps the original agent:task:<name> BLPOP lists (no acks).
+
+TASK_QUEUE_MODE = os.getenv("TASK_QUEUE_MODE", "stream")
+CLAIM_IDLE_FACTOR = 2
+
+
+class Task(NamedTuple):
+    id: Optional[str]
+    data: Dict[str, Any]
+
+
+def list_key(name: str) -> str:
+    return f"agent:task:{name}"
+
+
+def stream_key(name: str) -> str:
+    return f"agent:stream:{name}"
+
+
+class TaskQueue:
+    def __init__(self, redis_client: aioredis.Redis, name: str,
+                 group: Optional[str] = None,
+                 consumer: Optional[str] = None,
+                 mode: Optional[str] = None,
+                 batch_size: Optional[int] = None,
+                 block_ms: Optional[int] = None,
+                 claim_idle_ms: Optional[int] = None,
+                 max_deliveries: Optional[int] = None,
+                 task_timeout_s: Optional[float] = None):
+        self.redis = redis_client
+        self.name = name
+        self.mode = mode or TASK_QUEUE_MODE
+        if self.mode not in ("stream", "list"):
+            raise ValueError(f"Unknown task queue mode: {self.mode}")
+
+        self.group = group or name
+        self.consumer = consumer or f"{socket.gethostname()}-{os.getpid()}"
+        self.batch_size = batch_size or int(os.getenv("TASK_BATCH_SIZE", "10"))
+        # Short block so worker loops can notice shutdown
+        self.block_ms = block_ms if block_ms is not None else int(os.getenv("TASK_BLOCK_MS", "5000"))
+        self.claim_idle_ms = claim_idle_ms or int(os.getenv("TASK_CLAIM_IDLE_MS", "900000"))
+        self.max_deliveries = max_deliveries or int(os.getenv("TASK_MAX_DELIVERIES", "5"))
+        # Longest a consumer may spend on one task
+        self.task_timeout_s = task_timeout_s
+        if task_timeout_s:
+            min_idle_ms = int(task_timeout_s * 1000 * CLAIM_IDLE_FACTOR)
+            if self.claim_idle_ms < min_idle_ms:
+                # Otherwise a healthy worker's task is reclaimed just as its own timeout fires
+                logger.warning(
+                    f"{name}: claim idle {self.claim_idle_ms}ms is under {CLAIM_IDLE_FACTOR}x the "
+                    f"{task_timeout_s}s task timeout, using {min_idle_ms}ms"
+                )
+                self.claim_idle_ms = min_idle_ms
+        self.maxlen = int(os.getenv("TASK_STREAM_MAXLEN", "100000"))
+
+        self.key = stream_key(name) if self.mode == "stream" else list_key(name)
+        self.dead_key = f"agent:dead:{name}"
+        self._group_ready = False
+        self._next_claim = 0.0
+
+    async def ensure_group(self):
+        if self._group_ready or self.mode != "stream":
+            return
+        try:
+            await self.redis.xgroup_create(self.key, self.group, id="0", mkstream=True)
+        except redis.exceptions.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        self._group_ready = True
+
+    async def publish(self, data: Dict[str, Any]) -> Optional[str]:
+        payload = json.dumps(data)
+        if self.mode == "list":
+            await self.redis.rpush(self.key, payload)
+            return None
+        return await self.redis.xadd(self.key, {"payload": payload}, maxlen=self.maxlen, approximate=True)
+
+    async def read(self, count: Optional[int] = None) -> List[Task]:
+        """
+        Next batch of up to `count` tasks, reclaimed stalled ones first; empty
+        after block_ms with nothing queued. The default count is batch_size,
+        capped to what a serial consumer can finish within claim_idle_ms.
+        """
+        count = count or min(self.batch_size, self.serial_batch_limit())
+        if self.mode == "list":
+            popped = await self.redis.blpop(self.key, timeout=max(1, self.block_ms // 1000))
+            return [Task(None, json.loads(popped[1]))] if popped else []
+
+        await self.ensure_group()
+        tasks = await self._reclaim(count)
+        if tasks:
+            return tasks
+
+        response = await self.redis.xreadgroup(
+            self.group, self.consumer, {self.key: ">"},
+            count=count, block=self.block_ms or None
+        )
+        for _, messages in response or []:
+            tasks.extend(await self._decode(messages))
+        return tasks
+
+    def serial_batch_limit(self) -> int:
+        """Tasks one consumer can handle back to back before the last one becomes claimable"""
+        if not self.task_timeout_s:
+            return self.batch_size
+        # One task's worth of slack for the read/ack round trips
+        return max(1, int(self.claim_idle_ms / 1000 // self.task_timeout_s) - 1)
+
+    async def ack(self, *task_ids: Optional[str]):
+        ids = [i for i in task_ids if i is not None]
+        if ids and self.mode == "stream":
+            await self.redis.xack(self.key, self.group, *ids)
+
+    async def _reclaim(self, count: int) -> List[Task]:
+        """Take over tasks another (likely dead) consumer has held longer than claim_idle_ms"""
+        now = time.monotonic()
+        if now < self._next_claim:
+            return []
+        # Don't scan the pending list on every read
+        self._next_claim = now + self.claim_idle_ms / 1000 / 2
+
+        pending = await self.redis.xpending_range(
+            self.key, self.group, min="-", max="+",
+            count=count, idle=self.claim_idle_ms
+        )
+        if not pending:
+            return []
+
+        poisoned = [p["message_id"] for p in pending if p["times_delivered"] >= self.max_deliveries]
+        stalled = [p["message_id"] for p in pending if p["times_delivered"] < self.max_deliveries]
+
+        if poisoned:
+            for message_id, fields in await self.redis.xrange(self.key, min=poisoned[0], max=poisoned[-1]):
+                if message_id in poisoned:
+                    await self.redis.xadd(self.dead_key, fields, maxlen=self.maxlen, approximate=True)
+            await self.redis.xack(self.key, self.group, *poisoned)
+            logger.error(f"Moved {len(poisoned)} repeatedly failing tasks to {self.dead_key}")
+
+        if not stalled:
+            return []
+        claimed = await self.redis.xclaim(
+            self.key, self.group, self.consumer,
+            min_idle_time=self.claim_idle_ms, message_ids=stalled
+        )
+        tasks = await self._decode(claimed)
+        if tasks:
+            logger.warning(f"Reclaimed {len(tasks)} stalled tasks on {self.key}")
+        return tasks
+
+    async def _decode(self, messages) -> List[Task]:
+        tasks = []
+        for message_id, fields in messages:
+            if not fields:
+                # Entry trimmed/deleted while pending
+                await self.ack(message_id)
+                continue
+            try:
+                tasks.append(Task(message_id, json.loads(fields["payload"])))
+            except (KeyError, ValueError):
+                logger.error(f"Dropping malformed task {message_id} on {self.key}")
+                await self.ack(message_id)
+        return tasks
@@ -0,0 +1,12 @@
+-- Spatial indexes for disruption impact queries.
+-- Queries compare on geography (metres on the sphere), so the indexes are
+-- built on the same ::geography expressions to be usable by ST_DWithin.
+
+CREATE INDEX IF NOT EXISTS idx_active_shipments_location_geog
+    ON active_shipments USING GIST ((current_location::geography));
+
+CREATE INDEX IF NOT EXISTS idx_active_shipments_planned_route_geog
+    ON active_shipments USING GIST ((planned_route::geography));
+
+CREATE INDEX IF NOT EXISTS idx_disruption_events_location_geog
+    ON disruption_events USING GIST ((location::geography));
@@ -0,0 +1,9 @@
+-- Chunked, de-duplicated knowledge base ingestion.
+-- content_hash = sha256(source + chunk text); re-ingesting an unchanged
+-- chunk is a no-op (ON CONFLICT DO NOTHING) and skips re-embedding.
+
+ALTER TABLE knowledge_base ADD COLUMN IF NOT EXISTS content_hash CHAR(64);
+ALTER TABLE knowledge_base ADD COLUMN IF NOT EXISTS chunk_index INTEGER DEFAULT 0;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_knowledge_base_content_hash
+    ON knowledge_base (content_hash);
@@ -0,0 +1,8 @@
+-- Approximate nearest-neighbour index for knowledge_base retrieval.
+-- Cosine distance (<=>) matches RAGManager queries. HNSW needs no training
+-- data and stays current on insert; recall is tuned per query through
+-- hnsw.ef_search. RAGManager.ensure_index can switch to IVFFlat instead.
+
+CREATE INDEX IF NOT EXISTS idx_knowledge_base_embedding_hnsw
+    ON knowledge_base USING hnsw (embedding vector_cosine_ops)
+    WITH (m = 16, ef_construction = 64);
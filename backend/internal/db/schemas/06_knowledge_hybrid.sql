@@ -0,0 +1,15 @@
+-- Hybrid (full-text + vector) knowledge_base retrieval with metadata filters.
+-- content_tsv feeds the lexical side of RAGManager's reciprocal-rank fusion,
+-- so exact identifiers such as "2023/959" match even when embeddings blur them.
+
+ALTER TABLE knowledge_base ADD COLUMN IF NOT EXISTS jurisdiction VARCHAR(64);
+ALTER TABLE knowledge_base ADD COLUMN IF NOT EXISTS regulation VARCHAR(128);
+ALTER TABLE knowledge_base ADD COLUMN IF NOT EXISTS effective_date DATE;
+ALTER TABLE knowledge_base ADD COLUMN IF NOT EXISTS content_tsv tsvector
+    GENERATED ALWAYS AS (to_tsvector('english', coalesce(source, '') || ' ' || content)) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_knowledge_base_content_tsv
+    ON knowledge_base USING gin (content_tsv);
+
+CREATE INDEX IF NOT EXISTS idx_knowledge_base_filters
+    ON knowledge_base (jurisdiction, effective_date);
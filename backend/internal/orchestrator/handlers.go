@@ -3,7 +3,10 @@ package orchestrator
 import (
 	"context"
 	"encoding/json"
+	"os"
 	"time"
+
+	"github.com/redis/go-redis/v9"
 )
 
 func (o *Orchestrator) handleHighRiskEvent(ctx context.Context, event map[string]interface{}) {
@@ -71,8 +74,21 @@ func (o *Orchestrator) delegateToRoutePlanner(ctx context.Context, shipmentID st
 		return
 	}
 
-	queueName := "agent:task:route_planner"
-	err = o.redis.RPush(ctx, queueName, payload).Err()
+	// Stream mode (default) matches the agents' consumer-group workers;
+	// TASK_QUEUE_MODE=list keeps the legacy BLPOP list transport.
+	var queueName string
+	if os.Getenv("TASK_QUEUE_MODE") == "list" {
+		queueName = "agent:task:route_planner"
+		err = o.redis.RPush(ctx, queueName, payload).Err()
+	} else {
+		queueName = "agent:stream:route_planner"
+		err = o.redis.XAdd(ctx, &redis.XAddArgs{
+			Stream: queueName,
+			MaxLen: 100000,
+			Approx: true,
+			Values: map[string]interface{}{"payload": string(payload)},
+		}).Err()
+	}
 	if err != nil {
 		o.logger.Error("Failed to push task to Redis", "queue", queueName, "error", err)
 		return